@@ -1,9 +1,9 @@
 import asyncio
-import logging
 
 from bot.bot_run import bot_run
+from services.logging_service import setup_logging
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
+    setup_logging()
     asyncio.run(bot_run())
 
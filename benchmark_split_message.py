@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Замер нарезки markdown-ответа на сообщения Telegram (bot/gpt/utils.py):
+прежняя split_message против MarkdownSplitter - для готового текста, для стрима
+с периодическим показом хвоста и вместе с markdownify.
+
+Запуск из корня репозитория: python benchmark_split_message.py
+Размер ответа и число прогонов - ANSWER_SIZE, SHORT_ANSWER_SIZE, RUNS ниже.
+"""
+import random
+import time
+
+import telegramify_markdown
+
+from bot.gpt.utils import MarkdownSplitter, render_markdown, split_message, utf16_len, TELEGRAM_MESSAGE_LIMIT
+
+ANSWER_SIZE = 100 * 1024
+SHORT_ANSWER_SIZE = 3 * 1024
+RUNS = 5
+
+
+def legacy_split_message(message):
+    """Прежняя реализация (конкатенация строк на каждой строке ответа) - для сравнения"""
+    max_symbols = 3990
+    messages = []
+    current_message = ''
+    current_language = ''
+    in_code_block = False
+    lines = message.split('\n')
+
+    for line in lines:
+        is_code_block_line = line.startswith('```')
+        if is_code_block_line:
+            current_language = line[3:].strip()
+            in_code_block = not in_code_block
+
+        potential_message = (current_message + '\n' if current_message else '') + line
+
+        if len(potential_message) > max_symbols:
+            if in_code_block:
+                current_message += '\n```'
+
+            messages.append(current_message)
+
+            if in_code_block:
+                current_message = f'```{current_language}\n{line}'
+            else:
+                current_message = line
+        else:
+            current_message = potential_message
+
+    if current_message:
+        if in_code_block:
+            current_message += '\n```'
+        messages.append(current_message)
+
+    return messages
+
+
+def generate_answer(size: int) -> str:
+    random.seed(42)
+    words = ["модель", "ответ", "token", "**жирный**", "`code`", "😀", "данные", "function", "значение"]
+    lines = []
+    length = 0
+
+    while length < size:
+        if random.random() < 0.05:
+            block = ["```python"] + [f"    value_{i} = compute({i})  # 🚀" for i in range(random.randint(5, 40))] + ["```"]
+            lines.extend(block)
+            length += sum(len(line) + 1 for line in block)
+        else:
+            line = " ".join(random.choice(words) for _ in range(random.randint(3, 30)))
+            lines.append(line)
+            length += len(line) + 1
+
+    return "\n".join(lines)
+
+
+def measure(name, fn):
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        result = fn()
+    elapsed = (time.perf_counter() - started) / RUNS * 1000
+    print(f"{name:<45} {elapsed:8.2f} ms")
+    return result
+
+
+def stream_resplit_legacy(answer: str, chunk_size: int, render_every: int):
+    """Стрим без инкрементального сплиттера: весь накопленный текст режется заново при каждом показе"""
+    parts = []
+    for end in range(render_every, len(answer) + render_every, render_every):
+        parts = legacy_split_message(answer[:end])
+    return parts
+
+
+def stream_render_incremental(answer: str, chunk_size: int, render_every: int):
+    splitter = MarkdownSplitter()
+    next_render = render_every
+    for start in range(0, len(answer), chunk_size):
+        splitter.feed(answer[start:start + chunk_size])
+        if start >= next_render:
+            splitter.tail()
+            next_render += render_every
+    splitter.close()
+    return splitter.parts
+
+
+def stream_split(answer: str, chunk_size: int):
+    splitter = MarkdownSplitter()
+    for start in range(0, len(answer), chunk_size):
+        splitter.feed(answer[start:start + chunk_size])
+    splitter.close()
+    return splitter.parts
+
+
+if __name__ == "__main__":
+    answer = generate_answer(ANSWER_SIZE)
+    short_answer = generate_answer(SHORT_ANSWER_SIZE).replace("```", "")
+    print(f"Answer: {len(answer)} chars, {utf16_len(answer)} UTF-16 units\n")
+
+    measure("legacy split_message, one-message answer", lambda: legacy_split_message(short_answer))
+    measure("split_message, one-message answer", lambda: split_message(short_answer))
+
+    legacy_parts = measure("legacy split_message", lambda: legacy_split_message(answer))
+    parts = measure("split_message", lambda: split_message(answer))
+    streamed_parts = measure("MarkdownSplitter.feed (20-char chunks)", lambda: stream_split(answer, 20))
+    measure("stream, show every 500 chars: legacy re-split", lambda: stream_resplit_legacy(answer, 20, 500))
+    measure("stream, show every 500 chars: incremental", lambda: stream_render_incremental(answer, 20, 500))
+    measure("legacy split + markdownify", lambda: [telegramify_markdown.markdownify(p) for p in legacy_split_message(answer)])
+    measure("split_message + render_markdown", lambda: [render_markdown(p) for p in split_message(answer)])
+
+    assert parts == streamed_parts, "incremental splitting must match split_message"
+    assert all(part.count("```") % 2 == 0 for part in parts), "every part must have balanced code fences"
+    assert all(utf16_len(part) <= TELEGRAM_MESSAGE_LIMIT for part in parts), "every part must fit into a message"
+    assert "\n".join(parts).count("\n\n") == answer.count("\n\n"), "blank lines must survive the split"
+
+    print(f"\nParts: legacy={len(legacy_parts)}, new={len(parts)}")
+    print(f"Longest part: legacy={max(utf16_len(p) for p in legacy_parts)}, "
+          f"new={max(utf16_len(p) for p in parts)} UTF-16 units (limit {TELEGRAM_MESSAGE_LIMIT})")
@@ -1,2 +1,2 @@
-from bot.agreement.router import agreement_handler, agreementRouter
+from bot.agreement.router import agreement_handler, send_agreement_request, agreementRouter
 
@@ -15,32 +15,36 @@ class AgreementStatuses(Enum):
 
 
 async def agreement_handler(message: Message) -> bool:
-    is_agreement = agreementService.get_agreement_status(message.from_user.id)
+    is_agreement = await agreementService.get_agreement_status(message.from_user.id)
 
     if not is_agreement:
-        await message.answer(
-            text="📑 Вы ознакомлены и принимаете [пользовательское соглашение](https://grigoriy-grisha.github.io/chat_gpt_agreement/) и [политику конфиденциальности](https://grigoriy-grisha.github.io/chat_gpt_agreement/PrivacyPolicy)?",
-            reply_markup=InlineKeyboardMarkup(
-                resize_keyboard=True,
-                inline_keyboard=[
-                    [
-                        InlineKeyboardButton(text="Да ✅", callback_data=AgreementStatuses.ACCEPT_AGREEMENT.value),
-                        InlineKeyboardButton(text="Нет ❌", callback_data=AgreementStatuses.DECLINE_AGREEMENT.value)
-                    ],
-                ]
-            )
-        )
+        await send_agreement_request(message)
 
     return is_agreement
 
 
+async def send_agreement_request(message: Message):
+    await message.answer(
+        text="📑 Вы ознакомлены и принимаете [пользовательское соглашение](https://grigoriy-grisha.github.io/chat_gpt_agreement/) и [политику конфиденциальности](https://grigoriy-grisha.github.io/chat_gpt_agreement/PrivacyPolicy)?",
+        reply_markup=InlineKeyboardMarkup(
+            resize_keyboard=True,
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(text="Да ✅", callback_data=AgreementStatuses.ACCEPT_AGREEMENT.value),
+                    InlineKeyboardButton(text="Нет ❌", callback_data=AgreementStatuses.DECLINE_AGREEMENT.value)
+                ],
+            ]
+        )
+    )
+
+
 @agreementRouter.callback_query(
     TextCommandQuery([AgreementStatuses.ACCEPT_AGREEMENT.value, AgreementStatuses.DECLINE_AGREEMENT.value])
 )
 async def handle_change_system_message_query(callback_query: CallbackQuery):
     if callback_query.data == AgreementStatuses.ACCEPT_AGREEMENT.value:
         await callback_query.answer("Успешно! Спасибо! 🥰")
-        agreementService.set_agreement_status(callback_query.from_user.id, True)
+        await agreementService.set_agreement_status(callback_query.from_user.id, True)
         await callback_query.message.delete()
 
     if callback_query.data == AgreementStatuses.ACCEPT_AGREEMENT.value:
@@ -1,7 +1,8 @@
 import asyncio
+import logging
 import sys
 
-from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.telegram import TelegramAPIServer
@@ -9,6 +10,7 @@ from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
 import config
+from db import db_cache, storage_worker, generation_jobs
 from bot.agreement import agreementRouter
 from bot.api.router import apiRouter
 from bot.gpt import gptRouter
@@ -17,11 +19,18 @@ from bot.images import imagesRouter
 from bot.payment import paymentsRouter
 from bot.referral.router import referralRouter
 from bot.start import startRouter
+from bot.subscription import subscriptionRouter
 from bot.suno import sunoRouter
-from bot.tasks import taskRouter
+from bot.tasks import taskRouter, resume_generation_jobs
 from bot.diagnostics import diagnosticsRouter
+from bot.middlewares.MiddlewareAlbum import MiddlewareAlbum
+from bot.middlewares.MiddlewareLogContext import MiddlewareLogContext
+from bot.middlewares.MiddlewareRateLimit import MiddlewareRateLimit
+from bot.server import create_app, start_server
 from bot.transfer import transferRouter
-from services import init_adlean_service
+from services import init_adlean_service, transcriptionService
+from services.task_tracker import taskTracker
+from services.utils import init_http_pool, close_http_pool, get_http_pool_stats
 from services.user_sync_service import get_user_sync_service
 
 
@@ -30,6 +39,7 @@ def apply_routers(dp: Dispatcher) -> None:
     dp.include_router(sunoRouter)
     dp.include_router(startRouter)
     dp.include_router(diagnosticsRouter)
+    dp.include_router(subscriptionRouter)
     dp.include_router(referralRouter)
     dp.include_router(paymentsRouter)
     dp.include_router(apiRouter)
@@ -39,59 +49,9 @@ def apply_routers(dp: Dispatcher) -> None:
     dp.include_router(transferRouter)
     dp.include_router(gptRouter)
 
-# todo пофиксить
-class AlbumMiddleware(BaseMiddleware):
-    album_data = {}
-    batch_data = {}
-
-    async def __call__(self, handler, event, data):
-        if event.photo is None:
-            date = str(event.date)
-            print(date)
-
-            try:
-                self.batch_data[date].append(event)
-                return
-            except KeyError:
-                self.batch_data[date] = [event]
-
-            await asyncio.sleep(0.01)
-            event.model_config["is_last"] = True
-            data["batch_messages"] = self.batch_data[date]
-
-            result = await handler(event, data)
-
-            if event.model_config.get("is_last"):
-                del self.batch_data[date]
-
-            return result
-
-        if not event.media_group_id:
-            if event.photo is not None:
-                data["album"] = [event]
-
-            return await handler(event, data)
-
-        try:
-            self.album_data[event.media_group_id].append(event)
-            return
-        except KeyError:
-            self.album_data[event.media_group_id] = [event]
-
-        await asyncio.sleep(0.01)
-        event.model_config["is_last"] = True
-        data["album"] = self.album_data[event.media_group_id]
-
-        result = await handler(event, data)
-
-        if event.media_group_id and event.model_config.get("is_last"):
-            del self.album_data[event.media_group_id]
-
-        return result
-
 
 # Startup and shutdown hooks for webhook mode.
-async def on_startup(dp: Dispatcher):
+async def on_startup(bot: Bot, dispatcher: Dispatcher):
     print("Bot is starting...", flush=True)
     
     # Синхронизация данных пользователей из Telegram (если включено)
@@ -99,7 +59,7 @@ async def on_startup(dp: Dispatcher):
         try:
             print("🔄 Starting user data synchronization...", flush=True)
             sys.stdout.flush()
-            user_sync_service = get_user_sync_service(dp.bot)
+            user_sync_service = get_user_sync_service(bot)
             await user_sync_service.sync_all_users(max_concurrent=3)
             print("✅ User synchronization completed", flush=True)
             sys.stdout.flush()
@@ -112,16 +72,32 @@ async def on_startup(dp: Dispatcher):
         sys.stdout.flush()
     
     if config.WEBHOOK_ENABLED:
-        await dp.bot.set_webhook(config.WEBHOOK_URL)
+        await bot.set_webhook(config.WEBHOOK_URL, allowed_updates=dispatcher.resolve_used_update_types())
 
 
-async def on_shutdown(dp: Dispatcher):
+async def on_shutdown(bot: Bot):
     print("Bot is shutting down...")
     if config.WEBHOOK_ENABLED:
-        await dp.bot.delete_webhook()
+        await bot.delete_webhook()
 
 
 async def bot_run() -> None:
+    await init_http_pool()
+    db_flush_task = asyncio.create_task(db_cache.run_flush_loop())
+
+    try:
+        await run_dispatcher()
+    finally:
+        db_flush_task.cancel()
+        taskTracker.stop()
+        transcriptionService.stop()
+        await db_cache.flush()
+        await storage_worker.stop()
+        logging.info("HTTP pool stats: %s", get_http_pool_stats())
+        await close_http_pool()
+
+
+async def run_dispatcher() -> None:
     init_adlean_service(
         api_key=config.ADLEAN_API_KEY,
         api_url=config.ADLEAN_API_URL,
@@ -129,7 +105,8 @@ async def bot_run() -> None:
     )
     
     dp = Dispatcher(storage=MemoryStorage())
-    dp.message.middleware(AlbumMiddleware())
+    dp.update.outer_middleware(MiddlewareLogContext())
+    dp.message.middleware(MiddlewareAlbum())
     apply_routers(dp)
 
     # Initialize the bot based on the development flag.
@@ -147,17 +124,25 @@ async def bot_run() -> None:
             )
         )
 
+    bot.session.middleware(MiddlewareRateLimit())
+
+    # Генерации, которые ждали результата до перезапуска, досылаются в фоне.
+    # Сроки опросов сохраняются, чтобы после перезапуска не начинать расписание заново
+    taskTracker.add_schedule_listener(generation_jobs.reschedule)
+    resume_task = asyncio.create_task(resume_generation_jobs(bot))
+
     # Choose between webhook and polling modes.
     if config.WEBHOOK_ENABLED:
-        # Set webhook and start webhook mode.
-        await bot.set_webhook(config.WEBHOOK_URL)
-        await dp.start_webhook(
-            webhook_path=config.WEBHOOK_PATH,  # e.g., '/webhook'
-            on_startup=on_startup,
-            on_shutdown=on_shutdown,
-            host=config.WEBHOOK_HOST,          # e.g., '0.0.0.0'
-            port=config.WEBHOOK_PORT           # e.g., 3000
-        )
+        # Webhook Telegram и callbacks GoAPI обслуживает один aiohttp-сервер
+        dp.startup.register(on_startup)
+        dp.shutdown.register(on_shutdown)
+
+        runner = await start_server(create_app(dp, bot))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            resume_task.cancel()
+            await runner.cleanup()
     else:
         # Delete webhook if exists and start polling.
         await bot.delete_webhook()
@@ -181,8 +166,19 @@ async def bot_run() -> None:
             print("⏭️  User synchronization skipped (SYNC_ON_STARTUP=false)", flush=True)
             sys.stdout.flush()
         
-        await dp.start_polling(
-            bot,
-            skip_updates=False,
-            drop_pending_updates=True
-        )
\ No newline at end of file
+        # В режиме polling сервер нужен только для callbacks GoAPI и /metrics
+        runner = await start_server(create_app(dp, bot)) \
+            if config.GOAPI_WEBHOOK_ENABLED or config.METRICS_ENABLED else None
+
+        try:
+            await dp.start_polling(
+                bot,
+                skip_updates=False,
+                drop_pending_updates=True,
+                # chat_member приходит только если запросить его явно
+                allowed_updates=dp.resolve_used_update_types()
+            )
+        finally:
+            resume_task.cancel()
+            if runner is not None:
+                await runner.cleanup()
\ No newline at end of file
@@ -1,3 +1,5 @@
+import logging
+
 from aiogram.filters import BaseFilter
 from aiogram.types import Message, CallbackQuery
 from typing import Union, List  # Добавьте импорт
@@ -12,9 +14,10 @@ class CompositeFilters(BaseFilter):
 
     async def __call__(self, message: Message) -> bool:
         for Filter in self.filters:
-            print(message)
-            print(await Filter(message))
-            if not await Filter(message):
+            # Фильтр вызывается один раз: он может ходить в хранилище состояний
+            passed = await Filter(message)
+            logging.debug("%s -> %s for message %s", type(Filter).__name__, passed, message.message_id)
+            if not passed:
                 return False
 
         return True
@@ -105,5 +108,5 @@ class StateCommand(BaseFilter):
         self.state: StateTypes = state
 
     async def __call__(self, message: Message) -> bool:
-        return stateService.get_current_state(message.from_user.id).value == self.state.value
+        return (await stateService.get_current_state(message.from_user.id)).value == self.state.value
 
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.metrics import metrics
+
+# (название, фабрика корутины, проверка результата или None, если этап не может "не пройти")
+PreflightStage = Tuple[str, Callable[[], Awaitable[Any]], Optional[Callable[[Any], bool]]]
+
+
+@dataclass
+class PreflightResult:
+    failed_stage: Optional[str] = None
+    values: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    errors: Dict[str, BaseException] = field(default_factory=dict)
+
+    @property
+    def passed(self) -> bool:
+        return self.failed_stage is None
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        """Исключение, из-за которого не прошел этап (None, если он просто не прошел проверку)"""
+        return self.errors.get(self.failed_stage)
+
+    def format_timings(self) -> str:
+        return " ".join(f"{name}={duration:.0f}ms" for name, duration in self.timings.items())
+
+
+async def run_preflight(stages: List[PreflightStage], result: Optional[PreflightResult] = None) -> PreflightResult:
+    """
+    Запустить независимые проверки одновременно. Порядок в списке - приоритет:
+    если проверка не прошла (или этап упал с исключением), более поздние отменяются,
+    а более ранние дожидаются, чтобы пользователь увидел ту же причину отказа,
+    что и при последовательных проверках. Результат можно дополнить следующей группой этапов.
+    """
+    result = result if result is not None else PreflightResult()
+
+    async def timed(name: str, factory: Callable[[], Awaitable[Any]]):
+        # Каждый этап - от его собственного старта, а не от начала всех проверок
+        started = time.perf_counter()
+        value = await factory()
+        elapsed = time.perf_counter() - started
+        result.timings[name] = elapsed * 1000
+        metrics.observe(name, elapsed)
+        return value
+
+    tasks = [asyncio.ensure_future(timed(name, factory)) for name, factory, _ in stages]
+    index_of = {task: index for index, task in enumerate(tasks)}
+    pending = set(tasks)
+    failed_index = None
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                index = index_of[task]
+                name, _, check = stages[index]
+
+                if task.exception() is not None:
+                    result.errors[name] = task.exception()
+                    failed_index = index if failed_index is None else min(failed_index, index)
+                    continue
+
+                value = task.result()
+                result.values[name] = value
+
+                if check is not None and not check(value):
+                    failed_index = index if failed_index is None else min(failed_index, index)
+
+            if failed_index is None:
+                continue
+
+            for task in [task for task in pending if index_of[task] > failed_index]:
+                task.cancel()
+                pending.discard(task)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if failed_index is not None:
+        result.failed_stage = stages[failed_index][0]
+
+    return result
@@ -3,19 +3,16 @@ import io
 import json
 import logging
 import os
+import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from tempfile import NamedTemporaryFile
 
-import aiofiles
 from aiogram import Router
 from aiogram import types
 from aiogram.types import BufferedInputFile, FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.types import Message, CallbackQuery
-from openai import OpenAI
 
-from bot.agreement import agreement_handler
+from bot.agreement import agreement_handler, send_agreement_request
 from bot.filters import TextCommand, Document, Photo, TextCommandQuery, Voice, Audio, StateCommand, StartWithQuery, \
     Video
 from bot.gpt import change_model_command
@@ -23,19 +20,23 @@ from bot.commands import change_system_message_command, change_system_message_te
     balance_text, balance_command, clear_command, clear_text, get_history_command, get_history_text
 from bot.gpt.system_messages import get_system_message, system_messages_list, \
     create_system_message_keyboard
-from bot.gpt.utils import is_chat_member, send_markdown_message, get_tokens_message, \
-    create_change_model_keyboard, checked_text
+from bot.gpt.preflight import run_preflight
+from bot.gpt.streaming import MessageStreamer
+from bot.gpt.utils import is_chat_member, check_subscription, send_subscribe_message, send_markdown_message, \
+    get_tokens_message, create_change_model_keyboard, checked_text
 from bot.utils import include
-from bot.utils import send_photo_as_file
+from bot.utils import send_photo_as_file, download_text, relay_photo
 from bot.constants import DIALOG_CONTEXT_CLEAR_FAILED_DEFAULT_ERROR_MESSAGE
 import config
-from config import TOKEN, GO_API_KEY, PROXY_URL
+from config import TOKEN, GO_API_KEY
 from services import gptService, GPTModels, completionsService, tokenizeService, referralsService, stateService, \
-    StateTypes, systemMessage
+    StateTypes, systemMessage, agreementService, transcriptionService
 from services import get_adlean_service
 from services.gpt_service import SystemMessages
 from services.image_utils import format_image_from_request
-from services.utils import async_post, async_get
+from services.logging_service import LazyJson
+from services.metrics import metrics
+from services.utils import async_post
 
 gptRouter = Router()
 
@@ -84,34 +85,50 @@ def detect_model(model: str):
 
 async def handle_gpt_request(message: Message, text: str):
     user_id = message.from_user.id
-    message_loading = await message.answer("**⌛️Ожидайте ответ...**")
+    started = time.perf_counter()
+    with metrics.span("telegram_send"):
+        message_loading = await message.answer("**⌛️Ожидайте ответ...**")
 
     try:
-        is_agreement = await agreement_handler(message)
+        chat_id = message.chat.id
 
-        if not is_agreement:
+        # Независимые проверки идут одновременно, время до запроса - примерно время самой долгой из них.
+        # Сначала только чтения: этапы второй группы пишут (get_tokens может создать баланс,
+        # get_current_model - сохранить модель по умолчанию) и запускаются, лишь когда пользователь прошел проверки
+        preflight = await run_preflight([
+            ("agreement", lambda: agreementService.get_agreement_status(user_id), bool),
+            ("subscription", lambda: check_subscription(message), bool),
+            ("state", lambda: stateService.is_default_state(user_id), bool),
+        ])
+
+        if preflight.passed:
+            preflight = await run_preflight([
+                ("tokens", lambda: tokenizeService.get_tokens(user_id), lambda tokens: tokens.get("tokens", 0) > 0),
+                ("settings", lambda: asyncio.gather(
+                    gptService.get_current_model(user_id),
+                    gptService.get_mapping_gpt_model(user_id),
+                    gptService.get_current_system_message(user_id),
+                ), None),
+                ("chat_action", lambda: message.bot.send_chat_action(chat_id, "typing"), None),
+            ], preflight)
+
+        logging.info("[Preflight] %s", preflight.format_timings())
+
+        if preflight.error is not None:
+            raise preflight.error
+
+        if preflight.failed_stage == "agreement":
+            await send_agreement_request(message)
             return
 
-        is_subscribe = await is_chat_member(message)
-
-        if not is_subscribe:
-            return
-        
-        if not stateService.is_default_state(user_id):
+        if preflight.failed_stage == "subscription":
+            await send_subscribe_message(message)
             return
 
-        chat_id = message.chat.id
-
-        bot_model = gptService.get_current_model(user_id)
-        gpt_model = gptService.get_mapping_gpt_model(user_id)
-
-        await message.bot.send_chat_action(chat_id, "typing")
-
-        system_message = gptService.get_current_system_message(user_id)
-
-        gpt_tokens_before = await tokenizeService.get_tokens(user_id)
+        if preflight.failed_stage == "state":
+            return
 
-        if gpt_tokens_before.get("tokens", 0) <= 0:
+        if preflight.failed_stage == "tokens":
             await message.answer(
                 text=f"""
 У вас не хватает *⚡️*. 😔
@@ -122,41 +139,51 @@ async def handle_gpt_request(message: Message, text: str):
 /model - 🛠️ Сменить модель
 """)
             return
+
+        gpt_tokens_before = preflight.values["tokens"]
+        bot_model, gpt_model, system_message = preflight.values["settings"]
+
         system_message = get_system_message(system_message)
         if system_message == "question-answer":
             questionAnswer = True
         else:
             questionAnswer = False
 
-        answer = await completionsService.query_chatgpt(
-            user_id,
-            text,
-            system_message,
-            gpt_model,
-            bot_model,
-            questionAnswer,
-        )
+        streamer = MessageStreamer(message_loading) if config.GPT_STREAMING_ENABLED else None
+
+        if streamer is not None:
+            answer = await completionsService.query_chatgpt_stream(
+                user_id,
+                text,
+                system_message,
+                gpt_model,
+                bot_model,
+                questionAnswer,
+                streamer.on_delta,
+            )
+        else:
+            answer = await completionsService.query_chatgpt(
+                user_id,
+                text,
+                system_message,
+                gpt_model,
+                bot_model,
+                questionAnswer,
+            )
 
-        print(json.dumps(answer, indent=4))
+        logging.debug("GPT answer: %s", LazyJson(answer))
 
         requested_gpt_model = gpt_model
-
-        print(requested_gpt_model, 'requested_gpt_model')
-
         detected_requested_gpt_model = detect_model(requested_gpt_model)
-
-        print(detected_requested_gpt_model, 'detected_requested_gpt_model')
-
         responded_gpt_model = answer.get("model")
-
-        print(responded_gpt_model, 'responded_gpt_model')
-
         detected_responded_gpt_model = detect_model(responded_gpt_model)
 
-        print(detected_responded_gpt_model, 'detected_responded_gpt_model')
+        logging.info("GPT model requested=%s (%s) responded=%s (%s)", requested_gpt_model,
+                     detected_requested_gpt_model, responded_gpt_model, detected_responded_gpt_model)
 
         if not answer.get("success"):
             if answer.get('response') == "Ошибка 😔: Превышен лимит использования токенов.":
+                tokenizeService.invalidate_tokens(user_id)
                 await message.answer(
                     text=f"""
 У вас не хватает *⚡️*. 😔
@@ -168,49 +195,46 @@ async def handle_gpt_request(message: Message, text: str):
 """,
                 )
                 await asyncio.sleep(0.5)
+                if streamer is not None:
+                    await streamer.abort()
                 await message_loading.delete()
 
                 return
 
             await message.answer(answer.get('response'))
             await asyncio.sleep(0.5)
+            if streamer is not None:
+                await streamer.abort()
             await message_loading.delete()
 
             return
         
         # ========== AdLean Integration ==========
-        print(f"[AdLean] Starting ad integration for user {user_id}")
-        
         # Увеличиваем счетчик запросов пользователя
         try:
-            requests_count = tokenizeService.increment_requests_count(user_id)
-            print(f"[AdLean] User {user_id} requests count = {requests_count}")
+            requests_count = await tokenizeService.increment_requests_count(user_id)
         except Exception as e:
-            print(f"[AdLean] ERROR in increment_requests_count: {e}")
+            logging.error("[AdLean] increment_requests_count failed: %s", e)
             requests_count = 1
         
         # Получаем ответ от GPT
         gpt_response = answer.get("response")
-        print(f"[AdLean] GPT response length = {len(gpt_response)} chars")
         
         # Проверяем, нужно ли запрашивать рекламу
         ad_response = {"have_ads": False, "content": ""}
         
-        print(f"[AdLean] Config - ENABLED: {config.ADLEAN_ENABLED}, threshold: {config.ADLEAN_SHOW_AFTER_N_REQUESTS}")
-        print(f"[AdLean] Requests count: {requests_count}")
         should_show_ad = config.ADLEAN_ENABLED and requests_count >= config.ADLEAN_SHOW_AFTER_N_REQUESTS
-        print(f"[AdLean] Should show ad = {should_show_ad}")
+        logging.debug("[AdLean] enabled=%s requests_count=%s threshold=%s response_length=%s", config.ADLEAN_ENABLED,
+                      requests_count, config.ADLEAN_SHOW_AFTER_N_REQUESTS, len(gpt_response))
         
         if should_show_ad:
-            print(f"[AdLean] Requesting ad from AdLean API...")
             try:
                 # Получаем текущий экземпляр сервиса
                 service = get_adlean_service()
                 if service is None:
-                    print(f"[AdLean] ERROR: Service not initialized!")
+                    logging.error("[AdLean] Service not initialized")
                     ad_response = {"have_ads": False, "content": ""}
                 else:
-                    print(f"[AdLean] Service instance retrieved successfully")
                     # ВАЖНО: Отправляем ОТВЕТ GPT (gpt_response), а не запрос пользователя!
                     ad_response = await service.get_ad(
                         user_id=str(user_id),
@@ -222,44 +246,46 @@ async def handle_gpt_request(message: Message, text: str):
                         },
                         role="assistant"  # ← ВАЖНО: роль "assistant" для ответа GPT
                     )
-                    content_length = len(ad_response.get('content', '')) if isinstance(ad_response.get('content'), str) else 0
-                    print(f"[AdLean] API Response: have_ads={ad_response.get('have_ads')}, content_length={content_length}")
             except Exception as e:
-                print(f"[AdLean] ERROR calling API: {e}")
-                import traceback
-                traceback.print_exc()
+                logging.exception("[AdLean] API call failed: %s", e)
                 ad_response = {"have_ads": False, "content": ""}
-        else:
-            print(f"[AdLean] Ad NOT requested (conditions not met)")
         
         # Формируем финальный ответ: реклама + GPT ответ
         if ad_response.get("have_ads") and ad_response.get("content"):
             final_response = f"{ad_response['content']}\n\n{gpt_response}"
-            print(f"[AdLean] ✅ Ad SHOWN to user {user_id}")
+            logging.info("[AdLean] Ad shown")
             # Сбрасываем счетчик после показа рекламы
-            tokenizeService.reset_requests_count(user_id)
+            await tokenizeService.reset_requests_count(user_id)
         else:
             final_response = gpt_response
-            print(f"[AdLean] ❌ Ad NOT shown (no ad content)")
         
-        print(f"[AdLean] Integration complete for user {user_id}")
         # ========== Конец интеграции AdLean ==========
 
-        gpt_tokens_after = await tokenizeService.get_tokens(user_id)
+        if answer.get("balance") is not None:
+            gpt_tokens_after = tokenizeService.remember_balance(user_id, answer["balance"])
+        else:
+            with metrics.span("tokens_after"):
+                gpt_tokens_after = await tokenizeService.get_tokens(user_id, fresh=True)
 
         format_text = format_image_from_request(final_response)
         image = format_text["image"]
 
-        messages = await send_markdown_message(message, format_text["text"])
+        with metrics.span("answer_send"):
+            if streamer is not None:
+                # Сообщение "Ожидайте ответ..." уже стало первой частью ответа
+                messages = await streamer.finish(format_text["text"])
+            else:
+                messages = await send_markdown_message(message, format_text["text"])
 
         if len(messages) > 1:
             await answer_markdown_file(message, format_text["text"])
 
         if image is not None:
-            await message.answer_photo(image)
+            await relay_photo(message, image)
             await send_photo_as_file(message, image, "Вот картинка в оригинальном качестве")
-        await asyncio.sleep(0.5)
-        await message_loading.delete()
+        if streamer is None:
+            await asyncio.sleep(0.5)
+            await message_loading.delete()
         tokens_message_text = get_tokens_message(
             gpt_tokens_before.get("tokens", 0) - gpt_tokens_after.get("tokens", 0), 
             gpt_tokens_after.get("tokens", 0), 
@@ -267,11 +293,12 @@ async def handle_gpt_request(message: Message, text: str):
             detected_responded_gpt_model
         )
         token_message = await message.answer(tokens_message_text)
+        metrics.observe("gpt_request", time.perf_counter() - started, gpt_model)
         if message.chat.type in ['group', 'supergroup']:
             await asyncio.sleep(2)
             await token_message.delete()
     except Exception as e:
-        print(e)
+        logging.exception("GPT request failed: %s", e)
 
 
 async def get_photos_links(message, photos):
@@ -287,10 +314,10 @@ async def get_photos_links(message, photos):
 
 @gptRouter.message(Video())
 async def handle_image(message: Message):
-    print(message.video)
+    logging.debug("Video received: %s", message.video)
 
 
-@gptRouter.message(Photo())
+@gptRouter.message(Photo(), flags={"batch": "album"})
 async def handle_image(message: Message, album):
     if message.chat.type in ['group', 'supergroup']:
         if message.entities is None:
@@ -315,7 +342,7 @@ async def handle_image(message: Message, album):
 
     user_id = message.from_user.id
 
-    if not stateService.is_default_state(user_id):
+    if not await stateService.is_default_state(user_id):
         return
 
     tokens = await tokenizeService.get_tokens(user_id)
@@ -327,7 +354,7 @@ async def handle_image(message: Message, album):
 /buy - 💎 Пополнить баланс
 /referral - 👥 Пригласить друга, чтобы получить больше *⚡️*!       
 """)
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
         return
 
     is_subscribe = await is_chat_member(message)
@@ -346,37 +373,6 @@ async def handle_image(message: Message, album):
     await handle_gpt_request(message, content)
 
 
-async def transcribe_voice_sync(user_id: str, voice_file_url: str):
-    token = await tokenizeService.get_token(user_id)
-
-    voice_response = await async_get(voice_file_url)
-    if voice_response.status_code == 200:
-        voice_data = voice_response.content
-
-        client = OpenAI(
-            api_key=token["id"],
-            base_url=f"{PROXY_URL}/v1/"
-        )
-
-        transcription = client.audio.transcriptions.create(file=('audio.ogg', voice_data, 'audio/ogg'),
-                                                           model="whisper-1", language="ru")
-
-        print(transcription.duration)
-        print( transcription.text)
-        return {"success": True, "text": transcription.text, 'energy': int(transcription.duration*15)}
-    else:
-        return {"success": False, "text": f"Error: Голосовое сообщение не распознано"}
-
-
-executor = ThreadPoolExecutor()
-
-
-async def transcribe_voice(user_id: int, voice_file_url: str):
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(executor, transcribe_voice_sync, user_id, voice_file_url)
-    return await response
-
-
 @gptRouter.message(Voice())
 @gptRouter.message(Audio())
 async def handle_voice(message: Message):
@@ -389,7 +385,7 @@ async def handle_voice(message: Message):
         
     user_id = message.from_user.id
 
-    if not stateService.is_default_state(user_id):
+    if not await stateService.is_default_state(user_id):
         return
         
     tokens = await tokenizeService.get_tokens(user_id)
@@ -401,7 +397,7 @@ async def handle_voice(message: Message):
 /buy - 💎 Пополнить баланс
 /referral - 👥 Пригласить друга, чтобы получить больше *⚡️*!       
 """)
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
         return
 
     is_subscribe = await is_chat_member(message)
@@ -417,11 +413,18 @@ async def handle_voice(message: Message):
 
 
     duration = messageData.duration
-    voice_file_id = messageData.file_id
-    file = await message.bot.get_file(voice_file_id)
-    file_url = f"https://api.telegram.org/file/bot{TOKEN}/{file.file_path}"
+    energy = transcriptionService.estimate_energy(duration)
 
-    response_json = await transcribe_voice(message.from_user.id, file_url)
+    if tokens.get("tokens") < energy:
+        await message.answer(f"""
+У вас не хватает *⚡️* для обработки аудио: нужно примерно `{energy}`⚡️. 😔
+
+/balance - ✨ Проверить Баланс
+/buy - 💎 Пополнить баланс
+""")
+        return
+
+    response_json = await transcriptionService.transcribe(user_id, message.bot, messageData.file_id, duration)
 
     if response_json.get("success"):
         await message.answer(f"""
@@ -431,9 +434,8 @@ async def handle_voice(message: Message):
 """)
 
         
-        current_state = stateService.get_current_state(message.from_user.id) 
-        print(current_state, 'current_state')
-        print(StateTypes.Transcribe, 'StateTypes.TranscribeStateTypes.Transcribe')
+        current_state = await stateService.get_current_state(message.from_user.id) 
+        logging.debug("Voice transcribed, current state: %s", current_state)
         if current_state == StateTypes.Transcribe:  
             await message.reply(response_json.get('text'))  
             return
@@ -454,12 +456,9 @@ async def handle_document(message: Message):
     try:
         user_document = message.document if message.document else None
         if user_document:
-            with NamedTemporaryFile(delete=False) as temp_file:
-                await message.bot.download(user_document, temp_file.name)
-            async with aiofiles.open(temp_file.name, 'r', encoding='utf-8') as file:
-                text = await file.read()
-                caption = message.caption if message.caption is not None else ""
-                await handle_gpt_request(message, f"{caption}\n{text}")
+            text = await download_text(message.bot, user_document)
+            caption = message.caption if message.caption is not None else ""
+            await handle_gpt_request(message, f"{caption}\n{text}")
     except UnicodeDecodeError as e:
         await message.answer("""😔 К сожалению, данный тип файлов не поддерживается!
             
@@ -471,13 +470,9 @@ async def handle_document(message: Message):
 
 async def process_document(document, bot):
     try:
-        with NamedTemporaryFile(delete=False) as temp_file:
-            await bot.download(document, temp_file.name)
-        async with aiofiles.open(temp_file.name, 'r', encoding='utf-8') as file:
-            text = await file.read()
-        return text
+        return await download_text(bot, document)
     except UnicodeDecodeError as e:
-        raise UnicodeDecodeError(f"UnicodeDecodeError: failed to read file '{document.file_name}' - {e}")
+        raise ValueError(f"UnicodeDecodeError: failed to read file '{document.file_name}' - {e}")
     except Exception as e:
         raise Exception(f"Error: failed to process file '{document.file_name}' - {e}")
 
@@ -534,7 +529,7 @@ async def handle_document(message: Message):
 
 @gptRouter.message(TextCommand([balance_text(), balance_command()]))
 async def handle_balance(message: Message):
-    gpt_tokens = await tokenizeService.get_tokens(message.from_user.id)
+    gpt_tokens = await tokenizeService.get_tokens(message.from_user.id, fresh=True)
 
     referral = await referralsService.get_referral(message.from_user.id)
     last_update = datetime.fromisoformat(referral["lastUpdate"].replace('Z', '+00:00'))
@@ -607,12 +602,12 @@ async def handle_change_model(message: Message):
 
     user_id = message.from_user.id
 
-    current_system_message = gptService.get_current_system_message(user_id)
-    print(current_system_message, 'current_system_message')
+    current_system_message = await gptService.get_current_system_message(user_id)
+    logging.debug("Current system message: %s", current_system_message)
 
     if not include(system_messages_list, current_system_message):
         current_system_message = SystemMessages.Custom.value
-        gptService.set_current_system_message(user_id, current_system_message)
+        await gptService.set_current_system_message(user_id, current_system_message)
 
     await message.answer(
         text="Установи режим работы бота: ⚙️",
@@ -634,7 +629,7 @@ async def handle_change_model(message: Message):
     if not is_subscribe:
         return
 
-    current_model = gptService.get_current_model(message.from_user.id)
+    current_model = await gptService.get_current_model(message.from_user.id)
 
     text = """
 Выберите модель: 🤖  
@@ -674,13 +669,13 @@ async def handle_change_model(message: Message):
 async def edit_system_message(message: Message):
     user_id = message.from_user.id
 
-    print('SystemMessageEditingSystemMessageEditingSystemMessageEditing')
+    logging.debug("Custom system message set by user %s", user_id)
 
-    gptService.set_current_system_message(user_id, message.text)
+    await gptService.set_current_system_message(user_id, message.text)
    
     await systemMessage.edit_system_message(user_id, message.text)
 
-    stateService.set_current_state(user_id, StateTypes.Default)
+    await stateService.set_current_state(user_id, StateTypes.Default)
 
     await asyncio.sleep(0.5)
 
@@ -695,8 +690,8 @@ async def cancel_state(callback_query: CallbackQuery):
 
     user_id = callback_query.from_user.id
 
-    gptService.set_current_system_message(user_id, system_message)
-    stateService.set_current_state(user_id, StateTypes.Default)
+    await gptService.set_current_system_message(user_id, system_message)
+    await stateService.set_current_state(user_id, StateTypes.Default)
 
     await callback_query.message.delete()
     await callback_query.answer("Успешно отменено!")
@@ -707,14 +702,14 @@ async def handle_change_system_message_query(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
 
     system_message = callback_query.data
-    current_system_message = gptService.get_current_system_message(user_id)
+    current_system_message = await gptService.get_current_system_message(user_id)
 
     if (system_message == current_system_message and system_message != SystemMessages.Custom.value):
         await callback_query.answer(f"Данный режим уже выбран!")
         return
 
     if system_message == SystemMessages.Custom.value:
-        stateService.set_current_state(user_id, StateTypes.SystemMessageEditing)
+        await stateService.set_current_state(user_id, StateTypes.SystemMessageEditing)
 
         await callback_query.message.answer("Напишите ваше системное сообщение", reply_markup=InlineKeyboardMarkup(
             resize_keyboard=True,
@@ -725,17 +720,17 @@ async def handle_change_system_message_query(callback_query: CallbackQuery):
         ))
 
     if system_message == SystemMessages.Transcribe.value:   
-        stateService.set_current_state(user_id, StateTypes.Transcribe)
+        await stateService.set_current_state(user_id, StateTypes.Transcribe)
 
         await callback_query.message.answer("Режим 'Голос в Текст' включен. Бот будет транскрибировать все следующие аудио") 
 
     
-    print('handle_change_system_message_query', 'system_message', system_message)
+    logging.debug("System message change to %s", system_message)
 
-    gptService.set_current_system_message(user_id, system_message)
+    await gptService.set_current_system_message(user_id, system_message)
 
     if system_message != SystemMessages.Transcribe.value and system_message != SystemMessages.Custom.value: 
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
 
     await callback_query.message.edit_reply_markup(
         reply_markup=create_system_message_keyboard(system_message)
@@ -755,21 +750,16 @@ async def handle_change_system_message_query(callback_query: CallbackQuery):
 async def handle_change_model_query(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
 
-    print('handle_change_model_query', 'callback_query.data', callback_query.data)
-
     gpt_model = GPTModels(callback_query.data)
+    current_gpt_model = await gptService.get_current_model(user_id)
 
-    print('handle_change_model_query', 'gpt_model', gpt_model)
-
-    current_gpt_model = gptService.get_current_model(user_id)
-
-    print('handle_change_model_query', 'current_gpt_model', current_gpt_model)
+    logging.debug("Model change from %s to %s", current_gpt_model, gpt_model)
 
     if gpt_model.value == current_gpt_model.value:
         await callback_query.answer(f"Модель {current_gpt_model.value} уже выбрана!")
         return
 
-    gptService.set_current_model(user_id, gpt_model)
+    await gptService.set_current_model(user_id, gpt_model)
 
     await callback_query.message.edit_reply_markup(
         reply_markup=create_change_model_keyboard(gpt_model)
@@ -817,13 +807,13 @@ async def handle_get_history(message: types.Message):
 
 
 
-@gptRouter.message(TextCommand(["/bot", "/bot@DeepGPTBot"]))  # Укажите все возможные варианты
+@gptRouter.message(TextCommand(["/bot", "/bot@DeepGPTBot"]), flags={"batch": "text"})  # Укажите все возможные варианты
 async def handle_bot_command(message: Message, batch_messages):
     # Логирование для отладки
-    print(f"Command received: {message.text}")
+    logging.debug("Command received: %s", message.text)
     
-    # Собираем текст только из текущего сообщения (если batch не нужен)
-    text = message.text or ""
+    # Длинный текст после /bot Telegram мог разрезать на несколько сообщений
+    text = "\n".join(item.text for item in batch_messages if item.text)
     
     # Добавляем текст из сообщения, на которое ответили
     if message.reply_to_message and message.reply_to_message.text:
@@ -832,7 +822,7 @@ async def handle_bot_command(message: Message, batch_messages):
     await handle_gpt_request(message, text)
 
 
-@gptRouter.message()
+@gptRouter.message(flags={"batch": "text"})
 async def handle_completion(message: Message, batch_messages):
     if message.chat.type in ['group', 'supergroup']:
         # Проверяем наличие упоминаний
@@ -850,10 +840,13 @@ async def handle_completion(message: Message, batch_messages):
         if not mentioned:
             return
 
-    # Обработка текста
-    text = ''
-    for message in batch_messages:
-        text = text + message.text + "\n"
+    # Обработка текста (стикеры и другие сообщения без текста сюда тоже попадают)
+    texts = [item.text for item in batch_messages if item.text]
+    if not texts:
+        return
+
+    message = batch_messages[-1]
+    text = "\n".join(texts) + "\n"
     text = f" {text}\n\n {message.reply_to_message.text}" if message.reply_to_message else text
 
     await handle_gpt_request(message, text)
\ No newline at end of file
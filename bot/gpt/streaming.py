@@ -0,0 +1,138 @@
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+import config
+from bot.gpt.utils import MarkdownSplitter, render_markdown, split_message
+from services.completions_service import ReasoningFilter
+
+STREAM_CURSOR = " ▌"
+
+
+class MessageStreamer:
+    """
+    Показывает ответ модели по мере генерации: редактирует сообщение "Ожидайте ответ..."
+    не чаще раза в edit_interval секунд, а когда текст перестает помещаться
+    (граница split_message), продолжает в новом сообщении.
+    """
+
+    def __init__(self, message_loading: Message, edit_interval: float = config.GPT_STREAM_EDIT_INTERVAL):
+        self.messages = [message_loading]
+        # Что сейчас показано в каждом сообщении: (текст, markdown)
+        self.rendered: List[Optional[Tuple[str, bool]]] = [None]
+        self.reasoning = ReasoningFilter()
+        self.splitter = MarkdownSplitter()
+        self.edit_interval = edit_interval
+        self.next_edit_at = 0.0
+
+    async def on_delta(self, delta: str):
+        visible = self.reasoning.feed(delta)
+        if visible:
+            self.splitter.feed(visible)
+
+        if time.monotonic() < self.next_edit_at:
+            return
+
+        # Готовые части уже не меняются, заново собирается только хвост
+        tail = self.splitter.tail()
+        parts = self.splitter.parts + [tail] if tail.strip() else list(self.splitter.parts)
+
+        if parts:
+            await self._show(parts, finished_count=len(self.splitter.parts))
+            self.next_edit_at = max(self.next_edit_at, time.monotonic() + self.edit_interval)
+
+    async def finish(self, text: str) -> List[str]:
+        """Показать окончательный текст (с markdown) и вернуть части, как send_markdown_message"""
+        parts = split_message(text)
+        await self._show(parts, finished_count=len(parts))
+
+        if not parts:
+            await self.abort()
+            await self._delete(self.messages[0])
+            return parts
+
+        # Окончательный текст может оказаться короче показанного (например, без <think>)
+        for extra_message in self.messages[max(len(parts), 1):]:
+            await self._delete(extra_message)
+        del self.messages[max(len(parts), 1):]
+        del self.rendered[max(len(parts), 1):]
+
+        return parts
+
+    async def abort(self):
+        """Удалить сообщения-продолжения (первое сообщение удаляет сам обработчик)"""
+        for extra_message in self.messages[1:]:
+            await self._delete(extra_message)
+        del self.messages[1:]
+        del self.rendered[1:]
+
+    async def _show(self, parts: List[str], finished_count: int):
+        for index, part in enumerate(parts):
+            # Готовые части уже не изменятся - их можно показывать с разметкой
+            shown = (part, True) if index < finished_count else (part + STREAM_CURSOR, False)
+
+            if index < len(self.messages):
+                if not await self._edit(index, *shown):
+                    return
+            elif not await self._send(*shown):
+                return
+
+    async def _edit(self, index: int, text: str, markdown: bool) -> bool:
+        if self.rendered[index] == (text, markdown):
+            return True
+
+        message = self.messages[index]
+
+        try:
+            rendered = render_markdown(text) if markdown else None
+            if rendered is not None:
+                try:
+                    await message.edit_text(rendered, parse_mode=ParseMode.MARKDOWN_V2)
+                except TelegramBadRequest as e:
+                    if "message is not modified" in str(e):
+                        raise
+                    logging.error(f"Failed to edit message as markdown: {e}")
+                    await message.edit_text(text, parse_mode=None)
+            else:
+                await message.edit_text(text, parse_mode=None)
+        except TelegramRetryAfter as e:
+            self.next_edit_at = time.monotonic() + e.retry_after
+            return False
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logging.error(f"Failed to edit streamed message: {e}")
+                return False
+
+        self.rendered[index] = (text, markdown)
+        return True
+
+    async def _send(self, text: str, markdown: bool) -> bool:
+        first_message = self.messages[0]
+
+        try:
+            rendered = render_markdown(text) if markdown else None
+            if rendered is not None:
+                try:
+                    sent = await first_message.answer(rendered, parse_mode=ParseMode.MARKDOWN_V2)
+                except TelegramBadRequest as e:
+                    logging.error(f"Failed to send message as markdown: {e}")
+                    sent = await first_message.answer(text, parse_mode=None)
+            else:
+                sent = await first_message.answer(text, parse_mode=None)
+        except TelegramRetryAfter as e:
+            self.next_edit_at = time.monotonic() + e.retry_after
+            return False
+
+        self.messages.append(sent)
+        self.rendered.append((text, markdown))
+        return True
+
+    async def _delete(self, message: Message):
+        try:
+            await message.delete()
+        except TelegramBadRequest as e:
+            logging.error(f"Failed to delete streamed message: {e}")
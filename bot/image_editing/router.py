@@ -3,7 +3,7 @@ from aiogram.types import Message
 
 from bot.filters import TextCommand, Photo, StateCommand, CompositeFilters
 from bot.commands import get_remove_background_command
-from bot.utils import send_photo_as_file
+from bot.utils import send_photo_as_file, relay_photo
 from config import TOKEN
 from services import stateService, StateTypes, imageEditing, tokenizeService
 
@@ -12,12 +12,12 @@ imageEditingRouter = Router()
 @imageEditingRouter.message(TextCommand([get_remove_background_command()]))
 async def handle_remove_background_start(message: Message):
     await message.answer("Пришлите фотографию, чтобы удалить фон.")
-    stateService.set_current_state(message.from_user.id, StateTypes.ImageEditing)
+    await stateService.set_current_state(message.from_user.id, StateTypes.ImageEditing)
 
 
-@imageEditingRouter.message(CompositeFilters([Photo(), StateCommand(StateTypes.ImageEditing)]))
+@imageEditingRouter.message(CompositeFilters([Photo(), StateCommand(StateTypes.ImageEditing)]), flags={"batch": "album"})
 async def handle_remove_background(message: Message, album):
-    stateService.set_current_state(message.from_user.id, StateTypes.Default)
+    await stateService.set_current_state(message.from_user.id, StateTypes.Default)
     wait_message = await message.answer("**⌛️Ожидайте ответ...**")
 
     photos = []
@@ -35,7 +35,7 @@ async def handle_remove_background(message: Message, album):
         result = await imageEditing.remove_background(file_url)
 
         image_url = result["data"]["task_result"]["task_output"]["image_url"]
-        await message.reply_photo(image_url)
+        await relay_photo(message, image_url, reply=True)
         await send_photo_as_file(
             message,
             image_url,
@@ -9,9 +9,10 @@ from bot.gpt.utils import checked_text
 from bot.commands import images_command, images_command_text
 from bot.main_keyboard import create_main_keyboard
 from bot.utils import divide_into_chunks
-from bot.utils import send_photo_as_file, send_photo
+from bot.utils import send_photo_as_file, send_photo, relay_photo
 from bot.constants import DEFAULT_ERROR_MESSAGE
 from bot.empty_prompt import is_empty_prompt
+from db import generation_jobs, GenerationJob
 from services import stateService, StateTypes, imageService, tokenizeService
 from services.image_utils import image_models_values, samplers_values, \
     steps_values, cgf_values, size_values
@@ -117,9 +118,10 @@ def get_banned_words(text):
 @imagesRouter.message(StateCommand(StateTypes.Image))
 async def handle_generate_image(message: types.Message):
     user_id = message.from_user.id
+    task_id = None
 
     try:
-        if not stateService.is_image_state(user_id):
+        if not await stateService.is_image_state(user_id):
             return
         
         tokens = await tokenizeService.get_tokens(user_id)
@@ -131,7 +133,7 @@ async def handle_generate_image(message: types.Message):
 /buy - 💎 Пополнить баланс
 /referral - 👥 Пригласить друга, чтобы получить больше *⚡️*!       
 """)
-            stateService.set_current_state(user_id, StateTypes.Default)
+            await stateService.set_current_state(user_id, StateTypes.Default)
             return
         
         if (is_empty_prompt(message.text)):
@@ -151,7 +153,7 @@ async def handle_generate_image(message: types.Message):
             )
             return
 
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
 
         wait_message = await message.answer("**⌛️Ожидайте генерацию...**\nПримерное время ожидания 15-30 секунд.")
 
@@ -161,15 +163,23 @@ async def handle_generate_image(message: types.Message):
 
         await message.bot.send_chat_action(message.chat.id, "typing")
 
-        async def wait_image():
+        async def wait_image(new_task_id: str):
+            nonlocal task_id
+            task_id = new_task_id
+            await generation_jobs.add(GenerationJob(task_id, "sd", user_id, message.chat.id, message.message_id, cost=30))
             await message.answer("Генерация изображения ушла в фоновый режим. \n"
                                  "Пришлем вам изображение через 40-120 секунд. \n"
                                  "Можете продолжать работать с ботом 😉")
 
-        image = await imageService.generate(message.text, user_id, wait_image)
+        try:
+            image = await imageService.generate(message.text, user_id, wait_image)
+        finally:
+            # Задача снимается один раз - как только ожидание закончилось, успешно или нет
+            if task_id:
+                await generation_jobs.remove(task_id)
 
         await message.bot.send_chat_action(message.chat.id, "typing")
-        await message.reply_photo(image["output"][0])
+        await relay_photo(message, image["output"][0], reply=True)
         await send_photo_as_file(message, image["output"][0], "Вот картинка в оригинальном качестве")
         await tokenizeService.update_token(user_id, 30, "subtract")
         await message.answer(f"""
@@ -184,15 +194,16 @@ async def handle_generate_image(message: types.Message):
         logging.error(f"Failed to generate image: {e}")
 
     imageService.set_waiting_image(user_id, False)
-    stateService.set_current_state(user_id, StateTypes.Default)
+    await stateService.set_current_state(user_id, StateTypes.Default)
 
 
 @imagesRouter.message(StateCommand(StateTypes.Flux))
 async def handle_generate_image(message: types.Message):
     user_id = message.from_user.id
+    task_id = None
 
     try:
-        if not stateService.is_flux_state(user_id):
+        if not await stateService.is_flux_state(user_id):
             return
         
         tokens = await tokenizeService.get_tokens(user_id)
@@ -204,7 +215,7 @@ async def handle_generate_image(message: types.Message):
 /buy - 💎 Пополнить баланс
 /referral - 👥 Пригласить друга, чтобы получить больше *⚡️*!
 """)
-            stateService.set_current_state(user_id, StateTypes.Default)
+            await stateService.set_current_state(user_id, StateTypes.Default)
             return
         
         if (is_empty_prompt(message.text)):
@@ -224,7 +235,7 @@ async def handle_generate_image(message: types.Message):
             )
             return
 
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
 
         wait_message = await message.answer("**⌛️Ожидайте генерацию...**\nПримерное время ожидания 15-30 секунд.")
 
@@ -234,7 +245,17 @@ async def handle_generate_image(message: types.Message):
 
         await message.bot.send_chat_action(message.chat.id, "typing")
 
-        async def task_id_get(task_id: str):
+        model = await imageService.get_flux_model(user_id)
+
+        energy = 600
+
+        if model == "Qubico/flux1-dev":
+            energy = 2000
+
+        async def task_id_get(new_task_id: str):
+            nonlocal task_id
+            task_id = new_task_id
+            await generation_jobs.add(GenerationJob(task_id, "flux", user_id, message.chat.id, message.message_id, cost=energy))
             await message.answer(f"`1:flux:{task_id}:generate`")
             await message.answer(f"""Это ID вашей генерации.
 
@@ -243,12 +264,17 @@ async def handle_generate_image(message: types.Message):
 Вы также получите результат генерации по готовности.
 """)
 
-        result = await imageService.generate_flux(user_id, message.text, task_id_get)
+        try:
+            result = await imageService.generate_flux(user_id, message.text, task_id_get)
+        finally:
+            # Задача снимается один раз - как только ожидание закончилось, успешно или нет
+            if task_id:
+                await generation_jobs.remove(task_id)
 
         image = result['data']["output"]["image_url"]
 
         await message.bot.send_chat_action(message.chat.id, "typing")
-        await message.reply_photo(image)
+        await relay_photo(message, image, reply=True)
         await send_photo_as_file(message, image, "Вот картинка в оригинальном качестве")
         await message.answer(text="Cгенерировать Flux еще? 🔥", reply_markup=InlineKeyboardMarkup(
             resize_keyboard=True,
@@ -262,13 +288,6 @@ async def handle_generate_image(message: types.Message):
             ],
         ))
 
-        model = imageService.get_flux_model(user_id)
-
-        energy = 600
-
-        if model == "Qubico/flux1-dev":
-            energy = 2000
-
         await tokenizeService.update_token(user_id, energy, "subtract")
         await message.answer(f"""
 🤖 Затрачено на генерацию изображения Flux {energy}⚡️ 
@@ -282,7 +301,7 @@ async def handle_generate_image(message: types.Message):
         logging.error(f"Failed to generate Flux image: {e}")
 
     imageService.set_waiting_image(user_id, False)
-    stateService.set_current_state(message.from_user.id, StateTypes.Default)
+    await stateService.set_current_state(message.from_user.id, StateTypes.Default)
 
 
 @imagesRouter.message(StateCommand(StateTypes.Dalle3))
@@ -290,7 +309,7 @@ async def handle_generate_image(message: types.Message):
     user_id = message.from_user.id
 
     try:
-        if not stateService.is_dalle3_state(user_id):
+        if not await stateService.is_dalle3_state(user_id):
             return
 
         tokens = await tokenizeService.get_tokens(user_id)
@@ -302,7 +321,7 @@ async def handle_generate_image(message: types.Message):
 /buy - 💎 Пополнить баланс
 /referral - 👥 Пригласить друга, чтобы получить больше *⚡️*!       
 """)
-            stateService.set_current_state(user_id, StateTypes.Default)
+            await stateService.set_current_state(user_id, StateTypes.Default)
             return
         
         if (is_empty_prompt(message.text)):
@@ -322,7 +341,7 @@ async def handle_generate_image(message: types.Message):
             )
             return
 
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
 
         wait_message = await message.answer("**⌛️Ожидайте генерацию...**\nПримерное время ожидания 15-30 секунд.")
 
@@ -337,7 +356,7 @@ async def handle_generate_image(message: types.Message):
         await message.bot.send_chat_action(message.chat.id, "typing")
 
         await message.answer(image["text"])
-        await message.reply_photo(image["image"])
+        await relay_photo(message, image["image"], reply=True)
         await send_photo_as_file(message, image["image"], "Вот картинка в оригинальном качестве")
         await message.answer(text="Cгенерировать DALL·E 3 еще? 🔥", reply_markup=InlineKeyboardMarkup(
             resize_keyboard=True,
@@ -362,7 +381,7 @@ async def handle_generate_image(message: types.Message):
     except Exception as e:
         await message.answer(DEFAULT_ERROR_MESSAGE)
         logging.error(f"Failed to generate DALL·E 3 image: {e}")
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
 
 
 async def send_variation_image(message, image, task_id):
@@ -413,9 +432,10 @@ async def handle_generate_image(message: types.Message):
     user_id = message.from_user.id
 
     main_keyboard = create_main_keyboard()
+    task_id = None
 
     try:
-        if not stateService.is_midjourney_state(user_id):
+        if not await stateService.is_midjourney_state(user_id):
             return
 
         tokens = await tokenizeService.get_tokens(user_id)
@@ -427,7 +447,7 @@ async def handle_generate_image(message: types.Message):
 /buy - 💎 Пополнить баланс
 /referral - 👥 Пригласить друга, чтобы получить больше *⚡️*!       
 """, reply_markup=main_keyboard)
-            stateService.set_current_state(user_id, StateTypes.Default)
+            await stateService.set_current_state(user_id, StateTypes.Default)
             return
 
         if (is_empty_prompt(message.text)):
@@ -467,13 +487,16 @@ async def handle_generate_image(message: types.Message):
             ))
             return
         
-        stateService.set_current_state(message.from_user.id, StateTypes.Default)
+        await stateService.set_current_state(message.from_user.id, StateTypes.Default)
 
         wait_message = await message.answer("**⌛️Ожидайте генерацию...**\nПримерное время ожидания *1-3 минуты*.", reply_markup=main_keyboard)
 
         await message.bot.send_chat_action(message.chat.id, "typing")
 
-        async def task_id_get(task_id: str):
+        async def task_id_get(new_task_id: str):
+            nonlocal task_id
+            task_id = new_task_id
+            await generation_jobs.add(GenerationJob(task_id, "midjourney", user_id, message.chat.id, message.message_id, cost=4200))
             await message.answer(f"`1:midjourney:{task_id}:generate`")
             await message.answer(f"""Это ID вашей генерации.
                                  
@@ -481,7 +504,12 @@ async def handle_generate_image(message: types.Message):
                                  
 Вы также получите результат генерации по готовности.""")
 
-        image = await imageService.generate_midjourney(user_id, message.text, task_id_get)
+        try:
+            image = await imageService.generate_midjourney(user_id, message.text, task_id_get)
+        finally:
+            # Задача снимается один раз - как только ожидание закончилось, успешно или нет
+            if task_id:
+                await generation_jobs.remove(task_id)
 
         await message.bot.send_chat_action(message.chat.id, "typing")
 
@@ -502,27 +530,44 @@ async def handle_generate_image(message: types.Message):
     except Exception as e:
         await message.answer(DEFAULT_ERROR_MESSAGE)
         logging.error(f"Failed to generate Midjourney image: {e}")
-        stateService.set_current_state(message.from_user.id, StateTypes.Default)
+        await stateService.set_current_state(message.from_user.id, StateTypes.Default)
 
 
 @imagesRouter.callback_query(StartWithQuery("upscale-midjourney"))
 async def upscale_midjourney_callback_query(callback: CallbackQuery):
     task_id = callback.data.split(" ")[1]
     index = callback.data.split(" ")[2]
+    job_id = None
 
     wait_message = await callback.message.answer("**⌛️Ожидайте генерацию...**\nПримерное время ожидания *1-3 минуты*.")
 
-    async def task_id_get(task_id: str):
-        await callback.message.answer(f"`1:midjourney:{task_id}:upscale`")
+    async def task_id_get(new_task_id: str):
+        nonlocal job_id
+        job_id = new_task_id
+        await generation_jobs.add(GenerationJob(
+            job_id,
+            "midjourney",
+            callback.from_user.id,
+            callback.message.chat.id,
+            callback.message.message_id,
+            action="upscale",
+            cost=1600,
+        ))
+        await callback.message.answer(f"`1:midjourney:{new_task_id}:upscale`")
         await callback.message.answer(f"""Это ID вашей генерации.
                                       
 Просто отправьте этот ID в чат и получите актуальный статус вашей генерации в любой удобный для вас момент.
                                       
 Вы также получите результат генерации по готовности.""")
 
-    image = await imageService.upscale_image(task_id, index, task_id_get)
+    try:
+        image = await imageService.upscale_image(task_id, index, task_id_get)
+    finally:
+        # Задача снимается один раз - как только ожидание закончилось, успешно или нет
+        if job_id:
+            await generation_jobs.remove(job_id)
 
-    await callback.message.reply_photo(image["task_result"]["discord_image_url"])
+    await relay_photo(callback.message, image["task_result"]["discord_image_url"], reply=True)
     await send_photo_as_file(
         callback.message,
         image["task_result"]["discord_image_url"],
@@ -556,18 +601,35 @@ async def upscale_midjourney_callback_query(callback: CallbackQuery):
 async def variation_midjourney_callback_query(callback: CallbackQuery):
     task_id = callback.data.split(" ")[1]
     index = callback.data.split(" ")[2]
+    job_id = None
 
     wait_message = await callback.message.answer("**⌛️Ожидайте генерацию...**\nПримерное время ожидания *1-3 минуты*.")
 
-    async def task_id_get(task_id: str):
-        await callback.message.answer(f"`1:midjourney:{task_id}:generate`")
+    async def task_id_get(new_task_id: str):
+        nonlocal job_id
+        job_id = new_task_id
+        await generation_jobs.add(GenerationJob(
+            job_id,
+            "midjourney",
+            callback.from_user.id,
+            callback.message.chat.id,
+            callback.message.message_id,
+            action="variation",
+            cost=8700,
+        ))
+        await callback.message.answer(f"`1:midjourney:{new_task_id}:generate`")
         await callback.message.answer(f"""Это ID вашей генерации.
                                       
 Просто отправьте этот ID в чат и получите актуальный статус вашей генерации в любой удобный для вас момент.
                                       
 Вы также получите результат генерации по готовности.""")
 
-    image = await imageService.variation_image(task_id, index, task_id_get)
+    try:
+        image = await imageService.variation_image(task_id, index, task_id_get)
+    finally:
+        # Задача снимается один раз - как только ожидание закончилось, успешно или нет
+        if job_id:
+            await generation_jobs.remove(job_id)
 
     await send_variation_image(
         callback.message,
@@ -618,10 +680,10 @@ async def handle_start_generate_image(message: types.Message):
 async def generate_base_stable_diffusion_keyboard(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
 
-    current_image = imageService.get_current_image(user_id)
-    current_size = imageService.get_size_model(user_id)
-    current_steps = imageService.get_steps(user_id)
-    current_cfg = imageService.get_cfg_model(user_id)
+    current_image = await imageService.get_current_image(user_id)
+    current_size = await imageService.get_size_model(user_id)
+    current_steps = await imageService.get_steps(user_id)
+    current_cfg = await imageService.get_cfg_model(user_id)
 
     await callback_query.message.edit_text("Параметры *Stable Diffusion*:")
     await callback_query.message.edit_reply_markup(
@@ -660,7 +722,7 @@ generate_button_name = 'Cгенерировать'
 async def generate_base_midjourney_keyboard(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
 
-    current_size = imageService.get_midjourney_size(user_id)
+    current_size = await imageService.get_midjourney_size(user_id)
 
     def size_text(size: str):
         if current_size == size:
@@ -728,7 +790,7 @@ async def generate_base_midjourney_keyboard(callback_query: CallbackQuery):
 async def generate_base_dalle3_keyboard(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
 
-    current_size = imageService.get_dalle_size(user_id)
+    current_size = await imageService.get_dalle_size(user_id)
 
     def size_text(size: str):
         if current_size == size:
@@ -765,7 +827,7 @@ async def generate_base_dalle3_keyboard(callback_query: CallbackQuery):
 async def generate_base_flux_keyboard(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
 
-    current_model = imageService.get_flux_model(user_id)
+    current_model = await imageService.get_flux_model(user_id)
 
     def model_text(model: str, text):
         if current_model == model:
@@ -805,7 +867,7 @@ def normalize_end_index(index_end: int, max_index: int):
 
 @imagesRouter.callback_query(StartWithQuery("sd-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Image)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Image)
     await callback_query.message.answer("""
 Напишите запрос для генерации изображения! ‍🖼️
 
@@ -824,14 +886,14 @@ async def handle_image_model_query(callback_query: CallbackQuery):
     
 @imagesRouter.callback_query(StartWithQuery("cancel-sd-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
     await callback_query.message.delete()
     await callback_query.answer("Режим генерации изображения в Stable Diffusion успешно отменён!")
 
 
 @imagesRouter.callback_query(StartWithQuery("flux-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Flux)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Flux)
     await callback_query.message.answer("""
 Напишите запрос для генерации изображения! ‍🖼️
 
@@ -850,14 +912,14 @@ async def handle_image_model_query(callback_query: CallbackQuery):
     
 @imagesRouter.callback_query(StartWithQuery("cancel-flux-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
     await callback_query.message.delete()
     await callback_query.answer("Режим генерации изображения в Flux успешно отменён!")
 
 
 @imagesRouter.callback_query(StartWithQuery("dalle-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Dalle3)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Dalle3)
     await callback_query.message.answer("""
 Напишите запрос для генерации изображения! ‍🖼️
 
@@ -876,14 +938,14 @@ async def handle_image_model_query(callback_query: CallbackQuery):
 
 @imagesRouter.callback_query(StartWithQuery("cancel-dalle-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
     await callback_query.message.delete()
     await callback_query.answer("Режим генерации изображения в DALL·E 3 отменен.")
 
 
 @imagesRouter.callback_query(StartWithQuery("midjourney-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Midjourney)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Midjourney)
     await callback_query.message.delete()
     await callback_query.message.answer("""
 Выберите один из вариантов запроса для генерации изображения 🖼️ в меню снизу.
@@ -917,7 +979,7 @@ async def handle_image_model_query(callback_query: CallbackQuery):
 
 @imagesRouter.callback_query(StartWithQuery("cancel-midjourney-generate"))
 async def handle_image_model_query(callback_query: CallbackQuery):
-    stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
+    await stateService.set_current_state(callback_query.from_user.id, StateTypes.Default)
     await callback_query.message.delete()
     main_keyboard = create_main_keyboard()
     await callback_query.message.answer("Режим генерации изображения в Midjourney успешно отменён!", reply_markup=main_keyboard)
@@ -943,36 +1005,35 @@ async def handle_image_model_query(callback_query: CallbackQuery):
     if model == "update-flux-model":
         value = callback_query.data.split(" ")[2]
 
-        imageService.set_flux_model(user_id, value)
+        await imageService.set_flux_model(user_id, value)
 
         await generate_base_flux_keyboard(callback_query)
 
     if model == "update-size-midjourney":
         size = callback_query.data.split(" ")[2]
 
-        imageService.set_midjourney_size(user_id, size)
+        await imageService.set_midjourney_size(user_id, size)
 
         await generate_base_midjourney_keyboard(callback_query)
 
     if model == "update-size-dalle":
         dalle_size = callback_query.data.split(" ")[2]
 
-        imageService.set_dalle_size(user_id, dalle_size)
+        await imageService.set_dalle_size(user_id, dalle_size)
 
         await generate_base_dalle3_keyboard(callback_query)
 
     if model == "update-model":
         model = callback_query.data.split(" ")[2]
 
-        imageService.set_current_image(user_id, model)
+        await imageService.set_current_image(user_id, model)
 
         await generate_base_stable_diffusion_keyboard(callback_query)
 
     if model == "update-sampler":
         model = callback_query.data.split(" ")[2]
-        print(model)
 
-        imageService.set_sampler_state(user_id, model)
+        await imageService.set_sampler_state(user_id, model)
 
         await generate_base_stable_diffusion_keyboard(callback_query)
 
@@ -1018,7 +1079,7 @@ async def handle_image_model_query(callback_query: CallbackQuery):
     if model == "update-size":
         size = callback_query.data.split(" ")[2]
 
-        imageService.set_size_state(user_id, size)
+        await imageService.set_size_state(user_id, size)
 
         await generate_base_stable_diffusion_keyboard(callback_query)
 
@@ -1083,7 +1144,7 @@ async def handle_image_model_query(callback_query: CallbackQuery):
     if model == "update-step":
         model = callback_query.data.split(" ")[2]
 
-        imageService.set_steps_state(user_id, model)
+        await imageService.set_steps_state(user_id, model)
 
         await generate_base_stable_diffusion_keyboard(callback_query)
 
@@ -1109,7 +1170,7 @@ async def handle_image_model_query(callback_query: CallbackQuery):
     if model == "update-cfg":
         model = callback_query.data.split(" ")[2]
 
-        imageService.set_cfg_state(user_id, model)
+        await imageService.set_cfg_state(user_id, model)
 
         await generate_base_stable_diffusion_keyboard(callback_query)
 
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+
+import config
+
+# Обработчик с flags={"batch": ...} получает сообщения пачкой:
+# "album" - фото одной медиагруппы в data["album"],
+# "text" - текстовые сообщения, которые пользователь прислал подряд в личке (длинный текст Telegram режет
+# на части по 4096 символов), в data["batch_messages"]
+BATCH_ARGUMENTS = {
+    "album": "album",
+    "text": "batch_messages",
+}
+
+
+class _Batch:
+    def __init__(self, message: Message):
+        self.messages: List[Message] = [message]
+        self.opened_at = time.monotonic()
+        self.updated_at = self.opened_at
+
+
+class MiddlewareAlbum(BaseMiddleware):
+    """
+    Склеивает сообщения одной медиагруппы или одного отправителя в чате (для каждого обработчика
+    отдельно). Первое сообщение открывает пачку и ждет, пока window секунд не придет следующее
+    (но не дольше max_wait), остальные только дописываются в нее. Текст открывает пачку, только
+    если он не короче text_min_length - похоже, что это первая часть разрезанного сообщения;
+    короткий ответ обрабатывается сразу, без ожидания. Пачка закрывается и удаляется только здесь,
+    в том числе при ошибке обработчика.
+    """
+
+    def __init__(self, window: float = config.MESSAGE_BATCH_WINDOW, max_wait: float = config.MESSAGE_BATCH_MAX_WAIT,
+                 max_messages: int = config.MESSAGE_BATCH_MAX_MESSAGES, max_open: int = config.MESSAGE_BATCH_MAX_OPEN,
+                 text_min_length: int = config.MESSAGE_BATCH_TEXT_MIN_LENGTH):
+        self.window = window
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        self.max_open = max_open
+        self.text_min_length = text_min_length
+        self.batches: Dict[Tuple, _Batch] = {}
+
+    async def __call__(self, handler, event: Message, data):
+        mode = get_flag(data, "batch")
+        argument = BATCH_ARGUMENTS.get(mode)
+
+        if argument is None:
+            return await handler(event, data)
+
+        handler_object = data.get("handler")
+        key = self._batch_key(mode, event, handler_object.callback if handler_object is not None else None)
+        if key is None:
+            data[argument] = [event]
+            return await handler(event, data)
+
+        batch = self.batches.get(key)
+        if batch is not None and len(batch.messages) < self.max_messages:
+            batch.messages.append(event)
+            batch.updated_at = time.monotonic()
+            return None
+
+        if mode == "text" and len(event.text) < self.text_min_length:
+            data[argument] = [event]
+            return await handler(event, data)
+
+        if len(self.batches) >= self.max_open:
+            # Под нагрузкой не копим пачки без ограничения: сообщение обрабатывается отдельно
+            logging.warning(f"Too many open message batches ({len(self.batches)}), handling {key} unbatched")
+            data[argument] = [event]
+            return await handler(event, data)
+
+        batch = _Batch(event)
+        self.batches[key] = batch
+
+        try:
+            await self._wait_quiet(batch)
+        finally:
+            # Заполненную пачку могли уже заменить новой - удаляем только свою
+            if self.batches.get(key) is batch:
+                del self.batches[key]
+
+        data[argument] = sorted(batch.messages, key=lambda message: message.message_id)
+        return await handler(event, data)
+
+    async def _wait_quiet(self, batch: _Batch):
+        while len(batch.messages) < self.max_messages:
+            now = time.monotonic()
+            delay = min(batch.updated_at + self.window, batch.opened_at + self.max_wait) - now
+
+            if delay <= 0:
+                return
+
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _batch_key(mode: str, event: Message, callback) -> Optional[Tuple]:
+        # Сообщения, попавшие в разные обработчики, в одну пачку не попадают:
+        # каждый обработчик получил бы чужие сообщения
+        if mode == "album":
+            if not event.media_group_id:
+                return None
+            return event.chat.id, "album", callback, event.media_group_id
+
+        # В группах обработчик смотрит на упоминание бота в первом сообщении пачки -
+        # склейка с соседними сообщениями потеряла бы вопрос, поэтому там текст не копится.
+        # Стикеры, голосовые и прочие сообщения без текста тоже обрабатываются по одному
+        if not event.text or event.chat.type != "private" or event.from_user is None:
+            return None
+
+        return event.chat.id, "text", callback, event.from_user.id
@@ -1,6 +1,7 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 
+from bot.middlewares.MiddlewareRateLimit import bulk_sending
 from services import referralsService
 
 class MiddlewareAward(BaseMiddleware):
@@ -13,7 +14,8 @@ class MiddlewareAward(BaseMiddleware):
             update_parents = reward["updateParents"]
 
             if len(update_parents) > 0:
-                await event.bot.send_message(chat_id=event.from_user.id, text="""
+                with bulk_sending():
+                    await event.bot.send_message(chat_id=event.from_user.id, text="""
 🎉 Ваш аккаунт был подтвержден! 
 Пользователь, который пригласил вас получил *10000⚡️* и *+500⚡️* к ежедневному бесплатному пополнению!
 
@@ -23,7 +25,8 @@ class MiddlewareAward(BaseMiddleware):
 
 
             for parent in update_parents:
-                await event.bot.send_message(chat_id=parent, text="""
+                with bulk_sending():
+                    await event.bot.send_message(chat_id=parent, text="""
 🎉 Ваш реферал был подтвержден! 
 Вы получили *10000⚡️* 
 И *+500⚡️* к ежедневному бесплатному пополнению!
@@ -0,0 +1,14 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from services.logging_service import log_context
+
+
+class MiddlewareLogContext(BaseMiddleware):
+    """Все записи лога, сделанные при обработке update, помечаются его update_id и user_id"""
+
+    async def __call__(self, handler, event: Update, data):
+        user = data.get("event_from_user")
+
+        with log_context(update_id=event.update_id, user_id=user.id if user else None):
+            return await handler(event, data)
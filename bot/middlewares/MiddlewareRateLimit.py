@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction
+
+import config
+
+# Массовые рассылки (уведомления о рефералах, переводах) уступают место ответам пользователям
+_bulk_sending: ContextVar[bool] = ContextVar("bulk_sending", default=False)
+
+
+@contextmanager
+def bulk_sending():
+    """Отправки внутри блока считаются фоновыми и не занимают резерв для интерактивных ответов"""
+    token = _bulk_sending.set(True)
+    try:
+        yield
+    finally:
+        _bulk_sending.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Очередь чата: сообщения уходят строго в порядке отправки
+        self.lock = asyncio.Lock()
+
+    async def wait(self, reserve: float = 0.0):
+        while True:
+            delay = self.reserve(reserve)
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def reserve(self, reserve: float = 0.0) -> float:
+        """Забрать токен и вернуть 0, либо вернуть, сколько секунд подождать до следующей попытки"""
+        now = time.monotonic()
+
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 + reserve - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        return not self.lock.locked() and time.monotonic() >= self.paused_until and \
+            self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class _PendingEdit:
+    def __init__(self, method):
+        self.method = method
+        self.future = asyncio.get_running_loop().create_future()
+        # Результат может никто не забрать - не шумим в лог "exception was never retrieved"
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+
+class MiddlewareRateLimit(BaseRequestMiddleware):
+    """
+    Исходящий планировщик запросов к Bot API: отправки и правки сообщений проходят
+    через token bucket чата и общий token bucket бота, 429 с retry_after ставит чат на паузу
+    и запрос повторяется. Правки одного сообщения, ждущие очереди, склеиваются в одну.
+    """
+
+    METHOD_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+    CLEANUP_EVERY = 1000
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(config.TELEGRAM_GLOBAL_RATE, config.TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.pending_edits: Dict[Tuple, _PendingEdit] = {}
+        self.requests = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+
+        if chat_id is None or isinstance(method, SendChatAction) or \
+                not type(method).__name__.startswith(self.METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        edit_key = self._edit_key(method)
+        if edit_key is None:
+            return await self._send(make_request, bot, chat_id, method)
+
+        pending = self.pending_edits.get(edit_key)
+        if pending is not None:
+            # Предыдущая правка еще ждет очереди - отправится только самый свежий текст
+            pending.method = method
+            return await asyncio.shield(pending.future)
+
+        pending = _PendingEdit(method)
+        self.pending_edits[edit_key] = pending
+
+        try:
+            result = await self._send(make_request, bot, chat_id, method, edit_key, pending)
+        except BaseException as e:
+            if self.pending_edits.get(edit_key) is pending:
+                self.pending_edits.pop(edit_key, None)
+            if not pending.future.done():
+                pending.future.set_exception(e)
+            raise
+
+        pending.future.set_result(result)
+        return result
+
+    async def _send(self, make_request, bot, chat_id, method, edit_key=None, pending=None):
+        bucket = self._chat_bucket(chat_id)
+        reserve = config.TELEGRAM_GLOBAL_RATE * config.TELEGRAM_INTERACTIVE_RESERVE if _bulk_sending.get() else 0.0
+        retries = 0
+
+        async with bucket.lock:
+            while True:
+                await bucket.wait()
+                await self.global_bucket.wait(reserve)
+
+                if pending is not None and self.pending_edits.get(edit_key) is pending:
+                    # С этого момента новые правки встают в очередь отдельно
+                    self.pending_edits.pop(edit_key)
+                    method = pending.method
+
+                try:
+                    return await make_request(bot, method)
+                except TelegramRetryAfter as e:
+                    bucket.pause(e.retry_after)
+                    retries += 1
+
+                    if retries > config.TELEGRAM_MAX_RETRIES:
+                        raise
+
+                    logging.warning(f"Telegram flood control for chat {chat_id}: retry in {e.retry_after} s")
+                finally:
+                    self.requests += 1
+                    if self.requests % self.CLEANUP_EVERY == 0:
+                        self._cleanup()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+
+        if bucket is None:
+            # Отрицательные id - группы и каналы, там лимит Telegram заметно строже
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(config.TELEGRAM_GROUP_RATE, config.TELEGRAM_GROUP_BURST)
+            else:
+                bucket = TokenBucket(config.TELEGRAM_CHAT_RATE, config.TELEGRAM_CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+
+        return bucket
+
+    def _cleanup(self):
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items() if bucket.is_idle()]:
+            del self.chat_buckets[chat_id]
+
+    @staticmethod
+    def _edit_key(method) -> Optional[Tuple]:
+        if not type(method).__name__.startswith("Edit"):
+            return None
+
+        message_id = getattr(method, "message_id", None)
+        if message_id is None:
+            return None
+
+        return type(method).__name__, method.chat_id, message_id
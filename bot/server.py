@@ -0,0 +1,60 @@
+import hmac
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+import config
+from services.metrics import metrics
+from services.task_tracker import taskTracker
+
+
+async def handle_goapi_webhook(request: web.Request) -> web.Response:
+    """Callback GoAPI о завершении задачи (/api/v1/task): тело совпадает с ответом опроса задачи"""
+    secret = request.headers.get("X-Webhook-Secret", "")
+    if not hmac.compare_digest(secret.encode(), config.GOAPI_WEBHOOK_SECRET.encode()):
+        return web.Response(status=403)
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+
+    task_id = (payload.get("data") or {}).get("task_id")
+    if task_id:
+        resolved = taskTracker.resolve(task_id, payload)
+        logging.info(f"GoAPI webhook for task {task_id}, resolved: {resolved}")
+
+    return web.json_response({"ok": True})
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Гистограммы времени этапов в текстовом формате Prometheus"""
+    return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    app = web.Application()
+    if config.GOAPI_WEBHOOK_ENABLED:
+        app.router.add_post(config.GOAPI_WEBHOOK_PATH, handle_goapi_webhook)
+
+    if config.METRICS_ENABLED:
+        app.router.add_get(config.METRICS_PATH, handle_metrics)
+
+    if config.WEBHOOK_ENABLED:
+        SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=config.WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+
+    return app
+
+
+async def start_server(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    site = web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT)
+    await site.start()
+
+    logging.info("HTTP server is listening on %s:%s", config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    return runner
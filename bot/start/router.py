@@ -9,6 +9,7 @@ from bot.filters import TextCommand
 from bot.commands import help_text, help_command, app_command
 from bot.gpt.utils import check_subscription
 from bot.main_keyboard import create_main_keyboard, send_message
+from bot.middlewares.MiddlewareRateLimit import bulk_sending
 from services import tokenizeService, referralsService
 
 startRouter = Router()
@@ -105,10 +106,11 @@ async def start(message: types.Message):
         if chat_id:
             user_name = message.from_user.username
             user_mention = f"<a href='tg://user?id={message.from_user.id}'>{message.from_user.full_name}</a>"
-            await message.bot.send_message(
-                chat_id=chat_id,
-                text=(
-                    f"""
+            with bulk_sending():
+                await message.bot.send_message(
+                    chat_id=chat_id,
+                    text=(
+                        f"""
 🎉 По вашей реферальной ссылке перешли: @{user_name} ({user_mention}).
 
 Чтобы вашему другу стать вашим рефералом, он должен подписаться на канал @gptDeep.
@@ -118,9 +120,9 @@ async def start(message: types.Message):
 Если вдруг этого долго не происходит, то возможно вашему другу нужна помощь, <b>попробуйте написать ему в личные сообщения</b>. 
 Если и это не помогает, то обратитесь в поддержку в сообществе @deepGPT и мы поможем вам разобраться с ситуацией.
 """
-                ),
-                parse_mode="HTML"
-            )
+                    ),
+                    parse_mode="HTML"
+                )
 
     if not is_subscribe:
         if str(ref_user_id) == str(message.from_user.id):
@@ -151,7 +153,8 @@ async def handle_ref_is_subscribe_query(callback_query: CallbackQuery):
     ref_user_id = callback_query.data.split(" ")[1]
     user_id = callback_query.data.split(" ")[2]
 
-    is_subscribe = await check_subscription(callback_query.message, user_id)
+    # Пользователь только что нажал "Проверить" - кешу верить нельзя
+    is_subscribe = await check_subscription(callback_query.message, user_id, fresh=True)
 
     if not is_subscribe:
         await callback_query.message.answer(text="Вы не подписались! 😡")
@@ -0,0 +1 @@
+from bot.subscription.router import subscriptionRouter
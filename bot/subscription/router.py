@@ -0,0 +1,13 @@
+from aiogram import F, Router
+from aiogram.types import ChatMemberUpdated
+
+import config
+from services import subscriptionService
+
+subscriptionRouter = Router()
+
+
+@subscriptionRouter.chat_member(F.chat.id == config.SUBSCRIPTION_CHANNEL_ID)
+async def handle_channel_member_update(update: ChatMemberUpdated):
+    # Подписка/отписка в канале сразу обновляет кеш, не дожидаясь TTL
+    subscriptionService.on_chat_member_update(update.new_chat_member.user.id, update.new_chat_member.status)
@@ -1,25 +1,69 @@
+import asyncio
 import logging
 import tempfile
 import os
-import requests
 
 from aiogram import Router
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile, CallbackQuery
-from pydub import AudioSegment
-from pydub.utils import which
 
 from bot.filters import TextCommand, StateCommand, StartWithQuery
 from bot.commands import suno_command, suno_text
 from bot.empty_prompt import is_empty_prompt
 from bot.constants import DEFAULT_ERROR_MESSAGE
-from services import StateTypes, stateService, sunoService, tokenizeService
-
-# Указываем путь к ffmpeg для pydub
-AudioSegment.converter = which("ffmpeg")
-os.environ['PATH'] += ':/usr/bin'
+from bot.utils import send_cached, remember_upload
+from db import generation_jobs, GenerationJob, url_key, content_key
+from services import StateTypes, stateService, sunoService, tokenizeService, transcodingService
+from services.transcoding_service import file_sha256
+from services.utils import async_download
 
 sunoRouter = Router()
 
+AUDIO_DOWNLOAD_TIMEOUT = 300
+AUDIO_CAPTION = "Ваша сгенерированная композиция (mp3)!"
+
+
+async def send_suno_audio(message: Message, audio_url: str):
+    """
+    Отправить композицию: уже загруженная в Telegram (тот же audio_url или тот же файл
+    по sha256) уходит по file_id, без скачивания и перекодирования
+    """
+    def send(document):
+        return message.answer_document(document=document, caption=AUDIO_CAPTION)
+
+    if await send_cached("document", [url_key("audio", audio_url)], send):
+        return
+
+    ext = '.flac' if audio_url.endswith('.flac') else '.mp3'
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
+        tmp_file_path = tmp_file.name
+
+    try:
+        # Ошибка скачивания уходит наверх: генерация не считается выполненной
+        size = await async_download(audio_url, tmp_file_path, timeout=AUDIO_DOWNLOAD_TIMEOUT)
+        logging.info(f"Suno: скачан файл {ext} размером {size} байт")
+
+        try:
+            source_hash = await asyncio.get_running_loop().run_in_executor(None, file_sha256, tmp_file_path)
+            keys = [url_key("audio", audio_url), content_key("audio", source_hash)]
+
+            returned = await send_cached("document", keys[1:], send)
+            if returned is None:
+                # mp3 лежит в кеше перекодированных файлов: не удаляем, и до конца отправки его не вытеснят
+                with transcodingService.pin(source_hash):
+                    mp3_path = await transcodingService.to_mp3(tmp_file_path, source_hash) \
+                        if ext == '.flac' else tmp_file_path
+                    returned = await send(FSInputFile(mp3_path, filename="output.mp3"))
+
+            await remember_upload("document", keys, returned)
+            logging.info(f"Suno: успешно отправлен mp3 файл")
+        except Exception as e:
+            logging.error(f"Ошибка при конвертации или отправке аудио: {e}")
+            await message.answer("Произошла ошибка при обработке аудиофайла.")
+    finally:
+        if os.path.exists(tmp_file_path):
+            logging.info(f"Удаляю tmp_file_path: {tmp_file_path}")
+            os.remove(tmp_file_path)
+
 
 async def suno_create_messages(message: Message, generation: dict):
     data = generation.get('data')
@@ -28,47 +72,7 @@ async def suno_create_messages(message: Message, generation: dict):
 
     if audio_url:
         logging.info(f"Suno: получен audio_url: {audio_url}")
-        ext = '.flac' if audio_url.endswith('.flac') else '.mp3'
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
-            response = requests.get(audio_url)
-            tmp_file.write(response.content)
-            tmp_file_path = tmp_file.name
-            logging.info(f"Suno: скачан файл {ext} размером {len(response.content)} байт")
-
-        if ext == '.flac':
-            base, _ = os.path.splitext(tmp_file_path)
-            mp3_path = base + ".mp3"
-            try:
-                audio = AudioSegment.from_file(tmp_file_path, format="flac")
-                audio.export(mp3_path, format="mp3")
-                input_file = FSInputFile(mp3_path, filename="output.mp3")
-                await message.answer_document(document=input_file, caption="Ваша сгенерированная композиция (mp3)!")
-                logging.info(f"Suno: успешно отправлен mp3 файл")
-            except Exception as e:
-                logging.error(f"Ошибка при конвертации или отправке аудио: {e}")
-                await message.answer("Произошла ошибка при обработке аудиофайла.")
-            finally:
-                if mp3_path and isinstance(mp3_path, str):
-                    if os.path.exists(mp3_path):
-                        logging.info(f"Удаляю mp3_path: {mp3_path}")
-                        os.remove(mp3_path)
-                if tmp_file_path and isinstance(tmp_file_path, str):
-                    if os.path.exists(tmp_file_path):
-                        logging.info(f"Удаляю tmp_file_path: {tmp_file_path}")
-                        os.remove(tmp_file_path)
-        else:
-            try:
-                input_file = FSInputFile(tmp_file_path, filename="output.mp3")
-                await message.answer_document(document=input_file, caption="Ваша сгенерированная композиция (mp3)!")
-                logging.info(f"Suno: успешно отправлен mp3 файл")
-            except Exception as e:
-                logging.error(f"Ошибка при отправке mp3: {e}")
-                await message.answer("Произошла ошибка при отправке аудиофайла.")
-            finally:
-                if tmp_file_path and isinstance(tmp_file_path, str):
-                    if os.path.exists(tmp_file_path):
-                        logging.info(f"Удаляю tmp_file_path: {tmp_file_path}")
-                        os.remove(tmp_file_path)
+        await send_suno_audio(message, audio_url)
     else:
         logging.error(f"Suno: нет audio_url. generation={generation}")
         status = data.get('status') if data else 'unknown'
@@ -103,7 +107,7 @@ async def suno_generate_handler(message: Message):
     user_id = message.from_user.id
 
     try:
-        if not stateService.is_suno_state(user_id):
+        if not await stateService.is_suno_state(user_id):
             return
 
         tokens = await tokenizeService.get_tokens(user_id)
@@ -115,7 +119,7 @@ async def suno_generate_handler(message: Message):
 /buy - 💎 Пополнить баланс
 /referral - 👥 Пригласить друга, чтобы получить больше *⚡️*!       
 """)
-            stateService.set_current_state(user_id, StateTypes.Default)
+            await stateService.set_current_state(user_id, StateTypes.Default)
             return
 
         if is_empty_prompt(message.text):
@@ -157,7 +161,7 @@ async def suno_generate_handler(message: Message):
 
         # Сохраняем тему и переходим к запросу стиля
         sunoService.store_user_data(str(user_id), topic=message.text)
-        stateService.set_current_state(user_id, StateTypes.SunoStyle)
+        await stateService.set_current_state(user_id, StateTypes.SunoStyle)
 
         await message.answer(
             text="""Отлично! Теперь укажите *стиль* музыкальной композиции 🎵.
@@ -182,16 +186,17 @@ async def suno_generate_handler(message: Message):
     except Exception as e:
         await message.answer(DEFAULT_ERROR_MESSAGE)
         logging.error(f"Failed to process Suno topic: {e}")
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
         return
 
 
 @sunoRouter.message(StateCommand(StateTypes.SunoStyle))
 async def suno_style_handler(message: Message):
     user_id = message.from_user.id
+    task_id = None
 
     try:
-        if not stateService.is_suno_style_state(user_id):
+        if not await stateService.is_suno_style_state(user_id):
             return
 
         if is_empty_prompt(message.text):
@@ -238,11 +243,11 @@ async def suno_style_handler(message: Message):
 
         if not topic:
             await message.answer("Произошла ошибка: тема песни не найдена. Попробуйте начать заново.")
-            stateService.set_current_state(user_id, StateTypes.Default)
+            await stateService.set_current_state(user_id, StateTypes.Default)
             sunoService.clear_user_data(str(user_id))
             return
 
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
 
         wait_message = await message.answer(
             f"**⌛️Ожидайте генерацию...**\nТема: {topic}\nСтиль: {style}\nПримерное время ожидания: *3-5 минут*.\nМожете продолжать работать с ботом."
@@ -250,7 +255,10 @@ async def suno_style_handler(message: Message):
 
         await message.bot.send_chat_action(message.chat.id, "typing")
 
-        async def task_id_get(task_id: str):
+        async def task_id_get(new_task_id: str):
+            nonlocal task_id
+            task_id = new_task_id
+            await generation_jobs.add(GenerationJob(task_id, "suno", user_id, message.chat.id, message.message_id, cost=5700))
             await message.answer(f"`1:suno:{task_id}:generate`")
             await message.answer(
                 f"""Это ID вашей генерации.
@@ -261,7 +269,13 @@ async def suno_style_handler(message: Message):
 """
             )
 
-        generation = await sunoService.generate_suno(topic, style, task_id_get)
+        try:
+            generation = await sunoService.generate_suno(topic, style, task_id_get)
+        finally:
+            # Задача снимается один раз, как только ожидание закончилось, и до отправки:
+            # после падения посреди отправки ее не доставят и не спишут повторно
+            if task_id:
+                await generation_jobs.remove(task_id)
 
         if not generation or not generation.get('data'):
             await message.answer(
@@ -300,7 +314,7 @@ async def suno_style_handler(message: Message):
     except Exception as e:
         await message.answer(DEFAULT_ERROR_MESSAGE)
         logging.error(f"Failed to generate Suno: {e}")
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
         sunoService.clear_user_data(str(user_id))
         return
 
@@ -320,14 +334,14 @@ async def suno_prepare_handler(callback_query: CallbackQuery):
 @sunoRouter.callback_query(StartWithQuery("cancel-suno-generate"))
 async def cancel_state(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
-    stateService.set_current_state(user_id, StateTypes.Default)
+    await stateService.set_current_state(user_id, StateTypes.Default)
     sunoService.clear_user_data(str(user_id))
     await callback_query.message.delete()
     await callback_query.answer("Режим генерации музыки в Suno успешно отменён!")
 
 
 async def enter_suno_state(user_id, message: Message):
-    stateService.set_current_state(user_id, StateTypes.Suno)
+    await stateService.set_current_state(user_id, StateTypes.Suno)
 
     await message.answer(
         text="""*Активирован режим* генерации музыки в *Suno*.
@@ -1,2 +1,3 @@
 from bot.tasks.router import taskRouter
 
+from bot.tasks.resume import resume_generation_jobs
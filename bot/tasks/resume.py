@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.enums import ChatType
+from aiogram.types import Message, Chat, InlineKeyboardMarkup, InlineKeyboardButton
+
+from bot.constants import GENERATION_FAILED_DEFAULT_ERROR_MESSAGE
+from bot.images.router import send_variation_image
+from bot.suno import suno_create_messages
+from bot.utils import send_photo_as_file, relay_photo
+from config import GENERATION_JOB_MAX_AGE
+from db import generation_jobs, GenerationJob
+from services import imageService, sunoService, tokenizeService
+from services.image_service import wait_sd
+
+# Что списываем за генерацию (текст для сообщения о затратах)
+JOB_TITLES = {
+    ("midjourney", "generate"): "изображений Midjourney",
+    ("midjourney", "upscale"): "увеличенного изображения Midjourney",
+    ("midjourney", "variation"): "вариации изображения Midjourney",
+    ("flux", "generate"): "изображения Flux",
+    ("sd", "generate"): "изображения Stable Diffusion",
+    ("suno", "generate"): "музыкальной композиции *Suno*",
+}
+
+
+def job_message(bot: Bot, job: GenerationJob) -> Message:
+    """Сообщение, на которое отвечал обработчик до перезапуска: ответы уходят в тот же чат"""
+    chat_type = ChatType.PRIVATE if job.chat_id > 0 else ChatType.SUPERGROUP
+
+    return Message(
+        message_id=job.message_id,
+        date=datetime.now(),
+        chat=Chat(id=job.chat_id, type=chat_type),
+    ).as_(bot)
+
+
+def generate_more_keyboard(callback_data: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        resize_keyboard=True,
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="Сгенерировать 🔥",
+                    callback_data=callback_data
+                )
+            ]
+        ],
+    )
+
+
+async def wait_job(job: GenerationJob):
+    # Задача шла и во время простоя бота: учитываем это в расписании опросов и таймауте
+    first_poll_delay = max(0.0, job.next_poll_at - time.time())
+    elapsed = max(0.0, time.time() - job.created_at)
+
+    if job.kind == "midjourney":
+        result = await imageService.try_fetch_midjourney(job.task_id, first_poll_delay, elapsed)
+        return result if result.get("status") == "finished" else None
+
+    if job.kind == "flux":
+        return await imageService.wait_flux(job.task_id, first_poll_delay=first_poll_delay, elapsed=elapsed)
+
+    if job.kind == "sd":
+        result = await wait_sd(job.task_id, first_poll_delay=first_poll_delay, elapsed=elapsed)
+        return result if result and result.get("output") else None
+
+    if job.kind == "suno":
+        return await sunoService.wait_task(job.task_id, first_poll_delay, elapsed) or None
+
+    raise ValueError(f"Unknown generation kind: {job.kind}")
+
+
+async def deliver_job(message: Message, job: GenerationJob, result: dict) -> bool:
+    """Отправить результат генерации. False - генерация не удалась и списывать нечего"""
+    if job.kind == "midjourney":
+        image = result["task_result"]["discord_image_url"]
+
+        if job.action == "upscale":
+            await relay_photo(message, image)
+            await send_photo_as_file(message, image, "Вот ваше изображение в оригинальном качестве", ext=".png")
+            await message.answer(text="Cгенерировать Midjourney еще?", reply_markup=generate_more_keyboard("midjourney-generate"))
+        else:
+            await send_variation_image(message, image, result["task_id"])
+
+        return True
+
+    if job.kind == "flux":
+        image = result['data']["output"]["image_url"]
+
+        await relay_photo(message, image)
+        await send_photo_as_file(message, image, "Вот картинка в оригинальном качестве")
+        await message.answer(text="Cгенерировать Flux еще? 🔥", reply_markup=generate_more_keyboard("flux-generate"))
+        return True
+
+    if job.kind == "sd":
+        image = result["output"][0]
+
+        await relay_photo(message, image)
+        await send_photo_as_file(message, image, "Вот картинка в оригинальном качестве")
+        return True
+
+    await suno_create_messages(message, result)
+    return result.get('data', {}).get('status') == "completed"
+
+
+async def resume_job(bot: Bot, job: GenerationJob):
+    message = job_message(bot, job)
+
+    try:
+        try:
+            result = await wait_job(job)
+        finally:
+            # Задача снимается один раз и до отправки: повторный перезапуск посреди отправки
+            # не приведет ко второму списанию
+            await generation_jobs.remove(job.task_id)
+
+        if result is None:
+            await message.answer(GENERATION_FAILED_DEFAULT_ERROR_MESSAGE)
+            logging.error(f"Resumed {job.kind} task {job.task_id} did not finish")
+        else:
+            await message.answer("♻️ Бот перезапускался, но ваша генерация не потерялась - вот результат.")
+
+            if await deliver_job(message, job, result) and job.cost:
+                await tokenizeService.update_token(job.user_id, job.cost, "subtract")
+                await message.answer(f"""
+🤖 Затрачено на генерацию {JOB_TITLES.get((job.kind, job.action), job.kind)} {job.cost}⚡️
+
+❔ /help - Информация по ⚡️
+""")
+    except Exception as e:
+        logging.error(f"Failed to resume {job.kind} task {job.task_id}: {e}")
+
+
+async def resume_generation_jobs(bot: Bot):
+    """Подхватить генерации, которые ждали результата до перезапуска бота"""
+    jobs = await generation_jobs.all()
+    if not jobs:
+        return
+
+    resumed = []
+    for job in jobs:
+        if time.time() - job.created_at > GENERATION_JOB_MAX_AGE:
+            logging.warning(f"Dropping stale {job.kind} task {job.task_id} created at {job.created_at}")
+            await generation_jobs.remove(job.task_id)
+            continue
+
+        resumed.append(resume_job(bot, job))
+
+    logging.info("♻️ Resuming %s unfinished generations", len(resumed))
+    await asyncio.gather(*resumed)
@@ -6,7 +6,7 @@ from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
 from bot.filters import StartWith
 from bot.images.router import send_variation_image
 from bot.suno import suno_create_messages
-from bot.utils import send_photo_as_file
+from bot.utils import send_photo_as_file, relay_photo
 from bot.constants import GENERATION_FAILED_DEFAULT_ERROR_MESSAGE
 from services import imageService, sunoService
 
@@ -30,7 +30,7 @@ async def handle_midjourney_message(message: Message):
                     task["task_id"]
                 )
             if action == "upscale":
-                await message.reply_photo(image)
+                await relay_photo(message, image, reply=True)
                 await send_photo_as_file(
                     message,
                     image,
@@ -110,7 +110,7 @@ async def handle_syno_message(message: Message):
             image = task['data']["output"]["image_url"]
 
             await message.bot.send_chat_action(message.chat.id, "typing")
-            await message.reply_photo(image)
+            await relay_photo(message, image, reply=True)
             await send_photo_as_file(message, image, "Вот картинка в оригинальном качестве")
             await message.answer(text="Cгенерировать Flux еще? 🔥", reply_markup=InlineKeyboardMarkup(
                 resize_keyboard=True,
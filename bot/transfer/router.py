@@ -14,6 +14,7 @@ from services import (
     StateTypes
 )
 from services.user_sync_service import get_user_sync_service
+from bot.middlewares.MiddlewareRateLimit import bulk_sending
 from bot.utils import get_user_name
 import config
 
@@ -99,13 +100,13 @@ async def admin_sync_all_command(message: types.Message):
 async def cancel_command(message: types.Message):
     """Отмена через команду"""
     user_id = message.from_user.id
-    current_state = stateService.get_current_state(user_id)
+    current_state = await stateService.get_current_state(user_id)
     
     if current_state in [StateTypes.TransferInputReceiver, StateTypes.TransferInputAmount]:
         if user_id in transfer_data:
             del transfer_data[user_id]
         
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
         
         await message.answer(
             "❌ Перевод отменён\n\n"
@@ -268,7 +269,7 @@ async def start_transfer(message: types.Message):
     fee_percent = settings["fees"]["premium_percent" if is_premium else "regular_percent"]
     
     # Установить состояние
-    stateService.set_current_state(user_id, StateTypes.TransferInputReceiver)
+    await stateService.set_current_state(user_id, StateTypes.TransferInputReceiver)
     
     await message.answer(
         f"💸 <b>ПЕРЕВОД ЭНЕРГИИ</b>\n\n"
@@ -407,7 +408,7 @@ async def input_receiver(message: types.Message):
     }
     
     # Следующий шаг
-    stateService.set_current_state(user_id, StateTypes.TransferInputAmount)
+    await stateService.set_current_state(user_id, StateTypes.TransferInputAmount)
     
     await message.answer(
         f"✅ Пользователь найден!\n\n"
@@ -434,7 +435,7 @@ async def input_amount(message: types.Message):
             "❌ Данные перевода не найдены\n"
             "Начните заново: /transfer"
         )
-        stateService.set_current_state(user_id, StateTypes.Default)
+        await stateService.set_current_state(user_id, StateTypes.Default)
         return
     
     # Парсинг суммы
@@ -599,20 +600,21 @@ async def confirm_transfer(callback_query: CallbackQuery):
             sender_name = f"{callback_query.from_user.first_name} {callback_query.from_user.last_name or ''}".strip()
             sender_username = f"@{callback_query.from_user.username}" if callback_query.from_user.username else "Пользователь"
             
-            await callback_query.bot.send_message(
-                chat_id=data["receiver_id"],
-                text=(
-                    f"💰 <b>ВЫ ПОЛУЧИЛИ ПЕРЕВОД!</b>\n\n"
-                    f"━━━━━━━━━━━━━━━━━━━\n"
-                    f"👤 <b>От кого:</b>\n"
-                    f"   {sender_username}\n"
-                    f"   {sender_name}\n\n"
-                    f"💵 <b>Сумма:</b> <b>{data['amount']:,}⚡️</b>\n"
-                    f"━━━━━━━━━━━━━━━━━━━\n\n"
-                    f"/balance - Проверить баланс"
-                ),
-                parse_mode="HTML"
-            )
+            with bulk_sending():
+                await callback_query.bot.send_message(
+                    chat_id=data["receiver_id"],
+                    text=(
+                        f"💰 <b>ВЫ ПОЛУЧИЛИ ПЕРЕВОД!</b>\n\n"
+                        f"━━━━━━━━━━━━━━━━━━━\n"
+                        f"👤 <b>От кого:</b>\n"
+                        f"   {sender_username}\n"
+                        f"   {sender_name}\n\n"
+                        f"💵 <b>Сумма:</b> <b>{data['amount']:,}⚡️</b>\n"
+                        f"━━━━━━━━━━━━━━━━━━━\n\n"
+                        f"/balance - Проверить баланс"
+                    ),
+                    parse_mode="HTML"
+                )
         except Exception as e:
             print(f"Failed to notify receiver: {e}")
         
@@ -633,7 +635,7 @@ async def confirm_transfer(callback_query: CallbackQuery):
     
     # Очистить
     del transfer_data[user_id]
-    stateService.set_current_state(user_id, StateTypes.Default)
+    await stateService.set_current_state(user_id, StateTypes.Default)
 
 @transferRouter.callback_query(StartWithQuery("transfer_cancel"))
 async def cancel_transfer(callback_query: CallbackQuery):
@@ -643,7 +645,7 @@ async def cancel_transfer(callback_query: CallbackQuery):
     if user_id in transfer_data:
         del transfer_data[user_id]
     
-    stateService.set_current_state(user_id, StateTypes.Default)
+    await stateService.set_current_state(user_id, StateTypes.Default)
     
     await callback_query.message.edit_text(
         "❌ Перевод отменён\n\n"
@@ -1,11 +1,13 @@
-from typing import List
-import os
+import codecs
+import logging
+from typing import Awaitable, Callable, List, Optional, Union
 
-from aiogram.client.session import aiohttp
-from aiogram.types import Message, FSInputFile
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InputFile
 
-# Global constant to control SSL certificate verification.
-SKIP_SSL_CHECK = False
+from config import MEDIA_MAX_SIZE, DOCUMENT_MAX_SIZE
+from db import media_cache, url_key
 
 # Old version intruduces a bug (the system message 'deep' also triggers to model 'deepseek-chat')
 # def include(arr: [str], value: str) -> bool:
@@ -23,57 +25,168 @@ def divide_into_chunks(lst, chunk_size):
     return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
 
 
-async def download_image(photo_url: str, file_path: str, skip_ssl: bool = SKIP_SSL_CHECK):
+# ========== Загрузка медиа без временных файлов ==========
+
+class MediaTooLargeError(ValueError):
+    pass
+
+
+class StreamedURLFile(InputFile):
+    """Файл по URL, который отдается в Telegram по мере скачивания через общий пул соединений"""
+
+    def __init__(self, url: str, filename: str):
+        super().__init__(filename=filename)
+        self.url = url
+
+    async def read(self, bot: Bot):
+        # services импортирует bot.utils при загрузке, поэтому пул подключаем здесь
+        from services.utils import get_http_client
+
+        size = 0
+
+        async with get_http_client(self.url).stream("GET", self.url) as response:
+            response.raise_for_status()
+
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                size += len(chunk)
+                if size > MEDIA_MAX_SIZE:
+                    raise MediaTooLargeError(f"File is larger than {MEDIA_MAX_SIZE} bytes")
+                yield chunk
+
+
+class TextDownload:
+    """Приемник для Bot.download: декодирует UTF-8 по мере прихода кусков файла"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.parts: List[str] = []
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise MediaTooLargeError(f"File is larger than {self.max_size} bytes")
+
+        # Бинарный файл отбрасывается на первом же некорректном куске, не дожидаясь конца загрузки
+        self.parts.append(self.decoder.decode(chunk))
+
+    def flush(self):
+        pass
+
+    def seek(self, offset: int):
+        pass
+
+    def text(self) -> str:
+        self.parts.append(self.decoder.decode(b"", final=True))
+        return "".join(self.parts)
+
+
+async def download_text(bot: Bot, file, max_size: int = DOCUMENT_MAX_SIZE) -> str:
+    """Текст документа из Telegram (UnicodeDecodeError, если это не UTF-8)"""
+    destination = TextDownload(max_size)
+    await bot.download(file, destination=destination)
+    return destination.text()
+
+
+# ========== Пересылка сгенерированных картинок ==========
+
+def uploaded_file_id(kind: str, returned: Message) -> Optional[str]:
+    """file_id того, что Telegram сохранил у себя после отправки"""
+    if kind == "photo" and returned.photo:
+        return returned.photo[-1].file_id
+    if kind == "document" and returned.document:
+        return returned.document.file_id
+    return None
+
+
+async def send_cached(kind: str, keys: List[str], send: Callable[[str], Awaitable[Message]]) -> Optional[Message]:
     """
-    Download an image from a URL and save it to the given file path.
-    
-    Args:
-        photo_url (str): The URL of the image to download.
-        file_path (str): The local file path where the image will be saved.
-        skip_ssl (bool): If True, SSL certificate verification is skipped.
+    Отправить файл по уже известному file_id (первый найденный по keys).
+    None - такого файла в кеше нет или Telegram его больше не принимает
     """
-    # If skip_ssl is True, then we set ssl to False in the connector.
-    connector = aiohttp.TCPConnector(ssl=(not skip_ssl))
-    
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(photo_url) as response:
-            if response.status == 200:
-                with open(file_path, 'wb') as f:
-                    f.write(await response.read())
-            else:
-                # Optionally, you could raise an exception or handle errors differently.
-                response.raise_for_status()
+    for key in keys:
+        try:
+            file_id = await media_cache.get(key)
+        except Exception as e:
+            # Кеш - только ускорение: без него файл просто отправится заново
+            logging.error(f"Media cache lookup failed for {key}: {e}")
+            return None
 
-async def send_photo(message: Message, photo_url: str, caption, ext=".jpg", reply_markup=None):
-    print(photo_url)
-    photo_path = 'photo' + ext
-
-    # Download the image
-    await download_image(photo_url, photo_path)
-    
-    # Send the image as a photo message.
-    returned_message = await message.answer_photo(
-        FSInputFile(photo_path),
-        caption=caption,
-        reply_markup=reply_markup
+        if file_id is None:
+            continue
+
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            logging.warning(f"Cached {kind} file_id for {key} was rejected: {e}")
+            await media_cache.forget(key)
+
+    return None
+
+
+async def remember_upload(kind: str, keys: List[str], returned: Message):
+    file_id = uploaded_file_id(kind, returned)
+
+    if file_id is None:
+        return
+
+    try:
+        await media_cache.set(*keys, file_id=file_id)
+    except Exception as e:
+        logging.error(f"Failed to remember {kind} file_id: {e}")
+
+
+async def _relay(kind: str, url: str, send: Callable[[Union[str, InputFile]], Awaitable[Message]],
+                 filename: str, by_url: bool) -> Message:
+    """
+    Отправить картинку по URL: сначала уже известный file_id, затем (для фото) сам URL -
+    картинку скачает Telegram, и только если не вышло - потоковая перекачка через бота
+    """
+    keys = [url_key(kind, url)]
+
+    returned = await send_cached(kind, keys, send)
+    if returned is not None:
+        return returned
+
+    if by_url:
+        try:
+            returned = await send(url)
+        except TelegramBadRequest as e:
+            # Например, картинка больше 5 МБ, которые Telegram готов скачать сам
+            logging.warning(f"Telegram could not fetch {url}: {e}")
+
+    if returned is None:
+        returned = await send(StreamedURLFile(url, filename=filename))
+
+    await remember_upload(kind, keys, returned)
+    return returned
+
+
+async def relay_photo(message: Message, photo_url: str, caption=None, reply_markup=None, reply=False,
+                      ext=".jpg") -> Message:
+    """Фото по URL без скачивания ботом (ответом на message, если reply)"""
+    send_method = message.reply_photo if reply else message.answer_photo
+
+    return await _relay(
+        "photo",
+        photo_url,
+        lambda photo: send_method(photo, caption=caption, reply_markup=reply_markup),
+        filename='photo' + ext,
+        by_url=True,
     )
 
-    os.remove(photo_path)
-    return returned_message
+
+async def send_photo(message: Message, photo_url: str, caption, ext=".jpg", reply_markup=None):
+    return await relay_photo(message, photo_url, caption=caption, reply_markup=reply_markup, ext=ext)
+
 
 async def send_photo_as_file(message: Message, photo_url: str, caption, ext=".jpg", reply_markup=None):
-    print(photo_url)
-    photo_path = 'photo' + ext
-
-    # Download the image
-    await download_image(photo_url, photo_path)
-    
-    # Send the image as a document.
-    returned_message = await message.answer_document(
-        FSInputFile(photo_path),
-        caption=caption,
-        reply_markup=reply_markup
+    # Документ по URL Telegram принимает только для PDF, ZIP и GIF - картинку приходится перекачивать
+    return await _relay(
+        "document",
+        photo_url,
+        lambda document: message.answer_document(document, caption=caption, reply_markup=reply_markup),
+        filename='photo' + ext,
+        by_url=False,
     )
-
-    os.remove(photo_path)
-    return returned_message
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 
 def get_required_env(key: str) -> str:
     """Get required environment variable or exit with error"""
@@ -21,6 +22,13 @@ def get_env_int(key: str, default: int) -> int:
     except ValueError:
         return default
 
+def get_env_float(key: str, default: float) -> float:
+    """Get float environment variable"""
+    try:
+        return float(os.getenv(key, str(default)))
+    except ValueError:
+        return default
+
 
 # ==========================================
 # REQUIRED CONFIGURATION (NO DEFAULTS)
@@ -63,16 +71,91 @@ WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
 WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
 WEBHOOK_PORT = get_env_int("WEBHOOK_PORT", 3000)
 
+# GoAPI Task Tracking (callbacks are served on WEBHOOK_HOST:WEBHOOK_PORT)
+GOAPI_WEBHOOK_URL = os.getenv("GOAPI_WEBHOOK_URL", "")
+GOAPI_WEBHOOK_PATH = os.getenv("GOAPI_WEBHOOK_PATH", "/goapi/webhook")
+GOAPI_WEBHOOK_SECRET = os.getenv("GOAPI_WEBHOOK_SECRET", "")
+# Callbacks are accepted only with a secret, otherwise anyone could post a fake task result
+GOAPI_WEBHOOK_ENABLED = bool(GOAPI_WEBHOOK_URL and GOAPI_WEBHOOK_SECRET)
+TASK_POLL_TICK = get_env_float("TASK_POLL_TICK", 1.0)
+TASK_POLL_CONCURRENCY = get_env_int("TASK_POLL_CONCURRENCY", 20)
+TASK_POLL_BACKOFF = get_env_float("TASK_POLL_BACKOFF", 1.5)
+TASK_POLL_JITTER = get_env_float("TASK_POLL_JITTER", 0.2)
+GENERATION_JOB_MAX_AGE = get_env_float("GENERATION_JOB_MAX_AGE", 21600.0)
+
+# Prometheus metrics (per-stage latency histograms) on the same HTTP server
+METRICS_ENABLED = get_env_bool("METRICS_ENABLED", False)
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
 # AdLean Settings
 ADLEAN_API_URL = os.getenv("ADLEAN_API_URL", "https://api.adlean.pro/engine/send_message")
 ADLEAN_ENABLED = get_env_bool("ADLEAN_ENABLED", True)
 ADLEAN_SHOW_AFTER_N_REQUESTS = get_env_int("ADLEAN_SHOW_AFTER_N_REQUESTS", 2)
 
+# Media Downloads (bytes): generated images are streamed through the bot, never buffered
+MEDIA_MAX_SIZE = get_env_int("MEDIA_MAX_SIZE", 50 * 1024 * 1024)
+DOCUMENT_MAX_SIZE = get_env_int("DOCUMENT_MAX_SIZE", 20 * 1024 * 1024)
+# Telegram file_ids of already uploaded media, keyed by source URL or content hash
+MEDIA_CACHE_MAX_ENTRIES = get_env_int("MEDIA_CACHE_MAX_ENTRIES", 20000)
+MEDIA_CACHE_TTL = get_env_float("MEDIA_CACHE_TTL", 30 * 24 * 3600.0)
+
+# Voice Transcription
+TRANSCRIPTION_CONCURRENCY = get_env_int("TRANSCRIPTION_CONCURRENCY", 4)
+TRANSCRIPTION_MAX_PENDING_PER_USER = get_env_int("TRANSCRIPTION_MAX_PENDING_PER_USER", 3)
+
+# Audio Transcoding (ffmpeg)
+TRANSCODE_CONCURRENCY = get_env_int("TRANSCODE_CONCURRENCY", 2)
+TRANSCODE_TIMEOUT = get_env_float("TRANSCODE_TIMEOUT", 300.0)
+TRANSCODE_CACHE_DIR = os.getenv("TRANSCODE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "transcode_cache")
+TRANSCODE_CACHE_MAX_FILES = get_env_int("TRANSCODE_CACHE_MAX_FILES", 200)
+
 # HTTPX Configuration
 HTTPX_DISABLE_SSL_VERIFY = get_env_bool("HTTPX_DISABLE_SSL_VERIFY", False)
+HTTP2_ENABLED = get_env_bool("HTTP2_ENABLED", True)
+HTTP_POOL_MAX_CONNECTIONS_PER_HOST = get_env_int("HTTP_POOL_MAX_CONNECTIONS_PER_HOST", 50)
+HTTP_POOL_MAX_KEEPALIVE_PER_HOST = get_env_int("HTTP_POOL_MAX_KEEPALIVE_PER_HOST", 20)
+HTTP_POOL_KEEPALIVE_EXPIRY = get_env_float("HTTP_POOL_KEEPALIVE_EXPIRY", 30.0)
+
+# Channel Subscription Check (TTL in seconds)
+SUBSCRIPTION_CHANNEL_ID = get_env_int("SUBSCRIPTION_CHANNEL_ID", -1002239712203)
+SUBSCRIPTION_POSITIVE_TTL = get_env_float("SUBSCRIPTION_POSITIVE_TTL", 1800.0)
+SUBSCRIPTION_NEGATIVE_TTL = get_env_float("SUBSCRIPTION_NEGATIVE_TTL", 60.0)
+SUBSCRIPTION_REFRESH_AHEAD = get_env_float("SUBSCRIPTION_REFRESH_AHEAD", 0.8)
+SUBSCRIPTION_CACHE_MAX_USERS = get_env_int("SUBSCRIPTION_CACHE_MAX_USERS", 100000)
+
+# Telegram Outbound Rate Limits (messages per second)
+TELEGRAM_GLOBAL_RATE = get_env_float("TELEGRAM_GLOBAL_RATE", 30.0)
+TELEGRAM_CHAT_RATE = get_env_float("TELEGRAM_CHAT_RATE", 1.0)
+TELEGRAM_CHAT_BURST = get_env_float("TELEGRAM_CHAT_BURST", 3.0)
+TELEGRAM_GROUP_RATE = get_env_float("TELEGRAM_GROUP_RATE", 20 / 60)
+TELEGRAM_GROUP_BURST = get_env_float("TELEGRAM_GROUP_BURST", 3.0)
+TELEGRAM_INTERACTIVE_RESERVE = get_env_float("TELEGRAM_INTERACTIVE_RESERVE", 0.2)
+TELEGRAM_MAX_RETRIES = get_env_int("TELEGRAM_MAX_RETRIES", 3)
+
+# Logging: LOG_FORMAT is "text" or "json"; LOG_SAMPLE_RATE is the share of updates
+# whose DEBUG/INFO records are written (warnings and errors are always kept)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLE_RATE = get_env_float("LOG_SAMPLE_RATE", 1.0)
+
+# Incoming Message Batching (albums and text split into several messages)
+MESSAGE_BATCH_WINDOW = get_env_float("MESSAGE_BATCH_WINDOW", 0.2)
+MESSAGE_BATCH_MAX_WAIT = get_env_float("MESSAGE_BATCH_MAX_WAIT", 2.0)
+MESSAGE_BATCH_MAX_MESSAGES = get_env_int("MESSAGE_BATCH_MAX_MESSAGES", 10)
+MESSAGE_BATCH_MAX_OPEN = get_env_int("MESSAGE_BATCH_MAX_OPEN", 10000)
+MESSAGE_BATCH_TEXT_MIN_LENGTH = get_env_int("MESSAGE_BATCH_TEXT_MIN_LENGTH", 3500)
+
+# Streaming Completions (answer is shown while it is being generated)
+GPT_STREAMING_ENABLED = get_env_bool("GPT_STREAMING_ENABLED", False)
+GPT_STREAM_EDIT_INTERVAL = get_env_float("GPT_STREAM_EDIT_INTERVAL", 1.5)
+
+# Balance Cache (seconds, 0 disables caching)
+BALANCE_CACHE_TTL = get_env_float("BALANCE_CACHE_TTL", 15.0)
 
 # Database Path
 DB_PATH = os.getenv("DB_PATH", "/app/data/data_base.db")
+DB_CACHE_MAX_KEYS = get_env_int("DB_CACHE_MAX_KEYS", 50000)
+DB_FLUSH_INTERVAL = get_env_float("DB_FLUSH_INTERVAL", 1.0)
 
 # User Synchronization
 SYNC_ON_STARTUP = get_env_bool("SYNC_ON_STARTUP", True)
@@ -1 +1,6 @@
 from db.init_db import data_base, db_key
+from db.async_storage import storage_worker
+from db.cache import db_cache
+from db.user_settings import user_settings, UserSettings
+from db.generation_jobs import generation_jobs, GenerationJob
+from db.media_cache import media_cache, url_key, content_key
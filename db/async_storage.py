@@ -0,0 +1,70 @@
+import asyncio
+import queue
+import threading
+
+
+def _set_result(future: asyncio.Future, result):
+    if not future.cancelled():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exception: BaseException):
+    if not future.cancelled():
+        future.set_exception(exception)
+
+
+class StorageWorker:
+    """
+    Единственный поток, который работает с vedis. Обработчики кладут операции в очередь
+    и ждут результат через asyncio.Future, не блокируя event loop.
+    """
+
+    def __init__(self, name: str = "vedis-storage"):
+        self.name = name
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self.thread.start()
+
+    def submit(self, fn, *args) -> asyncio.Future:
+        self.start()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.put((loop, future, fn, args))
+
+        return future
+
+    async def run(self, fn, *args):
+        return await self.submit(fn, *args)
+
+    async def stop(self):
+        """Дождаться выполнения уже поставленных операций и остановить поток"""
+        if self.thread is None:
+            return
+
+        thread = self.thread
+        self.thread = None
+        self.queue.put(None)
+
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            loop, future, fn, args = item
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                loop.call_soon_threadsafe(_set_exception, future, e)
+            else:
+                loop.call_soon_threadsafe(_set_result, future, result)
+
+
+storage_worker = StorageWorker()
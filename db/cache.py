@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+import config
+from db.async_storage import storage_worker
+from db.init_db import data_base
+
+# Ключ, которого нет в базе (кешируем промахи, чтобы не ходить на диск повторно)
+_MISSING = object()
+
+
+def to_db_value(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+
+    return str(value).encode('utf-8')
+
+
+class WriteBehindCache:
+    """
+    Кеш перед vedis: горячие ключи пользователей лежат в памяти (LRU),
+    а записи копятся и уходят на диск одним коммитом раз в flush_interval секунд.
+    Сам vedis трогает только поток storage_worker.
+    """
+
+    def __init__(self, store, max_size: int, flush_interval: float):
+        self.store = store
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.entries = OrderedDict()
+        self.dirty = {}
+        self.loading = {}
+
+    async def get(self, key: str) -> bytes:
+        """Значение ключа в байтах (как у vedis), KeyError если ключа нет"""
+        if key in self.dirty:
+            return self.dirty[key]
+
+        if key in self.entries:
+            value = self.entries[key]
+            self.entries.move_to_end(key)
+        else:
+            value = await self._load(key)
+
+        if value is _MISSING:
+            raise KeyError(key)
+
+        return value
+
+    def set(self, key: str, value):
+        value = to_db_value(value)
+        self.dirty[key] = value
+        self._remember(key, value)
+
+    async def _load(self, key: str):
+        # Одновременные промахи по одному ключу ждут одно чтение с диска
+        if key not in self.loading:
+            self.loading[key] = storage_worker.submit(self._read_from_store, key)
+
+        try:
+            value = await asyncio.shield(self.loading[key])
+        finally:
+            self.loading.pop(key, None)
+
+        # Пока читали с диска, ключ могли записать - свежее значение важнее
+        if key in self.dirty:
+            return self.dirty[key]
+        if key in self.entries:
+            return self.entries[key]
+
+        self._remember(key, value)
+        return value
+
+    def _read_from_store(self, key: str):
+        try:
+            return self.store[key]
+        except KeyError:
+            return _MISSING
+
+    def _write_to_store(self, batch: dict):
+        with self.store.transaction():
+            for key, value in batch.items():
+                self.store[key] = value
+        self.store.commit()
+
+    def _remember(self, key: str, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        # Грязные ключи остаются в self.dirty до коммита, поэтому их можно вытеснять
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def flush(self) -> int:
+        """Записать накопленные изменения одним коммитом, вернуть количество ключей"""
+        if not self.dirty:
+            return 0
+
+        batch = self.dirty
+        self.dirty = {}
+
+        try:
+            await storage_worker.run(self._write_to_store, batch)
+        except Exception:
+            # Не теряем записи: новые значения, пришедшие во время коммита, важнее
+            self.dirty = {**batch, **self.dirty}
+            raise
+
+        return len(batch)
+
+    async def run_flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.exception("[DB Cache] Flush failed: %s", e)
+
+
+db_cache = WriteBehindCache(
+    data_base,
+    max_size=config.DB_CACHE_MAX_KEYS,
+    flush_interval=config.DB_FLUSH_INTERVAL,
+)
@@ -0,0 +1,102 @@
+import json
+import logging
+import time
+from dataclasses import dataclass, asdict, fields
+from typing import List
+
+from db.async_storage import storage_worker
+from db.init_db import data_base
+
+JOBS_KEY = "generation_jobs"
+
+
+@dataclass
+class GenerationJob:
+    task_id: str
+    kind: str
+    user_id: int
+    chat_id: int
+    message_id: int
+    action: str = "generate"
+    cost: int = 0
+    created_at: float = 0.0
+    next_poll_at: float = 0.0
+
+    def pack(self) -> bytes:
+        return json.dumps(asdict(self), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "GenerationJob":
+        data = json.loads(raw.decode('utf-8'))
+
+        known_fields = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known_fields})
+
+
+class GenerationJobStore:
+    """
+    Незавершенные генерации (Midjourney, Flux, SD, Suno). В отличие от настроек пользователей
+    пишутся на диск сразу, минуя write-behind кеш: после деплоя задача должна найтись.
+    Запись удаляется до отправки результата: если бот упадет посреди отправки,
+    генерация не будет доставлена и оплачена повторно.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    async def add(self, job: GenerationJob):
+        if not job.created_at:
+            job.created_at = time.time()
+        if not job.next_poll_at:
+            job.next_poll_at = job.created_at
+
+        await storage_worker.run(self._write, job.task_id, job.pack())
+
+    async def remove(self, task_id: str):
+        await storage_worker.run(self._delete, task_id)
+
+    async def reschedule(self, task_id: str, next_poll_at: float):
+        """Запомнить срок следующей проверки, чтобы после перезапуска опрос продолжился с него"""
+        await storage_worker.run(self._update_next_poll, task_id, next_poll_at)
+
+    async def all(self) -> List[GenerationJob]:
+        jobs = []
+
+        for raw in await storage_worker.run(self._read_all):
+            try:
+                jobs.append(GenerationJob.unpack(raw))
+            except (ValueError, TypeError) as e:
+                logging.warning("[Generation jobs] Skipping broken record: %s", e)
+
+        return sorted(jobs, key=lambda job: job.next_poll_at)
+
+    def _write(self, task_id: str, raw: bytes):
+        with self.store.transaction():
+            self.store.Hash(JOBS_KEY)[task_id] = raw
+        self.store.commit()
+
+    def _update_next_poll(self, task_id: str, next_poll_at: float):
+        jobs = self.store.Hash(JOBS_KEY)
+        raw = jobs[task_id] if task_id in jobs else None
+
+        # Задачи без записи (например, уже доставленные) не трогаем
+        if raw is None:
+            return
+
+        job = GenerationJob.unpack(raw)
+        job.next_poll_at = next_poll_at
+        self._write(task_id, job.pack())
+
+    def _delete(self, task_id: str):
+        jobs = self.store.Hash(JOBS_KEY)
+
+        if task_id in jobs:
+            with self.store.transaction():
+                del jobs[task_id]
+            self.store.commit()
+
+    def _read_all(self) -> List[bytes]:
+        return list(self.store.Hash(JOBS_KEY).values())
+
+
+generation_jobs = GenerationJobStore(data_base)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import config
+from db.async_storage import storage_worker
+from db.init_db import data_base
+
+MEDIA_CACHE_KEY = "media_file_ids"
+
+
+def url_key(kind: str, url: str) -> str:
+    # Подпись и срок действия в query (Discord, S3) меняются от ссылки к ссылке на тот же файл
+    return f"url:{kind}:{urlsplit(url)._replace(query='', fragment='').geturl()}"
+
+
+def content_key(kind: str, sha256: str) -> str:
+    return f"sha256:{kind}:{sha256}"
+
+
+class MediaFileCache:
+    """
+    file_id уже загруженных в Telegram файлов по адресу источника или sha256 содержимого.
+    Записи живут ttl секунд, хранится не больше max_entries самых свежих. Таблица целиком
+    держится в памяти (читается с диска при первом обращении), изменения сразу пишутся в vedis.
+    """
+
+    def __init__(self, store, max_entries: int, ttl: float):
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.loading: Optional[asyncio.Future] = None
+
+    async def get(self, key: str) -> Optional[str]:
+        await self._ensure_loaded()
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        file_id, expires_at = entry
+        if expires_at < time.time():
+            await self.forget(key)
+            return None
+
+        self.entries.move_to_end(key)
+        return file_id
+
+    async def set(self, *keys: str, file_id: str):
+        await self._ensure_loaded()
+        expires_at = time.time() + self.ttl
+        written = {}
+
+        for key in keys:
+            self.entries[key] = (file_id, expires_at)
+            self.entries.move_to_end(key)
+            written[key] = json.dumps({"file_id": file_id, "expires_at": expires_at}).encode('utf-8')
+
+        evicted = []
+        while len(self.entries) > self.max_entries:
+            evicted.append(self.entries.popitem(last=False)[0])
+
+        await storage_worker.run(self._write, written, evicted)
+
+    async def forget(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            await storage_worker.run(self._write, {}, [key])
+
+    async def _ensure_loaded(self):
+        if self.loading is None:
+            self.loading = asyncio.ensure_future(self._load())
+
+        loading = self.loading
+        try:
+            await asyncio.shield(loading)
+        except Exception:
+            # Неудачное чтение не запоминается: следующее обращение попробует снова
+            if self.loading is loading:
+                self.loading = None
+            raise
+
+    async def _load(self):
+        items = await storage_worker.run(self._read_all)
+        now = time.time()
+        expired = []
+
+        for key, raw in sorted(items, key=lambda item: item[1].get("expires_at", 0)):
+            if raw.get("expires_at", 0) < now or "file_id" not in raw:
+                expired.append(key)
+            else:
+                self.entries[key] = (raw["file_id"], raw["expires_at"])
+
+        while len(self.entries) > self.max_entries:
+            expired.append(self.entries.popitem(last=False)[0])
+
+        if expired:
+            await storage_worker.run(self._write, {}, expired)
+
+    def _read_all(self) -> List[Tuple[str, dict]]:
+        items = []
+
+        for key, raw in self.store.Hash(MEDIA_CACHE_KEY).items():
+            try:
+                items.append((key.decode('utf-8'), json.loads(raw.decode('utf-8'))))
+            except ValueError:
+                continue
+
+        return items
+
+    def _write(self, written: dict, deleted: List[str]):
+        entries = self.store.Hash(MEDIA_CACHE_KEY)
+
+        with self.store.transaction():
+            for key, value in written.items():
+                entries[key] = value
+            for key in deleted:
+                if key in entries:
+                    del entries[key]
+        self.store.commit()
+
+
+media_cache = MediaFileCache(data_base, max_entries=config.MEDIA_CACHE_MAX_ENTRIES, ttl=config.MEDIA_CACHE_TTL)
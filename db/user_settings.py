@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, fields, replace
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from db.cache import db_cache
+from db.init_db import db_key
+
+SETTINGS_KEY = "settings"
+SETTINGS_VERSION = 1
+
+# Старые ключи vedis (по одному на поле), которые складываются в запись при первом чтении
+LEGACY_KEYS = {
+    "current_state": "current_state",
+    "current_model": "current_model",
+    "current_system_message": "current_system_message",
+    "current_image_model": "current_image_model",
+    "current_sampler": "current_sampler",
+    "current_steps": "current_steps",
+    "current_cfg": "current_cfg",
+    "current_size": "current_size",
+    "dalle_size": "dalee_size",
+    "midjourney_size": "midjourney_size",
+    "flux_model": "flux_model",
+    "requests_count": "requests_count",
+    "agreement_status": "agreement-status",
+}
+
+
+@dataclass
+class UserSettings:
+    current_state: str = "default"
+    current_model: str = "deepseek-chat"
+    current_system_message: str = "default"
+    current_image_model: str = "cyberrealistic"
+    current_sampler: str = "DPM++SDEKarras"
+    current_steps: int = 31
+    current_cfg: int = 7
+    current_size: str = "512x512"
+    dalle_size: str = "1024x1024"
+    midjourney_size: str = "1:1"
+    flux_model: str = "Qubico/flux1-dev"
+    requests_count: int = 0
+    agreement_status: bool = False
+
+    def pack(self) -> bytes:
+        """Компактная запись: версия + только поля, отличающиеся от значений по умолчанию"""
+        defaults = UserSettings()
+        data = {"v": SETTINGS_VERSION}
+
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if value != getattr(defaults, field.name):
+                data[field.name] = value
+
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "UserSettings":
+        data = json.loads(raw.decode('utf-8'))
+        data.pop("v", None)
+
+        known_fields = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known_fields})
+
+
+def _convert_legacy_value(field_type, raw: bytes):
+    value = raw.decode('utf-8')
+
+    if field_type is bool:
+        return value != "False"
+    if field_type is int:
+        return int(value)
+
+    return value
+
+
+async def migrate_legacy_keys(user_id) -> UserSettings:
+    """Собрать запись из старых ключей пользователя (отсутствующие поля берутся по умолчанию)"""
+    settings = UserSettings()
+
+    for field in fields(UserSettings):
+        try:
+            raw = await db_cache.get(db_key(user_id, LEGACY_KEYS[field.name]))
+            setattr(settings, field.name, _convert_legacy_value(field.type, raw))
+        except KeyError:
+            continue
+        except ValueError:
+            logging.warning("[UserSettings] Skip broken legacy value %s for user %s", field.name, user_id)
+
+    return settings
+
+
+class UserSettingsStore:
+    """Одна упакованная запись настроек на пользователя вместо отдельного ключа на каждое поле"""
+
+    def __init__(self):
+        # Блокировки чтения-изменения-записи по пользователям: (lock, сколько корутин его ждет или держит)
+        self.locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def _locked(self, user_id):
+        key = str(user_id)
+        lock, users = self.locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self.locks[key] = (lock, users + 1)
+
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self.locks[key]
+            if users == 1:
+                del self.locks[key]
+            else:
+                self.locks[key] = (lock, users - 1)
+
+    async def _read(self, user_id) -> UserSettings:
+        return UserSettings.unpack(await db_cache.get(db_key(user_id, SETTINGS_KEY)))
+
+    async def _read_or_migrate(self, user_id) -> UserSettings:
+        # Вызывается только под блокировкой пользователя
+        try:
+            return await self._read(user_id)
+        except KeyError:
+            settings = await migrate_legacy_keys(user_id)
+            self.save(user_id, settings)
+            return settings
+
+    async def get(self, user_id) -> UserSettings:
+        try:
+            return await self._read(user_id)
+        except KeyError:
+            # Миграция со старых ключей тоже пишет запись, поэтому идет под той же блокировкой, что и update
+            async with self._locked(user_id):
+                return await self._read_or_migrate(user_id)
+
+    def save(self, user_id, settings: UserSettings):
+        db_cache.set(db_key(user_id, SETTINGS_KEY), settings.pack())
+
+    async def update(self, user_id,
+                     updater: Optional[Callable[[UserSettings], Dict[str, Any]]] = None,
+                     **changes) -> UserSettings:
+        """
+        Изменить настройки пользователя под его блокировкой
+
+        Args:
+            user_id: ID пользователя Telegram
+            updater: функция от текущих настроек, возвращающая изменения (для значений,
+                зависящих от старых, например счетчиков)
+            changes: поля, которые нужно записать как есть
+        """
+        async with self._locked(user_id):
+            settings = await self._read_or_migrate(user_id)
+            if updater is not None:
+                changes = {**updater(settings), **changes}
+            settings = replace(settings, **changes)
+            self.save(user_id, settings)
+            return settings
+
+
+user_settings = UserSettingsStore()
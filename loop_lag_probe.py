@@ -0,0 +1,44 @@
+"""
+Общий замер для проверочных скриптов test_*_loop_lag / test_*_concurrency:
+пока выполняется проверяемая корутина, в том же event loop крутятся короткие задачи
+("сообщения других пользователей"), и для каждой фиксируется, насколько позже запланированного она выполнилась.
+"""
+import asyncio
+import time
+
+PROBE_INTERVAL = 0.02
+
+
+async def other_users(stop: asyncio.Event, lags: list, interval: float = PROBE_INTERVAL):
+    """Короткие обработчики других пользователей: насколько позже запланированного они выполнились"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def measure(name: str, job) -> float:
+    """
+    Выполнить job() и вернуть максимальную задержку других пользователей за это время
+
+    Args:
+        name: Подпись строки в выводе
+        job: Корутинная функция без аргументов
+
+    Returns:
+        float: Максимальная задержка в секундах
+    """
+    stop = asyncio.Event()
+    lags = []
+    probe = asyncio.ensure_future(other_users(stop, lags))
+
+    started = time.perf_counter()
+    await job()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+
+    max_lag = max(lags) if lags else elapsed
+    print(f"{name:<28} {elapsed:5.2f} s, other users: {len(lags)} messages, max delay {max_lag * 1000:7.1f} ms")
+    return max_lag
@@ -5,8 +5,11 @@ from services.image_editing import imageEditing
 from services.image_service import imageService
 from services.referrals_service import referralsService
 from services.state_service import stateService, StateTypes
+from services.subscription_service import subscriptionService
 from services.suno_service import sunoService
 from services.system_message_service import systemMessage
 from services.tokenize_service import tokenizeService
+from services.transcoding_service import transcodingService
+from services.transcription_service import transcriptionService
 from services.adlean_service import adlean_service, init_adlean_service, get_adlean_service
 from services.transfer_service import transferService
@@ -2,8 +2,11 @@
 Сервис для работы с AdLean API
 Интеграция рекламы в ответы телеграм-бота
 """
+import logging
 import time
 from typing import Optional, Dict, Any
+from services.logging_service import LazyJson
+from services.metrics import metrics
 from services.utils import async_post
 
 
@@ -22,7 +25,7 @@ class AdLeanService:
         self.api_key = api_key
         self.api_url = api_url
         self.enabled = enabled
-        print(f"[AdLean] Service initialized (enabled={enabled})")
+        logging.info("[AdLean] Service initialized (enabled=%s)", enabled)
     
     async def get_ad(
         self, 
@@ -57,19 +60,13 @@ class AdLeanService:
             >>> if response.get("have_ads"):
             ...     print(response.get("content"))
         """
-        print(f"[AdLean Service] get_ad() called for user {user_id}")
-        
         # Если реклама отключена, сразу возвращаем пустой результат
         if not self.enabled:
-            print(f"[AdLean Service] Service DISABLED, returning no ads")
             return {"have_ads": False, "content": ""}
         
-        print(f"[AdLean Service] Service ENABLED, proceeding with API request")
-        
         try:
             # Ограничиваем длину текста для оптимизации
             text_to_send = message_text[:500] if isinstance(message_text, str) else "Запрос с медиа"
-            print(f"[AdLean Service] Message text length: {len(message_text)} -> {len(text_to_send)} (truncated)")
             
             # Формируем payload согласно документации AdLean API
             payload = {
@@ -85,8 +82,6 @@ class AdLeanService:
                 }
             }
             
-            print(f"[AdLean Service] Payload prepared: chat_id={payload['chat_id']}, timestamp={payload['timestamp']}")
-            
             # Заголовки для аутентификации
             headers = {
                 "accept": "application/json",
@@ -94,17 +89,14 @@ class AdLeanService:
                 "Content-Type": "application/json"
             }
             
-            print(f"[AdLean Service] Sending POST request to {self.api_url}...")
-            
             # Отправляем запрос к AdLean API
-            response = await async_post(
-                self.api_url,
-                json=payload,
-                headers=headers,
-                timeout=5.0  # 5 секунд таймаут - не блокируем бота надолго
-            )
-            
-            print(f"[AdLean Service] Response received: status_code={response.status_code}")
+            with metrics.span("adlean"):
+                response = await async_post(
+                    self.api_url,
+                    json=payload,
+                    headers=headers,
+                    timeout=5.0  # 5 секунд таймаут - не блокируем бота надолго
+                )
             
             # Проверяем успешность запроса
             if response.status_code == 200:
@@ -117,20 +109,14 @@ class AdLeanService:
                     # Новый формат API: {"insert_index": 0, "content": "текст"}
                     content = raw_content.get("content", "")
                     insert_index = raw_content.get("insert_index", 0)
-                    print(f"[AdLean Service] Content format: dict (insert_index={insert_index})")
                 else:
                     # Старый формат или просто строка
                     content = raw_content or ""
                     insert_index = 0
-                    print(f"[AdLean Service] Content format: string")
-                
-                # Логируем для отладки
-                content_length = len(content) if content else 0
-                print(f"[AdLean Service] ✅ SUCCESS - User {user_id}: have_ads={have_ads}, content_length={content_length}")
-                print(f"[AdLean Service] Full API response: {data}")
                 
-                if have_ads and content:
-                    print(f"[AdLean Service] Ad content preview: {content[:100]}...")
+                # Логируем для отладки: ответ целиком сериализуется, только если DEBUG включен
+                logging.debug("[AdLean Service] have_ads=%s content_length=%s response: %s", have_ads,
+                              len(content) if content else 0, LazyJson(data, indent=None))
                 
                 return {
                     "have_ads": have_ads,
@@ -140,15 +126,12 @@ class AdLeanService:
             else:
                 # В случае ошибки API, не показываем рекламу
                 error_text = response.text[:200] if hasattr(response, 'text') else 'N/A'
-                print(f"[AdLean Service] ❌ API ERROR: status_code={response.status_code}")
-                print(f"[AdLean Service] Error response: {error_text}")
+                logging.error("[AdLean Service] API error: status_code=%s response=%s", response.status_code, error_text)
                 return {"have_ads": False, "content": ""}
                 
         except Exception as e:
             # Обрабатываем любые ошибки gracefully
-            print(f"[AdLean Service] ❌ EXCEPTION: {type(e).__name__}: {str(e)}")
-            import traceback
-            print(f"[AdLean Service] Traceback: {traceback.format_exc()}")
+            logging.exception("[AdLean Service] %s: %s", type(e).__name__, e)
             return {"have_ads": False, "content": ""}
     
     def set_enabled(self, enabled: bool):
@@ -159,7 +142,7 @@ class AdLeanService:
             enabled: True - включить, False - выключить
         """
         self.enabled = enabled
-        print(f"[AdLean] Advertising {'enabled' if enabled else 'disabled'}")
+        logging.info("[AdLean] Advertising %s", "enabled" if enabled else "disabled")
 
 
 # Singleton instance (будет инициализирован в bot_run.py)
@@ -177,7 +160,6 @@ def init_adlean_service(api_key: str, api_url: str, enabled: bool = True):
     """
     global adlean_service
     adlean_service = AdLeanService(api_key, api_url, enabled)
-    print(f"[AdLean] Global service initialized")
     return adlean_service
 
 
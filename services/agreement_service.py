@@ -1,24 +1,13 @@
-from db import data_base, db_key
+from db import user_settings
 
 
 class AgreementService:
-    AGREEMENT_STATUS = "agreement-status"
-
-    def get_agreement_status(self, user_id: str) -> bool:
+    async def get_agreement_status(self, user_id: str) -> bool:
         return True
-        # try:
-        #     value = data_base[db_key(user_id, self.AGREEMENT_STATUS)].decode('utf-8')
-        #     if value == "False":
-        #         return False
-        #     return True
-        # except KeyError:
-        #     self.set_agreement_status(user_id, False)
-        #     return False
+        # return (await user_settings.get(user_id)).agreement_status
 
-    def set_agreement_status(self, user_id: str, value: bool):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.AGREEMENT_STATUS)] = value
-        data_base.commit()
+    async def set_agreement_status(self, user_id: str, value: bool):
+        await user_settings.update(user_id, agreement_status=value)
 
 
 agreementService = AgreementService()
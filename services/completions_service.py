@@ -1,49 +1,84 @@
-import asyncio
 import json
-import re
-from typing import Any
+import logging
+import time
+from typing import Any, Awaitable, Callable
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 from bot.utils import get_user_name
-from bot.constants import DEFAULT_ERROR_MESSAGE
-from config import PROXY_URL, ADMIN_TOKEN, KEY_DEEPINFRA, GO_API_KEY
+from config import PROXY_URL, ADMIN_TOKEN, KEY_DEEPINFRA
 from services.gpt_service import GPTModels
-from services.utils import async_post
+from services.logging_service import LazyJson
+from services.metrics import metrics
+from services.utils import async_post, async_stream_post, iter_sse_data, get_openai_client
 
 history = {}
 
-# Temporary disable any free conversations (for investigation)
-conversations = {
-    # "9ac59cfb-2e73-4b08-82d1-c2d94a240fc2": True,
-    # "c8f6b5b9-46a4-4f11-8679-4c74699c7f3d": True,
-    # "7945e1db-b3f1-4e86-b000-584cff2d4d81": True,
-    # "3886244e-1b61-4713-8bf9-b5af56fedde6": True,
-    # "1d491883-1fe2-49b9-a422-917186b4329f": True,
-    # "e970eece-6236-4ef4-a071-5cb1367aad6b": True,
-    # "f851d10d-8094-4e1c-9545-8f5dffcb1b5f": True,
-    # "95f3832b-f125-429b-9d16-c1b918fe20cc": True,
-    # "84a8eec5-ee00-4ff0-9b35-1340b27140fa": True,
-    # "99ce43fd-8ee0-4bd6-8ed0-f6930035dc7f": True
-}
-
-async def set_toggle_conversation(key, flag):
-    await asyncio.sleep(1)
-    conversations[key] = flag
-
-async def get_free_conversation():
-    while True:
-        print(conversations)
-        for key, value in conversations.items():
-            if value:
-                await set_toggle_conversation(key, False)
-                return key
+def strip_reasoning(response_content: str) -> str:
+    """Убрать из ответа блок рассуждений <think>...</think>"""
+    reasoning_content = None
+
+    first_think_tag_positon = response_content.find("<think>")
+    last_think_tag_positon = response_content.find("</think>")
+
+    if first_think_tag_positon != -1 and last_think_tag_positon != -1:
+        reasoning_content = response_content[first_think_tag_positon:last_think_tag_positon + len("</think>")]
+
+    logging.debug("reasoning_content: %s", reasoning_content)
+
+    return response_content.replace(reasoning_content, "").strip() if reasoning_content else response_content
+
+
+class ReasoningFilter:
+    """Пропускает текст вне <think>...</think> по мере прихода кусков"""
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.in_think = False
+        self.pending = ""
+        self.started = False
+
+    def feed(self, chunk: str) -> str:
+        text = self.pending + chunk
+        visible = []
+
+        while True:
+            tag = self.CLOSE_TAG if self.in_think else self.OPEN_TAG
+            position = text.find(tag)
+
+            if position == -1:
+                # Хвост может оказаться началом тега - придерживаем его до следующего куска
+                keep = next((size for size in range(len(tag) - 1, 0, -1) if text.endswith(tag[:size])), 0)
+                if not self.in_think:
+                    visible.append(text[:len(text) - keep])
+                self.pending = text[len(text) - keep:]
+                break
+
+            if not self.in_think:
+                visible.append(text[:position])
+            text = text[position + len(tag):]
+            self.in_think = not self.in_think
+
+        result = "".join(visible)
+
+        # Как и strip_reasoning, не показываем пробелы, оставшиеся от вырезанного блока
+        if not self.started:
+            result = result.lstrip()
+            self.started = bool(result)
+
+        return result
+
+
+DEEPINFRA_BASE_URL = "https://api.deepinfra.com/v1/openai"
+
 
 class CompletionsService:
-    openai = OpenAI(
-        api_key=KEY_DEEPINFRA,
-        base_url="https://api.deepinfra.com/v1/openai",
-    )
+    @property
+    def openai(self) -> AsyncOpenAI:
+        """Клиент DeepInfra поверх общего пула соединений"""
+        return get_openai_client(DEEPINFRA_BASE_URL, KEY_DEEPINFRA)
 
     def clear_history(self, user_id: str, ):
         history[user_id] = []
@@ -87,122 +122,99 @@ class CompletionsService:
             'model': gpt_model
         }
 
-        response = await async_post(f"{PROXY_URL}/completions", json=payload, params=params)
+        with metrics.span("proxy_completion", model=gpt_model):
+            response = await async_post(f"{PROXY_URL}/completions", json=payload, params=params)
 
         if response.status_code == 200:
             completions = response.json()
 
-            print(json.dumps(completions, indent=4))
+            logging.debug("Completion: %s", LazyJson(completions))
 
             response_content = completions['choices'][0]['message']['content']
 
             response_model = completions['model']
 
-            reasoning_content = None
-
-            first_think_tag_positon = response_content.find("<think>")
-            last_think_tag_positon = response_content.find("</think>")
-
-            if first_think_tag_positon != -1 and last_think_tag_positon != -1:
-                reasoning_content = response_content[first_think_tag_positon:last_think_tag_positon + len("</think>")]
-                
-            print(f"reasoning_content: {reasoning_content}")
-
-            final_content = response_content.replace(reasoning_content, "").strip() if reasoning_content else response_content
+            final_content = strip_reasoning(response_content)
             
-            print(f"final_content: {final_content}")
+            logging.debug("final_content: %s", final_content)
+
+            # Прокси может вернуть баланс после списания - тогда повторный запрос /token не нужен
+            balance = completions.get("tokens_gpt")
 
-            return { 'success': True, "response": final_content, 'model': response_model}
+            return { 'success': True, "response": final_content, 'model': response_model, 'balance': balance}
         else:
             return { "success": False, "response": f"Ошибка 😔: {response.json().get('message')}" }
 
-    async def get_file(self, parts, conversation):
-        url = f"https://api.goapi.xyz/api/chatgpt/v1/conversation/{conversation}/download"
+    async def query_chatgpt_stream(self, user_id, message, system_message, gpt_model: str, bot_model: GPTModels,
+                                   singleMessage: bool, on_delta: Callable[[str], Awaitable[None]]) -> Any:
+        """
+        То же, что query_chatgpt, но ответ читается из SSE-стрима прокси.
+        on_delta вызывается с каждым новым куском текста ответа (включая <think>, см. ReasoningFilter).
+        """
 
-        payload = json.dumps({
-            "file_id": parts[0]["asset_pointer"].split("file-service://")[1]
-        })
-        headers = {
-            'X-API-Key': GO_API_KEY,
-            'Content-Type': 'application/json'
+        params = {
+            "masterToken": ADMIN_TOKEN
         }
 
-        response = await async_post(url, headers=headers, data=payload)
-
-        return response.json()
-
-    async def get_multi_modal_conversation(self, prompt, attempt: int = 0):
-        if attempt == 3:
-            return {"text": DEFAULT_ERROR_MESSAGE, "url_image": None}
-
-        conversation = await get_free_conversation()
-
-        url = f"https://api.goapi.xyz/api/chatgpt/v1/conversation/{conversation}"
-
-        payload = json.dumps({
-            "model": "gpt-4o",
-            "content": {"content_type": "multimodal_text", "parts": [prompt]},
-            "stream": True
-        })
-
-        headers = {'X-API-Key': GO_API_KEY, 'Content-Type': 'application/json'}
-
-        response = await async_post(url, headers=headers, data=payload)
+        payload = {
+            'userId': get_user_name(user_id),
+            'content': message,
+            'systemMessage': system_message,
+            'model': gpt_model,
+            'stream': True
+        }
 
-        images = []
-        text = []
-        print(response.text)
-        if response.status_code == 200:
-            for line in response.text.split("\n"):
-                if line:
-                    if line.startswith("data: "):
-                        data_str = line[len("data: "):]
-                        try:
-                            data_obj = json.loads(data_str)
-                            content = data_obj["message"]["content"]
-                            content_type = content["content_type"]
-                            content = data_obj["message"]["content"]
+        started = time.perf_counter()
 
-                            if content is None:
-                                continue
+        async with async_stream_post(f"{PROXY_URL}/completions", json=payload, params=params) as response:
+            # Время до заголовков ответа: сколько прокси думает до первого байта
+            metrics.observe("proxy_first_byte", time.perf_counter() - started, gpt_model)
 
-                            if content["parts"] is None:
-                                continue
+            if response.status_code != 200:
+                await response.aread()
+                return { "success": False, "response": f"Ошибка 😔: {response.json().get('message')}" }
 
-                            print(content["parts"])
+            # Прокси без поддержки стрима отвечает обычным JSON
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                await response.aread()
+                completions = response.json()
+                final_content = strip_reasoning(completions['choices'][0]['message']['content'])
+                await on_delta(completions['choices'][0]['message']['content'])
 
-                            content_parts = content["parts"][0]
+                return {
+                    'success': True,
+                    "response": final_content,
+                    'model': completions['model'],
+                    'balance': completions.get("tokens_gpt")
+                }
 
-                            if content_type == "multimodal_text":
-                                images.append(content_parts)
-                                continue
+            content_parts = []
+            response_model = None
+            balance = None
 
-                            if content_type == "text":
-                                text.append(content_parts)
+            async for data in iter_sse_data(response):
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    logging.warning("Не удалось декодировать чанк стрима: %s", data[:200])
+                    continue
 
-                        except Exception as e:
-                            print("Не удалось декодировать JSON:", e)
-                            continue
+                response_model = chunk.get("model") or response_model
+                balance = chunk.get("tokens_gpt", balance)
 
-            cleaned_text = re.sub(r"【[^】]*】", "", text[-1]).strip()
+                choices = chunk.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
 
-            if len(images) == 0:
-                await set_toggle_conversation(conversation, True)
-                return {"text": cleaned_text, "url_image": None}
+                if delta:
+                    content_parts.append(delta)
+                    await on_delta(delta)
 
-            image_result = await self.get_file(images, conversation)
+        metrics.observe("proxy_completion", time.perf_counter() - started, gpt_model)
+        final_content = strip_reasoning("".join(content_parts))
 
-            result = {"text": cleaned_text, "url_image": image_result["data"]["download_url"]}
-            await set_toggle_conversation(conversation, True)
-            return result
-        else:
-            if response.status_code == 400:
-                return await self.get_multi_modal_conversation(prompt, attempt + 1)
-            print(f"Не удалось выполнить запрос. Статус-код: {response.status_code}")
+        logging.debug("final_content: %s", final_content)
 
-            await asyncio.sleep(10)
-            await set_toggle_conversation(conversation, True)
-            return {"text": DEFAULT_ERROR_MESSAGE, "url_image": None}
+        return { 'success': True, "response": final_content, 'model': response_model, 'balance': balance}
 
 
 completionsService = CompletionsService()
@@ -1,6 +1,7 @@
+import logging
 from enum import Enum
 
-from db import data_base, db_key
+from db import user_settings
 
 
 class GPTModels(Enum):
@@ -59,24 +60,15 @@ gpt_models = {
 
 
 class GPTService:
-    CURRENT_MODEL_KEY = "current_model"
-    CURRENT_SYSTEM_MESSAGE_KEY = "current_system_message"
-
-    def get_current_model(self, user_id: str) -> GPTModels:
+    async def get_current_model(self, user_id: str) -> GPTModels:
         try:
-            model = data_base[db_key(user_id, self.CURRENT_MODEL_KEY)].decode('utf-8')
-            return GPTModels(model)
-        except KeyError:
-            self.set_current_model(user_id, GPTModels.DeepSeek_Chat)
-            return GPTModels.DeepSeek_Chat
+            return GPTModels((await user_settings.get(user_id)).current_model)
         except Exception:
-            self.set_current_model(user_id, GPTModels.DeepSeek_Chat)
+            await self.set_current_model(user_id, GPTModels.DeepSeek_Chat)
             return GPTModels.DeepSeek_Chat
 
-    def set_current_model(self, user_id: str, model: GPTModels):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_MODEL_KEY)] = model.value
-        data_base.commit()
+    async def set_current_model(self, user_id: str, model: GPTModels):
+        await user_settings.update(user_id, current_model=model.value)
 
     def set_is_requesting(self, user_id, value: bool):
         is_requesting[user_id] = value
@@ -89,22 +81,16 @@ class GPTService:
         #
         # return is_requesting[user_id]
 
-    def get_current_system_message(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.CURRENT_SYSTEM_MESSAGE_KEY)].decode('utf-8')
-        except KeyError:
-            value = SystemMessages.Default.value
-            self.set_current_system_message(user_id, value)
-            return value
-
-    def set_current_system_message(self, user_id: str, value: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_SYSTEM_MESSAGE_KEY)] = value
-        data_base.commit()
-
-    def get_mapping_gpt_model(self, user_id: str):
-        print(self.get_current_model(user_id).value)
-        return gpt_models[self.get_current_model(user_id).value]
+    async def get_current_system_message(self, user_id: str) -> str:
+        return (await user_settings.get(user_id)).current_system_message
+
+    async def set_current_system_message(self, user_id: str, value: str):
+        await user_settings.update(user_id, current_system_message=value)
+
+    async def get_mapping_gpt_model(self, user_id: str):
+        current_model = await self.get_current_model(user_id)
+        logging.debug("Current GPT model: %s", current_model.value)
+        return gpt_models[current_model.value]
 
 
 gptService = GPTService()
@@ -1,14 +1,17 @@
-import asyncio
-
-from openai import OpenAI
+import logging
 
 from config import GO_API_KEY
-from db import data_base, db_key
+from db import user_settings, UserSettings
 from services.image_utils import format_image_from_request, get_image_model_by_label
-from services.utils import async_post, async_get
+from services.task_tracker import taskTracker
+from services.utils import async_post, async_get, get_openai_client
 
 generating_map = {}
 
+DALLE_BASE_URL = "https://api.goapi.xyz/v1/"
+# Картинка DALL·E приходит целиком в ответе чата, без задачи для опроса
+DALLE_TIMEOUT = 300
+
 
 async def txt2img(prompt, negative_prompt, model, width, height, guidance_scale, steps, wait_image):
     response = await async_post(
@@ -32,47 +35,41 @@ async def txt2img(prompt, negative_prompt, model, width, height, guidance_scale,
     id = result["id"]
 
     if result["status"] == "processing":
-        await wait_image()
-
-        attempt = 0
+        await wait_image(id)
 
-        while True:
-            if attempt == 30:
-                return None
+        return await wait_sd(id, model=model)
 
-            await asyncio.sleep(30)
-            response = await async_post("https://api.goapi.ai/sd/fetch", json={"id": id})
-
-            result = response.json()
+    return response.json()
 
-            attempt += 1
 
-            if result["status"] == "processing":
-                continue
+async def wait_sd(id, model="", first_poll_delay=None, elapsed=0.0):
+    return await taskTracker.wait(
+        id,
+        fetch=lambda: sd_fetch(id),
+        is_done=lambda fetched: fetched["status"] != "processing",
+        model=f"sd:{model}",
+        min_interval=5,
+        max_interval=30,
+        timeout=900,
+        first_poll_delay=first_poll_delay,
+        elapsed=elapsed,
+    )
 
-            return result
 
+async def sd_fetch(id):
+    response = await async_post("https://api.goapi.ai/sd/fetch", json={"id": id})
     return response.json()
 
 
 class ImageService:
-    CURRENT_IMAGE_MODEL = 'current_image_model'
-    CURRENT_SAMPLER = 'current_sampler'
-    CURRENT_STEPS = 'current_steps'
-    CURRENT_CFG = 'current_cfg'
-    CURRENT_SIZE = 'current_size'
-    DALLE_SIZE = 'dalee_size'
-    MIDJOURNEY_SIZE = 'midjourney_size'
-    FLUX_MODEL = 'flux_model'
-
-    default_model = "cyberrealistic"
-    default_sampler = "DPM++SDEKarras"
-    default_steps = 31
-    default_cfg = "7"
-    default_size = "512x512"
-    default_dalle_size = "1024x1024"
-    default_midjourney_size = "1:1"
-    default_flux_model = "Qubico/flux1-dev"
+    default_model = UserSettings.current_image_model
+    default_sampler = UserSettings.current_sampler
+    default_steps = UserSettings.current_steps
+    default_cfg = UserSettings.current_cfg
+    default_size = UserSettings.current_size
+    default_dalle_size = UserSettings.dalle_size
+    default_midjourney_size = UserSettings.midjourney_size
+    default_flux_model = UserSettings.flux_model
 
     def set_waiting_image(self, user_id, value: bool):
         generating_map[user_id] = value
@@ -84,138 +81,90 @@ class ImageService:
 
         return generating_map[user_id]
 
-    def get_current_image(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.CURRENT_IMAGE_MODEL)].decode('utf-8')
-        except KeyError:
-            self.set_current_image(user_id, self.default_model)
-            return self.default_model
-
-    def set_current_image(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_IMAGE_MODEL)] = state
-        data_base.commit()
-
-    def get_sampler(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.CURRENT_SAMPLER)].decode('utf-8')
-        except KeyError:
-            self.set_sampler_state(user_id, self.default_sampler)
-            return self.default_sampler
-
-    def set_sampler_state(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_SAMPLER)] = state
-        data_base.commit()
-
-    def get_steps(self, user_id: str):
-        try:
-            return data_base[db_key(user_id, self.CURRENT_STEPS)].decode('utf-8')
-        except KeyError:
-            self.set_steps_state(user_id, self.default_steps)
-            return self.default_steps
-
-    def set_steps_state(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_STEPS)] = state
-        data_base.commit()
-
-    def get_cfg_model(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.CURRENT_CFG)].decode('utf-8')
-        except KeyError:
-            self.set_cfg_state(user_id, self.default_cfg)
-            return self.default_cfg
-
-    def set_cfg_state(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_CFG)] = state
-        data_base.commit()
-
-    def get_size_model(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.CURRENT_SIZE)].decode('utf-8')
-        except KeyError:
-            self.set_size_state(user_id, self.default_size)
-            return self.default_size
-
-    def set_size_state(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_SIZE)] = state
-        data_base.commit()
-
-    def get_dalle_size(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.DALLE_SIZE)].decode('utf-8')
-        except KeyError:
-            self.set_dalle_size(user_id, self.default_dalle_size)
-            return self.default_dalle_size
-
-    def set_dalle_size(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.DALLE_SIZE)] = state
-        data_base.commit()
-
-    def get_midjourney_size(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.MIDJOURNEY_SIZE)].decode('utf-8')
-        except KeyError:
-            self.set_midjourney_size(user_id, self.default_midjourney_size)
-            return self.default_midjourney_size
-
-    def set_midjourney_size(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.MIDJOURNEY_SIZE)] = state
-        data_base.commit()
-
-    def get_flux_model(self, user_id: str) -> str:
-        try:
-            return data_base[db_key(user_id, self.FLUX_MODEL)].decode('utf-8')
-        except KeyError:
-            self.set_flux_model(user_id, self.default_flux_model)
-            return self.default_flux_model
-
-    def set_flux_model(self, user_id: str, state: str):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.FLUX_MODEL)] = state
-        data_base.commit()
+    async def get_current_image(self, user_id: str) -> str:
+        return (await user_settings.get(user_id)).current_image_model
+
+    async def set_current_image(self, user_id: str, state: str):
+        await user_settings.update(user_id, current_image_model=state)
+
+    async def get_sampler(self, user_id: str) -> str:
+        return (await user_settings.get(user_id)).current_sampler
+
+    async def set_sampler_state(self, user_id: str, state: str):
+        await user_settings.update(user_id, current_sampler=state)
+
+    async def get_steps(self, user_id: str) -> int:
+        return (await user_settings.get(user_id)).current_steps
+
+    async def set_steps_state(self, user_id: str, state: str):
+        await user_settings.update(user_id, current_steps=int(state))
+
+    async def get_cfg_model(self, user_id: str) -> int:
+        return (await user_settings.get(user_id)).current_cfg
+
+    async def set_cfg_state(self, user_id: str, state: str):
+        await user_settings.update(user_id, current_cfg=int(state))
+
+    async def get_size_model(self, user_id: str) -> str:
+        return (await user_settings.get(user_id)).current_size
+
+    async def set_size_state(self, user_id: str, state: str):
+        await user_settings.update(user_id, current_size=state)
+
+    async def get_dalle_size(self, user_id: str) -> str:
+        return (await user_settings.get(user_id)).dalle_size
+
+    async def set_dalle_size(self, user_id: str, state: str):
+        await user_settings.update(user_id, dalle_size=state)
+
+    async def get_midjourney_size(self, user_id: str) -> str:
+        return (await user_settings.get(user_id)).midjourney_size
+
+    async def set_midjourney_size(self, user_id: str, state: str):
+        await user_settings.update(user_id, midjourney_size=state)
+
+    async def get_flux_model(self, user_id: str) -> str:
+        return (await user_settings.get(user_id)).flux_model
+
+    async def set_flux_model(self, user_id: str, state: str):
+        await user_settings.update(user_id, flux_model=state)
 
     async def generate(self, prompt: str, user_id: str, wait_image):
+        settings = await user_settings.get(user_id)
 
-        model = get_image_model_by_label(self.get_current_image(user_id))
+        model = get_image_model_by_label(settings.current_image_model)
 
         if not model:
-            self.set_current_image(user_id, self.default_model)
+            settings = await user_settings.update(user_id, current_image_model=self.default_model)
+            model = get_image_model_by_label(settings.current_image_model)
 
-        print(prompt)
+        logging.debug("Stable Diffusion prompt: %s", prompt)
         return await txt2img(
             prompt=prompt,
-            height=self.get_size_model(user_id).split("x")[0],
-            width=self.get_size_model(user_id).split("x")[1],
-            model=get_image_model_by_label(self.get_current_image(user_id))["value"],
+            height=settings.current_size.split("x")[0],
+            width=settings.current_size.split("x")[1],
+            model=model["value"],
             negative_prompt="",
-            guidance_scale=int(self.get_cfg_model(user_id)),
-            steps=int(self.get_steps(user_id)),
+            guidance_scale=int(settings.current_cfg),
+            steps=int(settings.current_steps),
             wait_image=wait_image
         )
 
     async def generate_dalle(self, user_id, prompt: str):
-        openai = OpenAI(
-            api_key=GO_API_KEY,
-            base_url="https://api.goapi.xyz/v1/",
-        )
+        openai = get_openai_client(DALLE_BASE_URL, GO_API_KEY)
 
-        chat_completion = openai.chat.completions.create(
+        chat_completion = await openai.chat.completions.create(
             model="gpt-4-gizmo-g-pmuQfob8d",
             max_tokens=30000,
             messages=[
                 {
                     "role": "user",
-                    "content": f"You should generate images in size {self.get_dalle_size(user_id)}"
+                    "content": f"You should generate images in size {await self.get_dalle_size(user_id)}"
                 },
                 {"role": "user", "content": prompt},
             ],
             stream=False,
+            timeout=DALLE_TIMEOUT,
         )
 
         formatted_response = format_image_from_request(chat_completion.choices[0].message.content)
@@ -226,30 +175,25 @@ class ImageService:
             "total_tokens": chat_completion.usage.total_tokens
         }
 
-    async def try_fetch_midjourney(self, task_id):
-        await asyncio.sleep(10)
-
-        attempts = 0
-
-        while True:
-            if attempts == 15:
-                return {}
-
-            await asyncio.sleep(30)
-            attempts += 1
-
-            result = await self.task_fetch(task_id)
-            print(result)
-
-            if result["status"] == "processing":
-                continue
+    async def try_fetch_midjourney(self, task_id, first_poll_delay=None, elapsed=0.0):
+        result = await taskTracker.wait(
+            task_id,
+            fetch=lambda: self.task_fetch(task_id),
+            is_done=lambda fetched: fetched["status"] != "processing",
+            model="midjourney",
+            min_interval=10,
+            max_interval=30,
+            timeout=490,
+            first_poll_delay=first_poll_delay,
+            elapsed=elapsed,
+        )
 
-            return result
+        return result or {}
 
     async def generate_midjourney(self, user_id, prompt, task_id_get):
         data = {
             "prompt": prompt,
-            "aspect_ratio": self.get_midjourney_size(user_id),
+            "aspect_ratio": await self.get_midjourney_size(user_id),
             "process_mode": "turbo",
         }
 
@@ -271,7 +215,7 @@ class ImageService:
         return response.json()
 
     async def upscale_image(self, task_id, index, task_id_get):
-        print(task_id)
+        logging.debug("Midjourney upscale of task %s", task_id)
         response = await async_post(
             "https://api.goapi.ai/mj/v2/upscale",
             headers={"X-API-KEY": GO_API_KEY},
@@ -301,9 +245,10 @@ class ImageService:
 
     async def generate_flux(self, user_id, prompt, task_id_get):
         payload = {
-            "model": self.get_flux_model(user_id),
+            "model": await self.get_flux_model(user_id),
             "task_type": "txt2img",
-            "input": {"prompt": prompt}
+            "input": {"prompt": prompt},
+            "config": {"webhook_config": taskTracker.webhook_config()}
         }
 
         headers = {
@@ -315,35 +260,25 @@ class ImageService:
 
         task_id = response.json()["data"]['task_id']
 
-        attempts = 0
-
         await task_id_get(task_id)
 
-        while True:
-            if attempts == 10:
-                return
-
-            await asyncio.sleep(10)
-
-            attempts += 1
-
-            headers = {
-                'X-API-Key': GO_API_KEY,
-                'Content-Type': 'application/json'
-            }
-
-            response = await async_get(f"https://api.goapi.ai/api/v1/task/{task_id}", headers=headers)
-
-            result = response.json()
-
-            if result['data']['status'] == "pending":
-                continue
-
-            if result['data']['status'] == "processing":
-                continue
+        return await self.wait_flux(task_id, model=payload["model"])
+
+    async def wait_flux(self, task_id, model="", first_poll_delay=None, elapsed=0.0):
+        result = await taskTracker.wait(
+            task_id,
+            fetch=lambda: self.task_flux_fetch(task_id),
+            is_done=lambda fetched: fetched['data']['status'] in ("completed", "failed"),
+            model=f"flux:{model}",
+            min_interval=3,
+            max_interval=10,
+            timeout=100,
+            first_poll_delay=first_poll_delay,
+            elapsed=elapsed,
+        )
 
-            if result['data']['status'] == "completed":
-                return result
+        if result is not None and result['data']['status'] == "completed":
+            return result
 
     async def task_flux_fetch(self, task_id):
         headers = {
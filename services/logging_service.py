@@ -0,0 +1,118 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import config
+
+# Поля, которыми помечаются все записи лога, пока обрабатывается update
+_log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+# Подробные записи (ниже WARNING) этого update попали в выборку
+_log_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Добавить поля (update_id, user_id, ...) ко всем записям лога внутри блока"""
+    context_token = _log_context.set({**_log_context.get(), **fields})
+    sampled_token = None
+
+    # Решение о выборке принимается один раз на update, чтобы его записи не рвались
+    if "update_id" in fields:
+        sampled_token = _log_sampled.set(random.random() < config.LOG_SAMPLE_RATE)
+
+    try:
+        yield
+    finally:
+        if sampled_token is not None:
+            _log_sampled.reset(sampled_token)
+        _log_context.reset(context_token)
+
+
+class LazyJson:
+    """Аргумент лога, который сериализуется, только если запись действительно пишется"""
+
+    def __init__(self, payload, indent: Optional[int] = 4):
+        self.payload = payload
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.payload, indent=self.indent, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Подставляет поля контекста в запись и отбрасывает подробные записи вне выборки"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not _log_sampled.get():
+            return False
+
+        record.context = _log_context.get()
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json: bool):
+        super().__init__("%(asctime)s %(levelname)s %(name)s%(context_text)s: %(message)s")
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = getattr(record, "context", {})
+
+        if not self.as_json:
+            record.context_text = "".join(f" {key}={value}" for key, value in context.items())
+            return super().format(record)
+
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **context,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    """
+    Записи кладутся в очередь, а в stderr их пишет отдельный поток: обработчик сообщения
+    не ждет вывода. Уровень, формат и доля подробных записей - из LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler()
+    output.setFormatter(StructuredFormatter(as_json=config.LOG_FORMAT == "json"))
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(config.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописать накопившиеся записи и остановить поток вывода"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,91 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Границы корзин (секунды): от чтения из кеша до долгого ответа модели
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _Series:
+    def __init__(self, buckets: int):
+        # Попадания в каждую корзину, последняя - "+Inf"
+        self.counts = [0] * (buckets + 1)
+        self.total = 0.0
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: квантили (p50, p99) считает сам Prometheus по корзинам"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        series = self.series.get(key)
+
+        if series is None:
+            series = _Series(len(self.buckets))
+            self.series[key] = series
+
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.total += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+
+        for key, series in sorted(self.series.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+
+            lines.append(f"{self.name}_sum{{{labels}}} {series.total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+
+        return lines
+
+
+class Metrics:
+    """
+    Время этапов обработки запроса (проверки, чтения, запросы к прокси, отправка в Telegram).
+    Запись - пара операций со словарем в памяти, отдается по /metrics сервера бота.
+    """
+
+    def __init__(self):
+        self.stages = Histogram(
+            "bot_stage_duration_seconds",
+            "Time spent in a stage of handling a user request",
+            ("stage", "model"),
+            LATENCY_BUCKETS,
+        )
+
+    def observe(self, stage: str, seconds: float, model: str = ""):
+        self.stages.observe(seconds, stage=stage, model=model or "")
+
+    @contextmanager
+    def span(self, stage: str, model: str = ""):
+        """Замерить блок кода (время учитывается и при исключении)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, model)
+
+    def render(self) -> str:
+        return "\n".join(self.stages.render()) + "\n"
+
+
+metrics = Metrics()
@@ -1,6 +1,6 @@
 from enum import Enum
 
-from db import data_base, db_key
+from db import user_settings
 
 
 class StateTypes(Enum):
@@ -26,51 +26,46 @@ class StateTypes(Enum):
 
  
 class StateService:
-    CURRENT_STATE = "current_state"
-
-    def get_current_state(self, user_id: str) -> StateTypes:
+    async def get_current_state(self, user_id: str) -> StateTypes:
         try:
-            model = data_base[db_key(user_id, self.CURRENT_STATE)].decode('utf-8')
-            return StateTypes(model)
-        except KeyError:
-            self.set_current_state(user_id, StateTypes.Default)
+            return StateTypes((await user_settings.get(user_id)).current_state)
+        except ValueError:
+            await self.set_current_state(user_id, StateTypes.Default)
             return StateTypes.Default
 
-    def set_current_state(self, user_id: str, state: StateTypes):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.CURRENT_STATE)] = state.value
-        data_base.commit()
+    async def set_current_state(self, user_id: str, state: StateTypes):
+        await user_settings.update(user_id, current_state=state.value)
 
-    def is_default_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_default_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.Default.value
 
-    def is_image_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_image_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.Image.value
 
-    def is_flux_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_flux_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.Flux.value
 
-    def is_dalle3_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_dalle3_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.Dalle3.value
 
-    def is_midjourney_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_midjourney_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.Midjourney.value
 
-    def is_suno_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_suno_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.Suno.value
 
-    def is_suno_style_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_suno_style_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.SunoStyle.value
 
-    def is_image_editing_state(self, user_id: str) -> bool:
-        current_state = self.get_current_state(user_id)
+    async def is_image_editing_state(self, user_id: str) -> bool:
+        current_state = await self.get_current_state(user_id)
         return current_state.value == StateTypes.ImageEditing.value
 
 
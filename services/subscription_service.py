@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+
+from config import SUBSCRIPTION_CHANNEL_ID, SUBSCRIPTION_POSITIVE_TTL, SUBSCRIPTION_NEGATIVE_TTL, \
+    SUBSCRIPTION_REFRESH_AHEAD, SUBSCRIPTION_CACHE_MAX_USERS
+
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+
+class SubscriptionService:
+    """
+    Кеш подписки на канал: подписчики перепроверяются раз в SUBSCRIPTION_POSITIVE_TTL
+    (для активных пользователей - заранее, в фоне), неподписанные - раз в SUBSCRIPTION_NEGATIVE_TTL.
+    Обновления chat_member из канала сразу меняют запись.
+    """
+
+    def __init__(self, channel_id: int):
+        self.channel_id = channel_id
+        # user_id -> (подписан, когда проверяли, до какого момента верим)
+        self.cache: Dict[str, Tuple[bool, float, float]] = {}
+        self.in_flight: Dict[str, asyncio.Task] = {}
+
+    async def is_subscribed(self, bot, user_id, fresh: bool = False) -> bool:
+        key = str(user_id)
+        cached = self.cache.get(key)
+
+        if cached is not None and not fresh:
+            is_member, checked_at, expires_at = cached
+            now = time.monotonic()
+
+            if now < expires_at:
+                if is_member and now - checked_at > SUBSCRIPTION_POSITIVE_TTL * SUBSCRIPTION_REFRESH_AHEAD:
+                    self._load_in_background(bot, user_id)
+                return is_member
+
+        return await asyncio.shield(self._load_task(bot, user_id))
+
+    def remember(self, user_id, is_member: bool):
+        key = str(user_id)
+        now = time.monotonic()
+        ttl = SUBSCRIPTION_POSITIVE_TTL if is_member else SUBSCRIPTION_NEGATIVE_TTL
+
+        # Переставляем ключ в конец, чтобы вытеснять давно не проверявшихся
+        self.cache.pop(key, None)
+        self.cache[key] = (is_member, now, now + ttl)
+
+        while len(self.cache) > SUBSCRIPTION_CACHE_MAX_USERS:
+            self.cache.pop(next(iter(self.cache)))
+
+    def on_chat_member_update(self, user_id, status: str):
+        self.remember(user_id, status in MEMBER_STATUSES)
+
+    def _load_task(self, bot, user_id) -> asyncio.Task:
+        # Одновременные проверки одного пользователя ждут один запрос get_chat_member
+        key = str(user_id)
+        task = self.in_flight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(self._load(bot, user_id))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        return task
+
+    def _load_in_background(self, bot, user_id):
+        if str(user_id) in self.in_flight:
+            return
+
+        task = self._load_task(bot, user_id)
+        task.add_done_callback(self._log_background_error)
+
+    async def _load(self, bot, user_id) -> bool:
+        chat_member = await bot.get_chat_member(chat_id=self.channel_id, user_id=user_id)
+        is_member = chat_member.status in MEMBER_STATUSES
+        self.remember(user_id, is_member)
+        return is_member
+
+    @staticmethod
+    def _log_background_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Failed to refresh subscription: {task.exception()}")
+
+
+subscriptionService = SubscriptionService(SUBSCRIPTION_CHANNEL_ID)
@@ -1,13 +1,14 @@
-import asyncio
 import logging
-import requests
-import json
 import re
 
 from config import GO_API_KEY, OPENROUTER_API_KEY
+from services.task_tracker import taskTracker
 from services.utils import async_post, async_get
 from db import data_base, db_key
 
+# Генерация лирики - обычный запрос к LLM, но бесплатные модели OpenRouter бывают медленными
+LYRICS_TIMEOUT = 120
+
 # Временное хранение данных пользователей
 user_temp_data = {}
 
@@ -30,7 +31,7 @@ class SunoService:
         if user_id in user_temp_data:
             del user_temp_data[user_id]
 
-    def generate_lyrics_with_timestamps(self, user_prompt: str, style: str = "pop") -> str:
+    async def generate_lyrics_with_timestamps(self, user_prompt: str, style: str = "pop") -> str:
         system_prompt = (
             f"Сгенерируй текст песни в стиле {style} с таймкодами для Diffrhythm. Формат:\n"
             "[mm:ss.ms]Первая строчка\n"
@@ -43,18 +44,19 @@ class SunoService:
             "Не добавляй никаких пояснений, только текст песни с таймкодами. "
             "Каждая строка должна быть отдельной строкой с таймкодом."
         )
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
+        response = await async_post(
+            "https://openrouter.ai/api/v1/chat/completions",
             headers={
                 "Authorization": f"Bearer {OPENROUTER_API_KEY}",
                 "Content-Type": "application/json",
             },
-            data=json.dumps({
+            json={
                 "model": "deepseek/deepseek-chat-v3-0324:free",
                 "messages": [
                     {"role": "system", "content": system_prompt}
                 ]
-            })
+            },
+            timeout=LYRICS_TIMEOUT,
         )
         data = response.json()
         lyrics = data["choices"][0]["message"]["content"]
@@ -78,7 +80,7 @@ class SunoService:
     async def generate_suno(self, prompt, style, task_id_get):
         # Генерируем лирику с таймкодами через OpenRouter
         logging.info(f"Diffrhythm: начинаем генерацию лирики для темы '{prompt}' в стиле '{style}'")
-        lyrics = self.generate_lyrics_with_timestamps(prompt, style)
+        lyrics = await self.generate_lyrics_with_timestamps(prompt, style)
         logging.info(f"Diffrhythm: сгенерирована лирика длиной {len(lyrics)} символов")
         
         # 1. Create the task using the new /api/v1/task endpoint
@@ -91,10 +93,7 @@ class SunoService:
                 "style_audio": ""
             },
             "config": {
-                "webhook_config": {
-                    "endpoint": "",
-                    "secret": ""
-                }
+                "webhook_config": taskTracker.webhook_config()
             }
         }
         headers = {
@@ -119,34 +118,34 @@ class SunoService:
         logging.info(f"Diffrhythm: создан task_id: {task_id}")
         if task_id:
             await task_id_get(task_id)
-        attempts = 0
-        max_attempts = 30  # Увеличиваем с 15 до 30 попыток (15 минут)
-        while True:
-            if attempts >= max_attempts:
-                logging.error(f"Diffrhythm: превышено число попыток ожидания результата для task_id {task_id} (максимум {max_attempts} попыток)")
-                return {}
-            await asyncio.sleep(30)
-            attempts += 1
-            result = await self.task_fetch(task_id)
-            status = result.get('data', {}).get('status')
-            logging.info(f"Diffrhythm: polling attempt {attempts}/{max_attempts}, статус: {status}, task_id: {task_id}")
-            
-            if status == "pending":
-                logging.info(f"Diffrhythm: задача {task_id} все еще в очереди...")
-                continue
-            elif status == "processing":
-                logging.info(f"Diffrhythm: задача {task_id} обрабатывается...")
-                continue
-            elif status == "completed":
-                logging.info(f"Diffrhythm: задача {task_id} завершена успешно!")
-                return result
-            elif status == "failed":
-                error_msg = result.get('data', {}).get('error', {}).get('message', 'Unknown error')
-                logging.error(f"Diffrhythm: задача {task_id} завершилась с ошибкой: {error_msg}")
-                return result
-            else:
-                logging.warning(f"Diffrhythm: неизвестный статус {status} для задачи {task_id}")
-                continue
+        return await self.wait_task(task_id)
+
+    async def wait_task(self, task_id, first_poll_delay=None, elapsed=0.0):
+        # Результат приходит webhook-ом, общий поллер - запасной путь (не дольше 15 минут)
+        result = await taskTracker.wait(
+            task_id,
+            fetch=lambda: self.task_fetch(task_id),
+            is_done=lambda fetched: fetched.get('data', {}).get('status') in ("completed", "failed"),
+            model="suno",
+            min_interval=10,
+            max_interval=30,
+            timeout=900,
+            first_poll_delay=first_poll_delay,
+            elapsed=elapsed,
+        )
+
+        if result is None:
+            logging.error(f"Diffrhythm: превышено время ожидания результата для task_id {task_id}")
+            return {}
+
+        status = result.get('data', {}).get('status')
+        if status == "failed":
+            error_msg = result.get('data', {}).get('error', {}).get('message', 'Unknown error')
+            logging.error(f"Diffrhythm: задача {task_id} завершилась с ошибкой: {error_msg}")
+        else:
+            logging.info(f"Diffrhythm: задача {task_id} завершена успешно!")
+
+        return result
 
     async def task_fetch(self, task_id):
         # 4. Updated polling endpoint
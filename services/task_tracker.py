@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from config import GOAPI_WEBHOOK_ENABLED, GOAPI_WEBHOOK_URL, GOAPI_WEBHOOK_PATH, GOAPI_WEBHOOK_SECRET, TASK_POLL_TICK, \
+    TASK_POLL_CONCURRENCY, TASK_POLL_BACKOFF, TASK_POLL_JITTER
+
+
+class CompletionStats:
+    """Сколько секунд задачи одной модели шли до готовности (последние window завершений)"""
+
+    MIN_SAMPLES = 5
+
+    def __init__(self, window: int = 100):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.MIN_SAMPLES:
+            return None
+
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TrackedTask:
+    def __init__(self, task_id: str, fetch: Callable[[], Awaitable[Any]], is_done: Callable[[Any], bool],
+                 model: str, min_interval: float, max_interval: float, timeout: float, elapsed: float):
+        self.task_id = task_id
+        self.fetch = fetch
+        self.is_done = is_done
+        self.model = model
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.started_at = time.monotonic() - elapsed
+        self.deadline = self.started_at + timeout
+        self.backoff_interval = min_interval
+        self.next_poll_at = 0.0
+        self.future = asyncio.get_running_loop().create_future()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def resolve(self, result):
+        if not self.future.done():
+            self.future.set_result(result)
+
+
+class TaskTracker:
+    """
+    Ожидание задач GoAPI без отдельного спящего цикла на каждую генерацию:
+    результат приходит webhook-ом (если заданы GOAPI_WEBHOOK_URL и GOAPI_WEBHOOK_SECRET), а один общий поллер
+    спит до ближайшей проверки по куче сроков и опрашивает пачкой все задачи,
+    у которых срок наступает в пределах TASK_POLL_TICK.
+
+    Интервалы не фиксированные: по завершенным задачам каждой модели копится распределение
+    времени генерации, частые опросы приходятся на окно, где задачи обычно готовы,
+    до него - одна проверка к началу окна, после - экспоненциальная пауза с разбросом.
+    """
+
+    EARLY_QUANTILE = 0.25
+    LATE_QUANTILE = 0.9
+    POLLS_PER_WINDOW = 4
+
+    def __init__(self):
+        self.tasks: Dict[str, TrackedTask] = {}
+        self.stats: Dict[str, CompletionStats] = {}
+        self.schedule: List[Tuple[float, int, TrackedTask]] = []
+        self.counter = itertools.count()
+        self.wakeup: Optional[asyncio.Event] = None
+        self.poller: Optional[asyncio.Task] = None
+        # Ссылки на идущие опросы: иначе задачу без ссылок может собрать GC
+        self.polls: Set[asyncio.Task] = set()
+        # Кого известить о сроке следующей проверки (task_id, время по time.time())
+        self.schedule_listeners: List[Callable[[str, float], Awaitable[None]]] = []
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+    def webhook_config(self) -> Dict[str, str]:
+        """webhook_config для задач /api/v1/task (пустой endpoint - GoAPI не будет вызывать webhook)"""
+        if not GOAPI_WEBHOOK_ENABLED:
+            return {"endpoint": "", "secret": ""}
+
+        return {"endpoint": GOAPI_WEBHOOK_URL.rstrip("/") + GOAPI_WEBHOOK_PATH, "secret": GOAPI_WEBHOOK_SECRET}
+
+    async def wait(self, task_id: str, fetch: Callable[[], Awaitable[Any]], is_done: Callable[[Any], bool],
+                   model: str, min_interval: float, max_interval: float, timeout: float,
+                   first_poll_delay: Optional[float] = None, elapsed: float = 0.0):
+        """
+        Дождаться результата задачи. None - если за timeout секунд с момента запуска задача не завершилась.
+        elapsed - сколько задача уже идет (например, если ожидание возобновлено после перезапуска)
+        """
+        task = TrackedTask(task_id, fetch, is_done, model, min_interval, max_interval, timeout, elapsed)
+        self.tasks[task_id] = task
+        self._ensure_poller()
+
+        delay = self._next_delay(task) if first_poll_delay is None else first_poll_delay
+        self._schedule(task, delay)
+
+        try:
+            return await task.future
+        finally:
+            if self.tasks.get(task_id) is task:
+                del self.tasks[task_id]
+
+    def resolve(self, task_id: str, result) -> bool:
+        """Результат задачи, пришедший извне (webhook). True, если его кто-то ждал и задача завершена"""
+        task = self.tasks.get(task_id)
+
+        if task is None or not task.is_done(result):
+            return False
+
+        self._complete(task, result)
+        return True
+
+    def add_schedule_listener(self, listener: Callable[[str, float], Awaitable[None]]):
+        """listener вызывается после каждой неудачной проверки с временем следующей (например, чтобы сохранить его)"""
+        self.schedule_listeners.append(listener)
+
+    def stop(self):
+        if self.poller is not None:
+            self.poller.cancel()
+            self.poller = None
+
+    def _ensure_poller(self):
+        if self.poller is None or self.poller.done():
+            self.semaphore = asyncio.Semaphore(TASK_POLL_CONCURRENCY)
+            self.wakeup = asyncio.Event()
+            self.poller = asyncio.ensure_future(self._run_poller())
+
+    def _schedule(self, task: TrackedTask, delay: float):
+        now = time.monotonic()
+        # Последняя проверка - ровно на дедлайне, чтобы не ждать лишнего
+        task.next_poll_at = min(now + max(0.0, delay), max(now, task.deadline))
+        heapq.heappush(self.schedule, (task.next_poll_at, next(self.counter), task))
+
+        if self.schedule[0][2] is task:
+            self.wakeup.set()
+
+    def _next_delay(self, task: TrackedTask) -> float:
+        stats = self.stats.get(task.model)
+        early = stats.quantile(self.EARLY_QUANTILE) if stats else None
+        late = stats.quantile(self.LATE_QUANTILE) if stats else None
+        elapsed = task.elapsed()
+
+        if early is not None and elapsed < early:
+            # Раньше, чем обычно готовятся задачи этой модели, спрашивать бесполезно
+            return early - elapsed
+
+        if early is not None and elapsed < late:
+            delay = max(task.min_interval, (late - early) / self.POLLS_PER_WINDOW)
+        else:
+            delay = task.backoff_interval
+            task.backoff_interval = min(task.max_interval, task.backoff_interval * TASK_POLL_BACKOFF)
+
+        # Разброс, чтобы задачи, запущенные одновременно, не опрашивались одной пачкой раз за разом
+        return min(task.max_interval, delay) * random.uniform(1 - TASK_POLL_JITTER, 1 + TASK_POLL_JITTER)
+
+    def _complete(self, task: TrackedTask, result):
+        if task.future.done():
+            return
+
+        self.stats.setdefault(task.model, CompletionStats()).add(task.elapsed())
+        task.resolve(result)
+
+    async def _run_poller(self):
+        while True:
+            timeout = self.schedule[0][0] - time.monotonic() if self.schedule else None
+
+            if timeout is None or timeout > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Все, у кого срок наступает в пределах тика, опрашиваются одной пачкой
+            horizon = time.monotonic() + TASK_POLL_TICK
+            while self.schedule and self.schedule[0][0] <= horizon:
+                poll_at, _, task = heapq.heappop(self.schedule)
+
+                if task.future.done() or poll_at != task.next_poll_at:
+                    continue
+
+                poll = asyncio.ensure_future(self._poll(task))
+                self.polls.add(poll)
+                poll.add_done_callback(self.polls.discard)
+
+    async def _poll(self, task: TrackedTask):
+        try:
+            async with self.semaphore:
+                result = await task.fetch()
+
+            if task.is_done(result):
+                self._complete(task, result)
+                return
+        except Exception as e:
+            logging.error(f"Failed to poll task {task.task_id}: {e}")
+
+        if task.future.done():
+            return
+
+        if time.monotonic() >= task.deadline:
+            task.resolve(None)
+            return
+
+        self._schedule(task, self._next_delay(task))
+        next_poll_at = time.time() + task.next_poll_at - time.monotonic()
+
+        for listener in self.schedule_listeners:
+            try:
+                await listener(task.task_id, next_poll_at)
+            except Exception as e:
+                logging.error(f"Schedule listener failed for task {task.task_id}: {e}")
+
+
+taskTracker = TaskTracker()
@@ -1,6 +1,10 @@
+import logging
+import time
+from typing import Optional
+
 from bot.utils import get_user_name
-from config import PROXY_URL, ADMIN_TOKEN
-from db import data_base, db_key
+from config import PROXY_URL, ADMIN_TOKEN, BALANCE_CACHE_TTL
+from db import db_cache, db_key, user_settings
 from services.utils import async_get, async_post, async_delete, async_put
 
 max_tokens = 50000
@@ -11,24 +15,65 @@ headers = {'Content-Type': 'application/json'}
 class TokenizeService:
     LAST_CHECK_DATE = "last_check_date"
 
-    def get_check_date(self, user_id: str):
+    def __init__(self):
+        # userId в прокси -> (время истечения, ответ /token)
+        self.balance_cache = {}
+
+    async def get_check_date(self, user_id: str):
         try:
-            return data_base[db_key(user_id, self.LAST_CHECK_DATE)].decode('utf-8')
+            return (await db_cache.get(db_key(user_id, self.LAST_CHECK_DATE))).decode('utf-8')
         except KeyError:
             return None
 
-    def set_check_date(self, user_id, value):
-        with data_base.transaction():
-            data_base[db_key(user_id, self.LAST_CHECK_DATE)] = value
-        data_base.commit()
+    async def set_check_date(self, user_id, value):
+        db_cache.set(db_key(user_id, self.LAST_CHECK_DATE), value)
+
+    async def get_tokens(self, user_id: str, fresh: bool = False):
+        if not fresh:
+            cached = self.get_cached_tokens(user_id)
+            if cached is not None:
+                return cached
 
-    async def get_tokens(self, user_id: str):
         user_token = await self.get_user_tokens(user_id)
         if user_token is not None:
             return user_token
-        else:
-            await self.create_new_token(user_id)
-            return await self.get_user_tokens(user_id)
+
+        created_token = await self.create_new_token(user_id)
+        if created_token is not None and "tokens_gpt" in created_token:
+            return self.remember_tokens(user_id, created_token)
+
+        return await self.get_user_tokens(user_id)
+
+    # ========== Кеш баланса ==========
+
+    def get_cached_tokens(self, user_id: str) -> Optional[dict]:
+        cached = self.balance_cache.get(get_user_name(user_id))
+        if cached is None:
+            return None
+
+        expires_at, data = cached
+        if expires_at < time.monotonic():
+            self.balance_cache.pop(get_user_name(user_id), None)
+            return None
+
+        return data
+
+    def remember_tokens(self, user_id: str, data: dict) -> dict:
+        """Сохранить ответ /token (или его часть с tokens_gpt) в кеш на BALANCE_CACHE_TTL секунд"""
+        cached = self.get_cached_tokens(user_id) or {}
+        data = {**cached, **data, "tokens": data["tokens_gpt"]}
+
+        if BALANCE_CACHE_TTL > 0:
+            self.balance_cache[get_user_name(user_id)] = (time.monotonic() + BALANCE_CACHE_TTL, data)
+
+        return data
+
+    def remember_balance(self, user_id: str, tokens: int) -> dict:
+        return self.remember_tokens(user_id, {"tokens_gpt": tokens})
+
+    def invalidate_tokens(self, *user_ids: str):
+        for user_id in user_ids:
+            self.balance_cache.pop(get_user_name(user_id), None)
 
     async def create_new_token(self, user_id: str):
         payload = {
@@ -53,7 +98,7 @@ class TokenizeService:
         if response.status_code == 200:
             data = response.json()
             if "id" in data:
-                return {**data, "tokens": response.json()["tokens_gpt"]}
+                return self.remember_tokens(user_id, data)
 
         return None
 
@@ -68,10 +113,15 @@ class TokenizeService:
             "amount": tokens
         }
 
+        self.invalidate_tokens(user_id)
+
         response = await async_put(f"{PROXY_URL}/token", params=params, json=json, headers=headers)
 
         if response.status_code == 200:
-            return response.json()
+            data = response.json()
+            if isinstance(data, dict) and "tokens_gpt" in data:
+                self.remember_tokens(user_id, data)
+            return data
         else:
             return None
 
@@ -128,9 +178,7 @@ class TokenizeService:
 
     # ========== AdLean Integration: Request Counter ==========
     
-    REQUESTS_COUNT_KEY = "requests_count"
-
-    def get_requests_count(self, user_id: str) -> int:
+    async def get_requests_count(self, user_id: str) -> int:
         """
         Получить количество запросов пользователя
         
@@ -141,16 +189,12 @@ class TokenizeService:
             int: Количество запросов (0 если пользователь новый)
         """
         try:
-            count = data_base[db_key(user_id, self.REQUESTS_COUNT_KEY)].decode('utf-8')
-            return int(count)
-        except KeyError:
-            # Пользователь новый, счетчик = 0
-            return 0
+            return (await user_settings.get(user_id)).requests_count
         except Exception as e:
-            print(f"[TokenizeService] Error getting requests count: {e}")
+            logging.error("[TokenizeService] Error getting requests count: %s", e)
             return 0
 
-    def increment_requests_count(self, user_id: str) -> int:
+    async def increment_requests_count(self, user_id: str) -> int:
         """
         Увеличить счетчик запросов на 1
         
@@ -160,27 +204,23 @@ class TokenizeService:
         Returns:
             int: Новое значение счетчика
         """
-        current_count = self.get_requests_count(user_id)
-        new_count = current_count + 1
-        
-        with data_base.transaction():
-            data_base[db_key(user_id, self.REQUESTS_COUNT_KEY)] = str(new_count)
-        data_base.commit()
-        
-        print(f"[TokenizeService] User {user_id} requests count: {new_count}")
+        settings = await user_settings.update(
+            user_id, lambda current: {"requests_count": current.requests_count + 1}
+        )
+        new_count = settings.requests_count
+
+        logging.debug("[TokenizeService] User %s requests count: %s", user_id, new_count)
         return new_count
 
-    def reset_requests_count(self, user_id: str):
+    async def reset_requests_count(self, user_id: str):
         """
         Сбросить счетчик запросов (опционально)
         
         Args:
             user_id: ID пользователя Telegram
         """
-        with data_base.transaction():
-            data_base[db_key(user_id, self.REQUESTS_COUNT_KEY)] = "0"
-        data_base.commit()
-        print(f"[TokenizeService] User {user_id} requests count reset")
+        await user_settings.update(user_id, requests_count=0)
+        logging.debug("[TokenizeService] User %s requests count reset", user_id)
 
 
 tokenizeService = TokenizeService()
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+
+from config import TRANSCODE_CONCURRENCY, TRANSCODE_TIMEOUT, TRANSCODE_CACHE_DIR, TRANSCODE_CACHE_MAX_FILES
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class TranscodingService:
+    """
+    Перекодирование аудио отдельным процессом ffmpeg: файл читается и пишется потоково,
+    PCM в память Python не попадает. Одновременно работает не больше concurrency процессов,
+    результаты кешируются на диске по sha256 исходного файла.
+    """
+
+    def __init__(self, cache_dir: str, concurrency: int, timeout: float, max_cached_files: int):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.max_cached_files = max_cached_files
+        self.concurrency = concurrency
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        # sha256 файлов, которые сейчас отправляются: вытеснение их не трогает
+        self.pinned: Dict[str, int] = {}
+        self.ffmpeg = shutil.which("ffmpeg") or "ffmpeg"
+
+    async def to_mp3(self, source_path: str, source_hash: Optional[str] = None) -> str:
+        """
+        Путь к mp3-версии файла. Файл принадлежит кешу: его можно отправлять, но не удалять,
+        а чтобы его не вытеснили до конца отправки - держать внутри pin(source_hash).
+        source_hash - sha256 исходного файла, если он уже посчитан
+        """
+        if source_hash is None:
+            source_hash = await asyncio.get_running_loop().run_in_executor(None, file_sha256, source_path)
+
+        target_path = os.path.join(self.cache_dir, source_hash + ".mp3")
+
+        if os.path.exists(target_path):
+            os.utime(target_path)
+            return target_path
+
+        # Одинаковые файлы, пришедшие одновременно, перекодируются один раз
+        if source_hash not in self.in_flight:
+            self.in_flight[source_hash] = asyncio.ensure_future(self._transcode(source_path, target_path))
+            self.in_flight[source_hash].add_done_callback(lambda _: self.in_flight.pop(source_hash, None))
+
+        await asyncio.shield(self.in_flight[source_hash])
+        return target_path
+
+    @contextmanager
+    def pin(self, source_hash: str):
+        """Не вытеснять mp3-версию файла с этим sha256, пока блок не завершится"""
+        self.pinned[source_hash] = self.pinned.get(source_hash, 0) + 1
+        try:
+            yield
+        finally:
+            self.pinned[source_hash] -= 1
+            if not self.pinned[source_hash]:
+                del self.pinned[source_hash]
+
+    async def _transcode(self, source_path: str, target_path: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(suffix=".part", dir=self.cache_dir)
+        os.close(fd)
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        try:
+            async with self.semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    self.ffmpeg, "-nostdin", "-y", "-loglevel", "error",
+                    "-i", source_path,
+                    "-vn", "-codec:a", "libmp3lame", "-q:a", "2", "-f", "mp3",
+                    partial_path,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+
+                try:
+                    _, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+                except BaseException:
+                    if process.returncode is None:
+                        process.kill()
+                        await process.wait()
+                    raise
+
+            if process.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='replace')[-500:]}")
+
+            os.replace(partial_path, target_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        await asyncio.get_running_loop().run_in_executor(None, self._evict, set(self.pinned))
+
+    def _evict(self, pinned: Set[str]):
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir)
+                       if entry.name.endswith(".mp3") and entry.name[:-len(".mp3")] not in pinned]
+        except FileNotFoundError:
+            return
+
+        if len(entries) <= self.max_cached_files:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+
+        for entry in entries[:len(entries) - self.max_cached_files]:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logging.warning(f"Failed to evict transcoded file {entry.path}: {e}")
+
+
+transcodingService = TranscodingService(
+    cache_dir=TRANSCODE_CACHE_DIR,
+    concurrency=TRANSCODE_CONCURRENCY,
+    timeout=TRANSCODE_TIMEOUT,
+    max_cached_files=TRANSCODE_CACHE_MAX_FILES,
+)
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import math
+import tempfile
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config import PROXY_URL, TRANSCRIPTION_CONCURRENCY, TRANSCRIPTION_MAX_PENDING_PER_USER
+from services.tokenize_service import tokenizeService
+from services.utils import get_openai_client
+
+# Стоимость распознавания: 15⚡️ за секунду аудио
+ENERGY_PER_SECOND = 15
+# Аудио до этого размера скачивается в память, больше - во временный файл
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+
+class TranscriptionJob:
+    def __init__(self, user_id, bot, file_id: str, duration: int):
+        self.user_id = user_id
+        self.bot = bot
+        self.file_id = file_id
+        self.duration = duration
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class TranscriptionService:
+    """
+    Распознавание голосовых через Whisper. Запросы встают в очередь, которую разбирают
+    concurrency воркеров по кругу между пользователями: много голосовых от одного
+    пользователя не задерживают остальных.
+    """
+
+    def __init__(self, concurrency: int, max_pending_per_user: int):
+        self.concurrency = concurrency
+        self.max_pending_per_user = max_pending_per_user
+        self.pending: Dict[str, Deque[TranscriptionJob]] = {}
+        self.ready_users: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+
+    @staticmethod
+    def estimate_energy(duration: int) -> int:
+        """Стоимость по длительности, которую Telegram сообщает еще до скачивания файла"""
+        return math.ceil(max(duration or 0, 1) * ENERGY_PER_SECOND)
+
+    async def transcribe(self, user_id, bot, file_id: str, duration: int) -> dict:
+        key = str(user_id)
+        queue = self.pending.get(key)
+
+        if queue is not None and len(queue) >= self.max_pending_per_user:
+            return {"success": False, "text": "⌛️ Дождитесь распознавания предыдущих голосовых сообщений."}
+
+        self._ensure_workers()
+        job = TranscriptionJob(user_id, bot, file_id, duration)
+
+        if queue is None:
+            self.pending[key] = deque([job])
+            self.ready_users.put_nowait(key)
+        else:
+            queue.append(job)
+
+        return await job.future
+
+    def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    def _ensure_workers(self):
+        if self.workers:
+            return
+
+        self.ready_users = asyncio.Queue()
+        self.workers = [asyncio.ensure_future(self._run_worker()) for _ in range(self.concurrency)]
+
+    async def _run_worker(self):
+        while True:
+            key = await self.ready_users.get()
+            queue = self.pending[key]
+            job = queue.popleft()
+
+            # Следующее голосовое этого пользователя - в конец круга
+            if queue:
+                self.ready_users.put_nowait(key)
+            else:
+                del self.pending[key]
+
+            if job.future.done():
+                continue
+
+            try:
+                result = await self._transcribe(job)
+            except Exception as e:
+                logging.error(f"Failed to transcribe voice for user {job.user_id}: {e}")
+                result = {"success": False, "text": "Error: Голосовое сообщение не распознано"}
+
+            if not job.future.done():
+                job.future.set_result(result)
+
+    async def _transcribe(self, job: TranscriptionJob) -> dict:
+        token = await tokenizeService.get_token(job.user_id)
+        client = get_openai_client(f"{PROXY_URL}/v1/", token["id"])
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as audio:
+            # Файл приходит от Telegram частями и не собирается в одну строку байтов
+            await job.bot.download(job.file_id, destination=audio)
+            audio.seek(0)
+
+            transcription = await client.audio.transcriptions.create(
+                file=('audio.ogg', audio, 'audio/ogg'),
+                model="whisper-1",
+                language="ru",
+            )
+
+        duration = getattr(transcription, "duration", None) or job.duration
+        return {"success": True, "text": transcription.text, 'energy': int(duration * ENERGY_PER_SECOND)}
+
+
+transcriptionService = TranscriptionService(
+    concurrency=TRANSCRIPTION_CONCURRENCY,
+    max_pending_per_user=TRANSCRIPTION_MAX_PENDING_PER_USER,
+)
@@ -1,5 +1,6 @@
 from typing import Dict, List, Optional
 from config import PROXY_URL, ADMIN_TOKEN
+from services.tokenize_service import tokenizeService
 from services.utils import async_get, async_post
 from bot.utils import get_user_name
 
@@ -109,6 +110,7 @@ class TransferService:
         )
         
         if response.status_code == 200:
+            tokenizeService.invalidate_tokens(sender_id, receiver_id)
             return {"success": True, "data": response.json()}
         else:
             error_data = response.json()
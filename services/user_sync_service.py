@@ -2,12 +2,13 @@
 Сервис синхронизации данных пользователей из Telegram в БД
 """
 import asyncio
-import sys
+import logging
 from typing import Dict, List
 from aiogram import Bot
 from aiogram.exceptions import TelegramAPIError
 
 from config import ADMIN_TOKEN, PROXY_URL
+from services.logging_service import LazyJson
 from services.utils import async_post, async_get
 from bot.utils import get_user_name
 
@@ -27,7 +28,6 @@ class UserSyncService:
         """
         try:
             params = {"masterToken": ADMIN_TOKEN}
-            print(f"   🌐 GET {PROXY_URL}/tokens")
             response = await async_get(
                 f"{PROXY_URL}/tokens",
                 params=params
@@ -35,18 +35,15 @@ class UserSyncService:
             
             if response.status_code == 200:
                 data = response.json()
-                print(f"   📦 Raw response data: {data}")
+                logging.debug("Raw response data: %s", LazyJson(data))
                 tokens = data.get("tokens", [])
-                print(f"   ✅ Получено {len(tokens)} пользователей")
-                if tokens:
-                    print(f"   🔎 Первый элемент (type={type(tokens[0])}): {tokens[0]}")
+                logging.info("✅ Получено %s пользователей", len(tokens))
                 return tokens
             else:
-                print(f"   ❌ Ошибка API: статус {response.status_code}")
-                print(f"   Response: {response.text}")
+                logging.error("❌ Ошибка API: статус %s, ответ: %s", response.status_code, response.text[:500])
                 return []
         except Exception as e:
-            print(f"   ❌ Исключение при запросе к API: {e}")
+            logging.error("❌ Исключение при запросе к API: %s", e)
             return []
     
     async def sync_user_data(self, user_id: str, username: str = None, full_name: str = None) -> bool:
@@ -75,11 +72,9 @@ class UserSyncService:
             
             # Если нет данных для обновления, пропускаем
             if not payload["userData"]:
-                print(f"      ⚠️  Нет данных для обновления")
                 return True
             
-            print(f"      🌐 POST {PROXY_URL}/tokens/sync")
-            print(f"      📦 Payload: {payload}")
+            logging.debug("POST %s/tokens/sync payload: %s", PROXY_URL, LazyJson(payload, indent=None))
             
             response = await async_post(
                 f"{PROXY_URL}/tokens/sync",
@@ -88,14 +83,13 @@ class UserSyncService:
             )
             
             if response.status_code == 200:
-                print(f"      ✅ API ответил успешно (200)")
                 return True
             else:
-                print(f"      ❌ Ошибка API: статус {response.status_code}")
-                print(f"      Response: {response.text}")
+                logging.error("❌ Ошибка синхронизации %s: статус %s, ответ: %s", user_id, response.status_code,
+                              response.text[:500])
                 return False
         except Exception as e:
-            print(f"      ❌ Исключение при синхронизации: {e}")
+            logging.error("❌ Исключение при синхронизации %s: %s", user_id, e)
             return False
     
     async def fetch_telegram_data(self, user_id: str) -> Dict:
@@ -126,10 +120,10 @@ class UserSyncService:
                 "success": True
             }
         except TelegramAPIError as e:
-            print(f"Telegram API error for user {user_id}: {e}")
+            logging.warning("Telegram API error for user %s: %s", user_id, e)
             return {"username": None, "full_name": None, "success": False}
         except Exception as e:
-            print(f"Error fetching Telegram data for user {user_id}: {e}")
+            logging.error("Error fetching Telegram data for user %s: %s", user_id, e)
             return {"username": None, "full_name": None, "success": False}
     
     async def lazy_sync_user(self, user_id: str, username: str = None, full_name: str = None) -> bool:
@@ -187,10 +181,6 @@ class UserSyncService:
         current_username = user.get("username")
         current_full_name = user.get("full_name")
         
-        print(f"🔍 Проверка пользователя {user_id}:")
-        print(f"   - Current username: {current_username}")
-        print(f"   - Current full_name: {current_full_name}")
-        
         # Проверить нужна ли синхронизация
         needs_sync = False
         reason_parts = []
@@ -198,21 +188,17 @@ class UserSyncService:
         if not current_username or current_username == user_id:
             needs_sync = True
             reason_parts.append("no username")
-            print(f"   ⚠️  Нужна синхронизация: нет username")
         
         if not current_full_name or current_full_name == "Unknown User":
             needs_sync = True
             reason_parts.append("no full_name")
-            print(f"   ⚠️  Нужна синхронизация: нет full_name")
         
         # Проверка на неправильный формат (когда full_name содержит @)
         if current_full_name and current_full_name.startswith("@"):
             needs_sync = True
             reason_parts.append("full_name contains @")
-            print(f"   ⚠️  Нужна синхронизация: full_name содержит @ ({current_full_name})")
         
         if not needs_sync:
-            print(f"   ✅ Пропуск: данные валидны")
             return {
                 "user_id": user_id,
                 "status": "skipped",
@@ -221,11 +207,11 @@ class UserSyncService:
             }
         
         # Получить актуальные данные из Telegram
-        print(f"   📡 Запрос данных из Telegram API...")
+        logging.debug("🔍 Пользователь %s: username=%s, full_name=%s, нужна синхронизация: %s", user_id,
+                      current_username, current_full_name, ", ".join(reason_parts))
         telegram_data = await self.fetch_telegram_data(user_id)
         
         if not telegram_data["success"]:
-            print(f"   ❌ Не удалось получить данные из Telegram")
             return {
                 "user_id": user_id,
                 "status": "failed",
@@ -233,12 +219,7 @@ class UserSyncService:
                 "reason": "failed to fetch from Telegram"
             }
         
-        print(f"   📥 Данные из Telegram:")
-        print(f"      - Username: {telegram_data['username']}")
-        print(f"      - Full name: {telegram_data['full_name']}")
-        
         # Синхронизировать в БД
-        print(f"   💾 Сохранение в БД...")
         sync_success = await self.sync_user_data(
             user_id,
             username=telegram_data["username"],
@@ -246,7 +227,6 @@ class UserSyncService:
         )
         
         if sync_success:
-            print(f"   ✅ Успешно синхронизирован!")
             return {
                 "user_id": user_id,
                 "status": "synced",
@@ -254,7 +234,6 @@ class UserSyncService:
                 "reason": ", ".join(reason_parts)
             }
         else:
-            print(f"   ❌ Ошибка при сохранении в БД")
             return {
                 "user_id": user_id,
                 "status": "failed",
@@ -278,18 +257,13 @@ class UserSyncService:
                 "details": List[Dict]
             }
         """
-        print("\n" + "="*60, flush=True)
-        print("🔄 НАЧАЛО СИНХРОНИЗАЦИИ ПОЛЬЗОВАТЕЛЕЙ", flush=True)
-        print("="*60 + "\n", flush=True)
-        sys.stdout.flush()
+        logging.info("🔄 Начало синхронизации пользователей")
         
         # Получить всех пользователей
-        print("📡 Запрос всех пользователей из БД через API...")
         users = await self.get_all_users()
         
         if not users:
-            print("⚠️  НЕ НАЙДЕНО ПОЛЬЗОВАТЕЛЕЙ В БД!")
-            print("="*60 + "\n")
+            logging.warning("⚠️  Не найдено пользователей в БД")
             return {
                 "total": 0,
                 "synced": 0,
@@ -298,8 +272,7 @@ class UserSyncService:
                 "details": []
             }
         
-        print(f"📊 Найдено пользователей в БД: {len(users)}")
-        print(f"⚙️  Максимум одновременных запросов: {max_concurrent}\n")
+        logging.info("📊 Найдено пользователей в БД: %s, одновременных запросов: %s", len(users), max_concurrent)
         
         # Синхронизация с ограничением конкурентности
         results = []
@@ -322,7 +295,7 @@ class UserSyncService:
         for result in results:
             if isinstance(result, Exception):
                 failed += 1
-                print(f"\n❌ ИСКЛЮЧЕНИЕ при синхронизации: {result}\n")
+                logging.error("❌ Исключение при синхронизации: %s", result)
                 continue
             
             if result["status"] == "synced":
@@ -342,14 +315,8 @@ class UserSyncService:
             "details": details
         }
         
-        print("\n" + "="*60)
-        print("📈 РЕЗУЛЬТАТЫ СИНХРОНИЗАЦИИ:")
-        print("="*60)
-        print(f"   Всего пользователей: {summary['total']}")
-        print(f"   ✅ Синхронизировано: {summary['synced']}")
-        print(f"   ⏭️  Пропущено (данные валидны): {summary['skipped']}")
-        print(f"   ❌ Ошибок: {summary['failed']}")
-        print("="*60 + "\n")
+        logging.info("📈 Результаты синхронизации: всего %s, синхронизировано %s, пропущено %s, ошибок %s",
+                     summary["total"], summary["synced"], summary["skipped"], summary["failed"])
         
         return summary
 
@@ -1,6 +1,17 @@
 import httpx
 import config
 import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Tuple
+
+from openai import AsyncOpenAI
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 
 def get_httpx_client_kwargs():
@@ -13,38 +24,243 @@ def get_httpx_client_kwargs():
     return kwargs
 
 
+# ========== Пул HTTP-клиентов ==========
+
+class HttpPoolStats:
+    """Счетчики использования пула соединений (общие для всех хостов)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.hits = 0
+        self.waits = 0
+        self.new_connections = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "waits": self.waits,
+            "new_connections": self.new_connections,
+        }
+
+
+http_pool_stats = HttpPoolStats()
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """
+    Транспорт httpx, который перед каждым запросом смотрит на состояние пула:
+    есть свободное keep-alive соединение - hit, есть место под новое - new_connection,
+    иначе запрос будет ждать освобождения соединения - wait.
+    """
+
+    def __init__(self, max_connections: int, **kwargs):
+        super().__init__(**kwargs)
+        self.max_connections = max_connections
+        # Запросы, которые уже вошли в транспорт, но еще не получили ответ
+        self.in_flight = 0
+
+    async def handle_async_request(self, request):
+        connections = self._pool.connections
+        available = sum(1 for connection in connections if connection.is_available())
+
+        http_pool_stats.requests += 1
+        if available > self.in_flight:
+            http_pool_stats.hits += 1
+        elif len(connections) + self.in_flight < self.max_connections:
+            http_pool_stats.new_connections += 1
+        else:
+            http_pool_stats.waits += 1
+
+        self.in_flight += 1
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self.in_flight -= 1
+
+
+# Один клиент на хост: у каждого свой пул и свои лимиты keep-alive
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    max_connections = config.HTTP_POOL_MAX_CONNECTIONS_PER_HOST
+
+    transport = PooledTransport(
+        max_connections=max_connections,
+        http2=config.HTTP2_ENABLED and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=config.HTTP_POOL_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=config.HTTP_POOL_KEEPALIVE_EXPIRY,
+        ),
+        **get_httpx_client_kwargs()
+    )
+
+    return httpx.AsyncClient(transport=transport)
+
+
+def _host_key(url) -> str:
+    parsed_url = httpx.URL(str(url))
+    return f"{parsed_url.scheme}://{parsed_url.netloc.decode('ascii')}"
+
+
+def get_http_client(url) -> httpx.AsyncClient:
+    """
+    Получить общий клиент для хоста из url (создается при первом обращении)
+
+    Args:
+        url: Адрес запроса или базовый адрес сервиса
+
+    Returns:
+        httpx.AsyncClient с пулом соединений для этого хоста
+    """
+    host_key = _host_key(url)
+
+    client = _http_clients.get(host_key)
+    if client is None or client.is_closed:
+        client = _create_http_client()
+        _http_clients[host_key] = client
+
+    return client
+
+
+def set_http_client(url, client: httpx.AsyncClient):
+    """
+    Подставить свой клиент для хоста из url (например, с httpx.MockTransport в проверочных скриптах)
+
+    Args:
+        url: Адрес запроса или базовый адрес сервиса
+        client: Клиент, который get_http_client будет отдавать для этого хоста
+    """
+    _http_clients[_host_key(url)] = client
+
+
+async def init_http_pool():
+    """Подготовить пул при старте бота: сбросить счетчики и создать клиент для прокси"""
+    http_pool_stats.reset()
+    get_http_client(config.PROXY_URL)
+
+
+async def close_http_pool():
+    """Закрыть все соединения пула при остановке бота"""
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+
+    for client in clients:
+        await client.aclose()
+
+
+def get_http_pool_stats() -> Dict[str, int]:
+    return {**http_pool_stats.as_dict(), "hosts": len(_http_clients)}
+
+
+# ========== Клиенты OpenAI ==========
+
+# Ключ у каждого пользователя свой, поэтому клиентов несколько, но соединения у всех общие - из пула хоста
+_openai_clients: "OrderedDict[Tuple[str, str], AsyncOpenAI]" = OrderedDict()
+_OPENAI_CLIENTS_MAX = 1000
+
+
+def get_openai_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """AsyncOpenAI для base_url и ключа, работающий поверх общего пула соединений"""
+    key = (base_url, api_key)
+    client = _openai_clients.get(key)
+
+    if client is None or client.is_closed():
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=get_http_client(base_url))
+        _openai_clients[key] = client
+
+    _openai_clients.move_to_end(key)
+    while len(_openai_clients) > _OPENAI_CLIENTS_MAX:
+        _openai_clients.popitem(last=False)
+
+    return client
+
+
 async def async_post(url, data=None, json=None, headers=None, timeout=None, files=None, params=None):
-    client_kwargs = get_httpx_client_kwargs()
+    client = get_http_client(url)
 
-    async with httpx.AsyncClient(**client_kwargs) as client:
-        response = await client.post(url, params=params, data=data, json=json, headers=headers, timeout=timeout,
-                                     files=files)
-        return response
+    response = await client.post(url, params=params, data=data, json=json, headers=headers, timeout=timeout,
+                                 files=files)
+    return response
 
 
 async def async_put(url, data=None, json=None, headers=None, timeout=None, files=None, params=None):
-    client_kwargs = get_httpx_client_kwargs()
+    client = get_http_client(url)
 
-    async with httpx.AsyncClient(**client_kwargs) as client:
-        response = await client.put(url, params=params, data=data, json=json, headers=headers, timeout=timeout,
-                                    files=files)
-        return response
+    response = await client.put(url, params=params, data=data, json=json, headers=headers, timeout=timeout,
+                                files=files)
+    return response
 
 
 async def async_delete(url, headers=None, timeout=None, params=None):
-    client_kwargs = get_httpx_client_kwargs()
+    client = get_http_client(url)
 
-    async with httpx.AsyncClient(**client_kwargs) as client:
-        response = await client.delete(url, params=params, headers=headers, timeout=timeout)
-        return response
+    response = await client.delete(url, params=params, headers=headers, timeout=timeout)
+    return response
 
 
 async def async_get(url, params=None, headers=None, timeout=None):
-    client_kwargs = get_httpx_client_kwargs()
+    client = get_http_client(url)
+
+    response = await client.get(url, params=params, headers=headers, timeout=timeout)
+    return response
+
+
+@asynccontextmanager
+async def async_stream_post(url, data=None, json=None, headers=None, timeout=None, params=None):
+    """POST, тело ответа которого читается по мере поступления (SSE, большие файлы)"""
+    client = get_http_client(url)
+
+    async with client.stream("POST", url, params=params, data=data, json=json, headers=headers,
+                             timeout=timeout) as response:
+        yield response
+
+
+async def async_download(url, file_path, headers=None, timeout=None, chunk_size=64 * 1024) -> int:
+    """Скачать файл на диск по частям, не держа его целиком в памяти. Возвращает размер в байтах"""
+    client = get_http_client(url)
+    size = 0
+
+    async with client.stream("GET", url, headers=headers, timeout=timeout) as response:
+        response.raise_for_status()
+
+        with open(file_path, "wb") as file:
+            async for chunk in response.aiter_bytes(chunk_size):
+                file.write(chunk)
+                size += len(chunk)
+
+    return size
+
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Содержимое полей data: событий SSE по мере их прихода, до [DONE]"""
+    data_lines = []
+
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            value = line[len("data:"):]
+            data_lines.append(value[1:] if value.startswith(" ") else value)
+            continue
+
+        # Пустая строка завершает событие, остальные поля (event:, id:, комментарии) не нужны
+        if line or not data_lines:
+            continue
+
+        data = "\n".join(data_lines)
+        data_lines = []
+
+        if data == "[DONE]":
+            return
+
+        yield data
 
-    async with httpx.AsyncClient(**client_kwargs) as client:
-        response = await client.get(url, params=params, headers=headers, timeout=timeout)
-        return response
+    if data_lines and "\n".join(data_lines) != "[DONE]":
+        yield "\n".join(data_lines)
 
 
 def find_in_list(lst, element):
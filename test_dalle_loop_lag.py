@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Проверка, что генерация DALL·E не замораживает бота:
+пока GoAPI "рисует" картинку, короткие задачи в том же event loop (сообщения других
+пользователей) выполняются без заметной задержки.
+
+GoAPI подменяется локальным обработчиком httpx.MockTransport, который отвечает через DALLE_DELAY секунд.
+"""
+import asyncio
+import time
+
+import httpx
+
+from loop_lag_probe import measure
+from services import imageService
+from services.utils import set_http_client
+
+DALLE_DELAY = 2.0
+MAX_ALLOWED_LAG = 0.2
+
+IMAGE_URL = "https://files.oaiusercontent.com/file-test"
+
+
+async def goapi_handler(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(DALLE_DELAY)
+    return httpx.Response(200, json={
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4-gizmo-g-pmuQfob8d",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": f"Готово\n![image]({IMAGE_URL})"},
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30},
+    })
+
+
+def install_mock_hosts():
+    set_http_client("https://api.goapi.xyz", httpx.AsyncClient(transport=httpx.MockTransport(goapi_handler)))
+
+
+async def dalle_request():
+    image = await imageService.generate_dalle("dalle-loop-lag-test", "кот в космосе")
+    assert image["image"] == IMAGE_URL, image
+    print(f"  image: {image['image']}, tokens: {image['total_tokens']}")
+
+
+async def blocking_request():
+    """Как было раньше: синхронный клиент OpenAI внутри корутины"""
+    time.sleep(DALLE_DELAY)
+
+
+async def main():
+    install_mock_hosts()
+
+    blocking_lag = await measure("blocking OpenAI client", blocking_request)
+    async_lag = await measure("AsyncOpenAI client", dalle_request)
+
+    assert blocking_lag > MAX_ALLOWED_LAG, "the blocking baseline is expected to stall the loop"
+    assert async_lag < MAX_ALLOWED_LAG, f"DALL·E request delayed other users by {async_lag:.3f} s"
+    print("\nOK: other users are not delayed while DALL·E is generating")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Проверка, что генерация Suno не блокирует бота:
+пока идет генерация (лирика через OpenRouter, задача GoAPI, скачивание аудио),
+"сообщения других пользователей" - короткие задачи в том же event loop - обрабатываются без задержек.
+
+Внешние API подменяются локальными обработчиками httpx.MockTransport с реалистичными задержками.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from services import sunoService
+from services.task_tracker import taskTracker
+from loop_lag_probe import measure
+from services.utils import async_download, set_http_client
+
+LYRICS_DELAY = 2.0
+TASK_DURATION = 1.5
+AUDIO_SIZE = 8 * 1024 * 1024
+AUDIO_CHUNK_DELAY = 0.01
+MAX_ALLOWED_LAG = 0.2
+
+LYRICS = "[00:05.00]Первая строчка\n[00:10.00]Вторая строчка\n[00:15.00]Третья строчка"
+
+
+async def openrouter_handler(request: httpx.Request) -> httpx.Response:
+    await asyncio.sleep(LYRICS_DELAY)
+    return httpx.Response(200, json={"choices": [{"message": {"content": LYRICS}}]})
+
+
+async def goapi_handler(request: httpx.Request) -> httpx.Response:
+    task_id = "test-task"
+
+    if request.method == "POST":
+        completed = {"data": {"task_id": task_id, "status": "completed",
+                              "output": {"audio_url": "https://cdn.test/song.mp3"}}}
+        # Результат приходит "webhook-ом" через TASK_DURATION секунд
+        asyncio.get_running_loop().call_later(TASK_DURATION, taskTracker.resolve, task_id, completed)
+        return httpx.Response(200, json={"data": {"task_id": task_id, "status": "pending"}})
+
+    return httpx.Response(200, json={"data": {"task_id": task_id, "status": "processing"}})
+
+
+class SlowAudioStream(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        chunk = b"\0" * (256 * 1024)
+        for _ in range(AUDIO_SIZE // len(chunk)):
+            await asyncio.sleep(AUDIO_CHUNK_DELAY)
+            yield chunk
+
+
+async def cdn_handler(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, stream=SlowAudioStream())
+
+
+def install_mock_hosts():
+    for host, handler in (
+        ("https://openrouter.ai", openrouter_handler),
+        ("https://api.goapi.ai", goapi_handler),
+        ("https://cdn.test", cdn_handler),
+    ):
+        set_http_client(host, httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+async def suno_pipeline():
+    async def task_id_get(task_id: str):
+        print(f"  task created: {task_id}")
+
+    generation = await sunoService.generate_suno("тестовая песня", "pop", task_id_get)
+    audio_url = generation["data"]["output"]["audio_url"]
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
+        path = tmp_file.name
+
+    try:
+        size = await async_download(audio_url, path)
+        print(f"  downloaded {size} bytes")
+    finally:
+        os.remove(path)
+
+
+async def blocking_pipeline():
+    """Как было раньше: синхронный запрос к OpenRouter внутри корутины"""
+    time.sleep(LYRICS_DELAY)
+
+
+async def main():
+    install_mock_hosts()
+
+    blocking_lag = await measure("blocking requests.post", blocking_pipeline)
+    async_lag = await measure("async Suno pipeline", suno_pipeline)
+
+    taskTracker.stop()
+
+    assert blocking_lag > MAX_ALLOWED_LAG, "the blocking baseline is expected to stall the loop"
+    assert async_lag < MAX_ALLOWED_LAG, f"Suno generation delayed other users by {async_lag:.3f} s"
+    print("\nOK: other users are not delayed while a song is being generated")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())